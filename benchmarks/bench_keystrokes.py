@@ -0,0 +1,421 @@
+"""Replay keystroke traces against a marker script and measure key-to-push latency.
+
+Each target runs in its own process with a stub pylsl outlet and a stub
+pynput keyboard, so any version of the script can be measured the same way
+without a display or a real LSL network:
+
+    python benchmarks/bench_keystrokes.py new_marker_file.py old_versions/key_marker.py
+    python benchmarks/bench_keystrokes.py engine --keys 20000
+    python benchmarks/bench_keystrokes.py new_marker_file.py --trace markers_2026-10-17.journal
+    python benchmarks/bench_keystrokes.py --compare bench_results/*.json
+
+A target is a script with a main() that uses pynput, or "engine" to push
+keys through MarkerEngine as fast as possible (only markers_per_sec means
+much there).
+Latency is measured from the most recent key press before each push, so a
+single key that waited for a possible combo includes its wait.
+Startup is measured from loading the script to its first marker outlet
+(outlet_ms) and to its keyboard listener (keys_ms), with the stub modules,
+so it's the script's own startup without pylsl / pynput import time.
+
+Traces are CSV files of "t,key" (seconds from the start), marker journals
+(each marker's keys replayed at its recorded time), or synthetic typing
+made with --seed.
+"""
+
+import argparse
+import bisect
+import builtins
+import csv
+import importlib.util
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import types
+from datetime import datetime
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# the default keymap of new_marker_file.py
+SINGLE_KEYS = "xtabcdrpeu"
+COMBOS = ["si", "gm", "ss", "hs", "br", "qt", "cp", "ec", "cc", "im", "un"]
+
+
+# ---- traces ----
+
+def synthetic_trace(n_keys, seed=1):
+    """Typing a coder might do: single keys with pauses, quick combos and bursts."""
+    rng = random.Random(seed)
+    trace = []
+    t = 0.0
+    while len(trace) < n_keys:
+        roll = rng.random()
+        if roll < 0.15:
+            # burst of fast single keys, like catching up after a busy moment
+            for _ in range(rng.randint(3, 8)):
+                trace.append((t, rng.choice(SINGLE_KEYS)))
+                t += rng.uniform(0.04, 0.12)
+        elif roll < 0.55:
+            combo = rng.choice(COMBOS)
+            for key in combo:
+                trace.append((t, key))
+                t += rng.uniform(0.06, 0.18)
+        else:
+            trace.append((t, rng.choice(SINGLE_KEYS)))
+        t += rng.uniform(0.2, 1.2)  # pause before the next marker
+    return trace[:n_keys]
+
+
+def load_trace(path):
+    """Read a CSV (t,key) or a marker journal into a list of (t, key)."""
+    if path.endswith(".journal"):
+        sys.path.insert(0, REPO)
+        from marker_journal import read_journal
+        records, _ = read_journal(path)
+        records = [r for r in records if r.key]
+        if not records:
+            return []
+        start = records[0].timestamp
+        trace = []
+        for record in records:
+            for i, key in enumerate(record.key):
+                trace.append((record.timestamp - start + i * 0.1, key))
+        trace.sort()
+        return trace
+    with open(path, newline="") as f:
+        return [(float(row[0]), row[1]) for row in csv.reader(f)
+                if row and not row[0].startswith("#") and row[0] != "t"]
+
+
+# ---- stubs for pylsl and pynput ----
+
+class StubOutlet:
+    """Records when each sample reaches the outlet."""
+
+    def __init__(self, *args, **kwargs):
+        self.pushes = []  # (perf_counter, marker)
+        self.lock = threading.Lock()
+
+    def push_sample(self, sample, timestamp=0.0, pushthrough=True):
+        now = time.perf_counter()
+        with self.lock:
+            self.pushes.append((now, sample[0]))
+
+    def push_chunk(self, samples, timestamp=0.0, pushthrough=True):
+        now = time.perf_counter()
+        with self.lock:
+            # a flat list of strings or a list of one-value samples
+            self.pushes.extend((now, sample if isinstance(sample, str) else sample[0])
+                               for sample in samples)
+
+    def have_consumers(self):
+        return True
+
+    def wait_for_consumers(self, timeout):
+        return True
+
+
+class _SpecialKey:
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return f"Key.{self.name}"
+
+
+class _KeyCode:
+    def __init__(self, char):
+        self.char = char
+
+    def __repr__(self):
+        return repr(self.char)
+
+
+class _Listener:
+    instances = []
+
+    def __init__(self, on_press=None, on_release=None, **kwargs):
+        self.on_press = on_press
+        self.on_release = on_release
+        self.stopped = threading.Event()
+        _Listener.instances.append(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def start(self):
+        pass
+
+    def stop(self):
+        self.stopped.set()
+
+    def join(self, timeout=None):
+        self.stopped.wait(timeout)
+
+
+class _StubInfo:
+    def __init__(self, *args, **kwargs):
+        self.type = kwargs.get("type", args[1] if len(args) > 1 else None)
+
+    def desc(self):
+        return self
+
+    def append_child_value(self, name, value):
+        return self
+
+
+def install_stubs(outlet, ready=None):
+    pylsl = types.ModuleType("pylsl")
+    pylsl.StreamInfo = _StubInfo
+
+    # marker streams all record into `outlet`, side streams (telemetry) get their own
+    def stream_outlet(info, *args, **kwargs):
+        if info.type == "Telemetry":
+            return StubOutlet()
+        if ready is not None:
+            ready.setdefault("outlet", time.perf_counter())
+        return outlet
+
+    pylsl.StreamOutlet = stream_outlet
+    pylsl.local_clock = time.perf_counter
+    pylsl.cf_string = 3
+
+    keyboard = types.ModuleType("pynput.keyboard")
+    keyboard.Key = types.SimpleNamespace(**{name: _SpecialKey(name) for name in (
+        "esc", "f1", "f2", "f3", "f4", "shift", "shift_l", "shift_r", "ctrl", "ctrl_l", "ctrl_r",
+        "alt", "alt_l", "alt_r", "alt_gr", "tab", "enter")})
+    keyboard.KeyCode = _KeyCode
+    keyboard.Listener = _Listener
+    pynput = types.ModuleType("pynput")
+    pynput.keyboard = keyboard
+
+    sys.modules.update({"pylsl": pylsl, "pynput": pynput, "pynput.keyboard": keyboard})
+    builtins.input = lambda *args: "bench"  # answer activity name / note prompts
+    return keyboard
+
+
+# ---- running one target (in a child process) ----
+
+def _count_thread_starts():
+    counter = {"started": 0}
+    original = threading.Thread.start
+
+    def start(self, *args, **kwargs):
+        counter["started"] += 1
+        return original(self, *args, **kwargs)
+
+    threading.Thread.start = start
+    return counter
+
+
+def _sample_threads(stop, peak):
+    while not stop.is_set():
+        peak[0] = max(peak[0], threading.active_count())
+        time.sleep(0.002)
+
+
+def run_script(path, trace, settle):
+    """Run a pynput script's main() and type the trace into it in real time."""
+    outlet = StubOutlet()
+    ready = {}
+    keyboard = install_stubs(outlet, ready)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(path)))
+    loaded = time.perf_counter()
+    spec = importlib.util.spec_from_file_location("bench_target", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+    runner = threading.Thread(target=module.main, daemon=True)
+    runner.start()
+    while not _Listener.instances:
+        if not runner.is_alive():
+            raise SystemExit(f"{path} stopped before it started listening for keys")
+        time.sleep(0.0002)
+    ready["keys"] = time.perf_counter()
+    listener = _Listener.instances[-1]
+    startup = {name: round((t - loaded) * 1000, 3) for name, t in ready.items()}
+
+    presses = []
+    start = time.perf_counter()
+    for t, key in trace:
+        delay = start + t - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        code = _KeyCode(key)
+        presses.append(time.perf_counter())
+        if listener.on_press(code) is False:
+            break
+        if listener.on_release and listener.on_release(code) is False:
+            break
+    time.sleep(settle)  # let waiting single keys and timeouts finish
+    if listener.on_release:
+        listener.on_release(keyboard.Key.esc)
+    listener.stop()
+    runner.join(5)
+    return presses, outlet.pushes, startup
+
+
+def run_engine(trace):
+    """Feed the trace through MarkerEngine as fast as possible."""
+    sys.path.insert(0, REPO)
+    from marker_engine import MarkerEngine
+
+    outlet = StubOutlet()
+    markers = {key: [f"M_{key}"] for key in SINGLE_KEYS if key != "u"}
+    markers["u"] = ["UNDO"]
+    combos = {combo: [f"M_{combo}"] for combo in COMBOS if combo != "un"}
+    combos["un"] = ["UNDO"]
+    engine = MarkerEngine(outlet, markers, combos, clock=time.perf_counter,
+                          block=True, queue_size=4096, log=None)
+    engine.start()
+    presses = []
+    base = time.perf_counter()
+    for t, key in trace:
+        now = time.perf_counter()
+        presses.append(now)
+        # keep the trace's spacing on the engine clock so combos still decode
+        engine.feed(key, base + t)
+    engine.flush()
+    engine.stop()
+    return presses, outlet.pushes, {}
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(p / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def measure(target, trace, settle):
+    counter = _count_thread_starts()
+    peak_threads = [threading.active_count()]
+    stop = threading.Event()
+    sampler = threading.Thread(target=_sample_threads, args=(stop, peak_threads), daemon=True)
+    sampler.start()
+    tracemalloc.start()
+
+    if target == "engine":
+        presses, pushes, startup = run_engine(trace)
+    else:
+        presses, pushes, startup = run_script(target, trace, settle)
+
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    stop.set()
+    sampler.join()
+
+    latencies = []
+    for pushed_at, _ in pushes:
+        i = bisect.bisect_right(presses, pushed_at) - 1
+        if i >= 0:
+            latencies.append(pushed_at - presses[i])
+    elapsed = (pushes[-1][0] - presses[0]) if pushes and presses else 0.0
+    ms = [latency * 1000 for latency in latencies]
+    return {
+        "target": target,
+        "keys": len(presses),
+        "markers": len(pushes),
+        "latency_ms": {
+            "p50": round(percentile(ms, 50), 3),
+            "p99": round(percentile(ms, 99), 3),
+            "max": round(max(ms), 3) if ms else 0.0,
+            "mean": round(sum(ms) / len(ms), 3) if ms else 0.0,
+        },
+        "markers_per_sec": round(len(pushes) / elapsed, 1) if elapsed > 0 else 0.0,
+        "threads_peak": peak_threads[0],
+        "threads_started": counter["started"] - 1,  # minus the sampler
+        "peak_memory_kb": round(peak_memory / 1024, 1),
+        "startup_ms": startup,
+    }
+
+
+# ---- command line ----
+
+def compare(paths):
+    results = []
+    for path in paths:
+        with open(path) as f:
+            results.append(json.load(f))
+    print(f"{'target':<32}{'keys':>7}{'markers':>9}{'p50 ms':>9}{'p99 ms':>9}"
+          f"{'max ms':>9}{'mk/s':>10}{'thr pk':>8}{'thr new':>8}{'mem kB':>9}{'ready ms':>10}")
+    for r in results:
+        lat = r["latency_ms"]
+        print(f"{os.path.basename(r['target']):<32}{r['keys']:>7}{r['markers']:>9}"
+              f"{lat['p50']:>9.2f}{lat['p99']:>9.2f}{lat['max']:>9.2f}"
+              f"{r['markers_per_sec']:>10.1f}{r['threads_peak']:>8}{r['threads_started']:>8}"
+              f"{r['peak_memory_kb']:>9.1f}{r.get('startup_ms', {}).get('keys', 0.0):>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("targets", nargs="*", help="marker scripts to run, or 'engine'")
+    parser.add_argument("--trace", help="CSV (t,key) or .journal to replay, default is synthetic")
+    parser.add_argument("--keys", type=int, default=200, help="synthetic trace length")
+    parser.add_argument("--seed", type=int, default=1, help="synthetic trace seed")
+    parser.add_argument("--settle", type=float, default=1.5,
+                        help="seconds to wait after the last key for timers to finish")
+    parser.add_argument("--out", default="bench_results",
+                        help="folder for the JSON results, one file per target")
+    parser.add_argument("--compare", nargs="+", metavar="JSON", help="print a table of saved results")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(args.compare)
+        return
+
+    trace = load_trace(args.trace) if args.trace else synthetic_trace(args.keys, args.seed)
+
+    if args.child:
+        # inside the child process: run one target, results go to --out
+        real_stdout = sys.stdout
+        sys.stdout = open(os.devnull, "w")  # the scripts print a lot, like a piped console
+        try:
+            result = measure(args.child, trace, args.settle)
+        finally:
+            sys.stdout = real_stdout
+        result["trace"] = {"source": args.trace or f"synthetic seed={args.seed}",
+                           "keys": len(trace), "duration_s": round(trace[-1][0], 3) if trace else 0}
+        result["python"] = platform.python_version()
+        result["date"] = datetime.now().isoformat(timespec="seconds")
+        with open(args.out, "w") as f:
+            json.dump(result, f, indent=2)
+        return
+
+    if not args.targets:
+        parser.error("give at least one target, or --compare")
+    os.makedirs(args.out, exist_ok=True)
+    saved = []
+    for target in args.targets:
+        if target != "engine":
+            target = os.path.abspath(target)
+        name = os.path.splitext(os.path.basename(target))[0]
+        out = os.path.abspath(os.path.join(args.out, f"{name}.json"))
+        command = [sys.executable, os.path.abspath(__file__), "--child", target, "--out", out,
+                   "--keys", str(args.keys), "--seed", str(args.seed), "--settle", str(args.settle)]
+        if args.trace:
+            command += ["--trace", os.path.abspath(args.trace)]
+        with tempfile.TemporaryDirectory() as tmp:
+            # keep the scripts' journals and logs out of the working folder
+            env = dict(os.environ, MARKER_JOURNAL=os.path.join(tmp, "bench.journal"),
+                       MARKER_LOG=os.path.join(tmp, "bench.log"))
+            print(f"Running {target} ...", flush=True)
+            subprocess.run(command, check=True, env=env, cwd=tmp)
+        saved.append(out)
+    compare(saved)
+
+
+if __name__ == "__main__":
+    main()
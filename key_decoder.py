@@ -0,0 +1,284 @@
+"""Prefix-trie decoder for single key markers and key combos.
+
+The trie is built once from the marker dicts, so every key press is one dict
+lookup no matter how many combos there are or how long they are.
+A marker is sent as soon as the typed keys can't lead anywhere else, and
+only keys that are also the start of a longer combo have to wait.
+
+Chords (keys held down together, like a+s or shift+c) are decided by
+ChordDecoder from which keys are down, in front of the trie.
+"""
+
+
+class KeyTrie:
+    """Compiled prefix tree mapping key sequences to markers."""
+
+    __slots__ = ('children', 'terminal')
+
+    def __init__(self, *keymaps):
+        self.children = [{}]    # node -> {key: child node}, node 0 is the root
+        self.terminal = [None]  # node -> (keys, marker) if a marker ends here
+        for keymap in keymaps:
+            for keys, marker in keymap.items():
+                self.add(keys, marker)
+
+    def add(self, keys, marker):
+        """Add one key sequence (any length) and the marker it sends."""
+        if not keys:
+            raise ValueError("key sequence can't be empty")
+        node = 0
+        for key in keys:
+            child = self.children[node].get(key)
+            if child is None:
+                child = len(self.children)
+                self.children[node][key] = child
+                self.children.append({})
+                self.terminal.append(None)
+            node = child
+        self.terminal[node] = (keys, marker)
+
+
+class KeyDecoder:
+    """Walks the trie one key at a time and reports finished markers.
+
+    feed() and expire() return a list of (keys, marker, press_time, route)
+    tuples to send, where press_time is when the first key of the marker was
+    pressed, so a marker that waited for a possible combo keeps its real time.
+    route is whatever was passed to feed() with the marker's keys (the first
+    one that isn't None), e.g. which outlet a modifier key picked.
+    marker is whatever the trie was built with (a MarkerDef for a Keymap).
+    While a sequence is unfinished, `deadline` says when expire() should
+    be called so a waiting single key still gets sent.
+    """
+
+    def __init__(self, trie, ambiguity_window=0.3, sequence_timeout=1.0,
+                 ambiguity_windows=None):
+        self.trie = trie
+        self.ambiguity_window = ambiguity_window  # wait for a longer combo
+        # per key overrides of ambiguity_window, e.g. {'c': 0.2}
+        self.ambiguity_windows = dict(ambiguity_windows or {})
+        self.sequence_timeout = sequence_timeout  # forget an unfinished prefix
+        self.reset()
+
+    def reset(self):
+        """Forget any keys typed so far."""
+        self.node = 0
+        self.keys = []         # (key, time, route) typed since the root
+        self.fallback = None   # longest complete marker on the current path
+        self.fallback_len = 0
+        self.deadline = None
+
+    @property
+    def pending(self):
+        """True if a complete marker is waiting to see if a longer combo follows."""
+        return self.fallback is not None
+
+    def feed(self, key, now, route=None):
+        """Advance on one key press."""
+        sent = self.expire(now)
+        child = self.trie.children[self.node].get(key)
+        if child is None:
+            if self.node == 0:
+                return sent  # key isn't mapped to anything
+            # the current sequence can't continue with this key
+            sent.extend(self._flush())
+            return sent + self.feed(key, now, route)
+
+        self.node = child
+        self.keys.append((key, now, route))
+        if self.trie.terminal[child] is not None:
+            self.fallback = self.trie.terminal[child]
+            self.fallback_len = len(self.keys)
+
+        if not self.trie.children[child]:
+            # nothing longer starts with these keys, send right away
+            sent.extend(self._flush())
+        elif self.pending:
+            keys = self.fallback[0]
+            self.deadline = now + self.ambiguity_windows.get(keys, self.ambiguity_window)
+        else:
+            self.deadline = now + self.sequence_timeout
+        return sent
+
+    def expire(self, now):
+        """Send or drop the current sequence if its deadline has passed."""
+        sent = []
+        while self.deadline is not None and now >= self.deadline:
+            sent.extend(self._flush())
+        return sent
+
+    def flush(self):
+        """Send the waiting marker now without waiting for its deadline."""
+        if self.node == 0:
+            return []
+        return self._flush()
+
+    def _flush(self):
+        """Send the longest complete marker and replay the keys after it."""
+        fallback, used, keys = self.fallback, self.fallback_len, self.keys
+        self.reset()
+        if fallback is None:
+            return []  # unfinished prefix with no marker, forget it
+        keys_sent, marker = fallback
+        route = next((r for _, _, r in keys[:used] if r is not None), None)
+        sent = [(keys_sent, marker, keys[0][1], route)]
+        for key, t, r in keys[used:]:
+            sent.extend(self.feed(key, t, r))
+        return sent
+
+
+LETTER_BITS = {c: 1 << i for i, c in enumerate("abcdefghijklmnopqrstuvwxyz")}
+SHIFT = 1 << 26
+MODIFIERS = {"shift": SHIFT}
+
+
+def chord_mask(keys):
+    """Bitset for a chord written like 'a+s' or 'shift+c'. Raises ValueError if it isn't one."""
+    parts = keys.split("+")
+    if len(parts) < 2:
+        raise ValueError(f"chord '{keys}' needs at least two keys, like 'a+s' or 'shift+c'")
+    mask = 0
+    for part in parts:
+        bit = LETTER_BITS.get(part) or MODIFIERS.get(part)
+        if bit is None:
+            raise ValueError(f"'{part}' in chord '{keys}' isn't a lowercase letter or shift")
+        if mask & bit:
+            raise ValueError(f"'{part}' is in chord '{keys}' twice")
+        mask |= bit
+    if not mask & ~SHIFT:
+        raise ValueError(f"chord '{keys}' needs a letter")
+    return mask
+
+
+class ChordTable:
+    """Compiled chords: bitsets of keys held down together mapped to markers."""
+
+    __slots__ = ('chords', 'partial', 'waiting', 'shift')
+
+    def __init__(self, chords):
+        self.chords = {}       # mask -> (keys, marker)
+        self.partial = set()   # masks that more keys down could still turn into a chord
+        self.waiting = 0       # letters in a chord with another letter
+        self.shift = False     # any chord with shift, else SHIFT keeps sending to all outlets
+        for keys, marker in chords.items():
+            mask = chord_mask(keys)
+            if mask in self.chords:
+                raise ValueError(f"chords '{keys}' and '{self.chords[mask][0]}' are the same keys")
+            self.chords[mask] = (keys, marker)
+            letters = mask & ~SHIFT
+            if letters & (letters - 1):
+                self.waiting |= letters
+            self.shift |= bool(mask & SHIFT)
+            sub = (mask - 1) & mask
+            while sub:
+                self.partial.add(sub)
+                sub = (sub - 1) & mask
+
+
+class ChordDecoder:
+    """Fires chords from which keys are down, with no timing windows.
+
+    press() and release() return (keys, marker, press_time, route) tuples
+    like KeyDecoder, where marker is None for a key that turned out not to
+    be part of a chord and goes on to the KeyDecoder as a normal press.
+
+    A letter that is in a chord with another letter isn't decided when it
+    goes down. The chord fires as soon as all its keys are down, or, if more
+    keys could still make a bigger chord, when the first of them is let go.
+    A letter let go without making a chord is a normal key press, with the
+    time it went down. Pressing a key that can't join the keys held down
+    decides those first, so fast typing (one key still down as the next goes
+    down) isn't mistaken for a chord. Chords with shift fire right away when
+    the letter goes down with shift held.
+
+    It needs key releases (pynput or evdev). A key that is never let go
+    counts as a normal press after hold_timeout seconds, see `deadline`.
+    """
+
+    def __init__(self, table, hold_timeout=1.0):
+        self.table = table
+        self.hold_timeout = hold_timeout
+        self.reset()
+
+    def reset(self):
+        """Forget the keys held down."""
+        self.held = 0     # letters down and not decided yet
+        self.used = 0     # letters of a fired chord, ignored until let go
+        self.keys = []    # (key, bit, time, route) for the held letters, in press order
+        self.best = None  # chord the held keys make while a bigger one is possible
+
+    @property
+    def deadline(self):
+        return self.keys[0][2] + self.hold_timeout if self.keys else None
+
+    def press(self, key, now, route=None, shift=False):
+        table = self.table
+        bit = LETTER_BITS.get(key, 0)
+        mods = SHIFT if shift and table.shift else 0
+        sent = self.expire(now)
+        self.used &= ~bit  # pressed again, so it was let go (repeats are filtered out before)
+        if not bit & table.waiting:
+            sent.extend(self._decide())  # keys still down were typed before this one
+            hit = table.chords.get(bit | mods)
+            sent.append((hit[0], hit[1], now, None) if hit else (key, None, now, route))
+            return sent
+        if bit & self.held:
+            return sent
+
+        mask = self.held | bit | mods
+        if mask not in table.chords and mask not in table.partial:
+            sent.extend(self._decide())
+            mask = bit | mods
+        self.held |= bit
+        self.keys.append((key, bit, now, route))
+        hit = table.chords.get(mask)
+        if hit is not None:
+            if mask in table.partial:
+                self.best = mask  # wait, a bigger chord may still come
+            else:
+                sent.append(self._fire(mask))
+        return sent
+
+    def release(self, key, now):
+        bit = LETTER_BITS.get(key, 0)
+        if bit & self.used:
+            self.used &= ~bit
+            return []
+        if not bit & self.held:
+            return []
+        sent = self._decide()
+        self.used &= ~bit
+        return sent
+
+    def expire(self, now):
+        """Decide keys held longer than hold_timeout (or whose release never came)."""
+        if not self.keys or now < self.keys[0][2] + self.hold_timeout:
+            return []
+        return self._decide(used=False)
+
+    def flush(self):
+        """Decide the keys held down right now."""
+        return self._decide(used=False)
+
+    def _decide(self, used=True):
+        # the best chord found, then the rest as normal key presses
+        sent = [self._fire(self.best)] if self.best is not None else []
+        sent.extend((key, None, t, route) for key, _, t, route in self.keys)
+        if used:
+            self.used |= self.held
+        self.held = 0
+        self.keys = []
+        return sent
+
+    def _fire(self, mask):
+        keys_sent, marker = self.table.chords[mask]
+        letters = mask & ~SHIFT
+        members = [k for k in self.keys if k[1] & letters]
+        # shift in the chord is part of it, not "send to every outlet"
+        route = None if mask & SHIFT else next((r for *_, r in members if r is not None), None)
+        press_time = members[0][2] if members else None
+        self.keys = [k for k in self.keys if not k[1] & letters]
+        self.held &= ~letters
+        self.used |= letters
+        self.best = None
+        return (keys_sent, marker, press_time, route)
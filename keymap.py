@@ -0,0 +1,306 @@
+"""Load the keymap file and compile it into the tables the engine uses.
+
+The keymap is a JSON (or TOML) file like keymap.json:
+
+    {
+      "sequence_timeout": 1.0,
+      "ambiguity_window": 0.3,
+      "ambiguity_windows": {"c": 0.2},
+      "markers": {"x": {"marker": "Test", "help": "test marker"}},
+      "combos":  {"cc": {"marker": "ClosingCircle", "help": "closing circle"},
+                  "gmx": "SomeActivity"},
+      "chords":  {"a+s": "Arguing", "shift+c": "LoudClapping"},
+      "min_interval": 0.2,
+      "outlets": {"main":   {"name": "DataSyncMarker", "source_id": "12345"},
+                  "groupB": {"name": "DataSyncMarker_B", "source_id": "lsl-marker-groupB"}}
+    }
+
+An entry can be just the marker name, then the help line shows the name.
+An entry can also say which outlet it goes to with "outlet": "groupB", or
+"outlet": "all" for every outlet. Without it, markers go to the first outlet.
+"min_interval" and "rate_limit" (see marker_limits.py) at the top apply to
+every entry, and an entry can set its own.
+"chords" are keys held down at the same time (see key_decoder.ChordDecoder),
+sent without any wait. Only keymaps that have them use chord mode, and only
+chords with "shift" take SHIFT+letter away from sending to every outlet.
+Compiling builds the key trie, the help text and a MarkerDef for every
+entry once, so reloading the file while the script runs is a single swap
+and sending a marker doesn't build any strings or look anything up.
+The checked file contents are cached in __pycache__ next to the keymap, so
+at startup it isn't parsed again (and json isn't even imported) until it changes.
+"""
+
+import marshal
+import os
+import sys
+
+from key_decoder import ChordTable, KeyTrie, chord_mask
+from marker_dispatch import ALL
+from marker_limits import parse_limits
+
+# the stream the script has always made, used when a keymap has no "outlets"
+DEFAULT_OUTLETS = {"main": {"name": "DataSyncMarker", "type": "Tags", "source_id": "12345"}}
+
+# what a marker does when its keys are typed
+SEND = 0     # push it and keep it in history
+UNDO = 1     # undo the newest marker
+REDO = 2     # redo the newest undo
+PROMPT = 3   # push it, then ask for a note (NewActivity, InterestingMoment)
+
+PROMPT_MARKERS = ("NewActivity", "InterestingMoment")
+
+CACHE_VERSION = 1  # bump when what load_keymap reads from the file changes
+
+
+class MarkerDef:
+    """Everything the send path needs for one marker, worked out once.
+
+    recordable is False for UNDO.../CANCEL.../REDO... names, which are sent
+    as they are and never get an ID or a history entry. min_interval, rate
+    and burst limit how often it can be typed (0 = no limit).
+    """
+
+    __slots__ = ('keys', 'name', 'action', 'recordable', 'target',
+                 'description', 'id_prefix', 'min_interval', 'rate', 'burst', 'limited')
+
+    def __init__(self, keys, name, target=None, min_interval=0.0, rate=0.0, burst=1.0):
+        name = sys.intern(name)
+        self.keys = keys
+        self.name = name
+        if name == "UNDO":
+            self.action = UNDO
+        elif name == "REDO":
+            self.action = REDO
+        elif name in PROMPT_MARKERS:
+            self.action = PROMPT
+        else:
+            self.action = SEND
+        self.recordable = not name.startswith(("UNDO", "CANCEL", "REDO"))
+        self.target = target  # outlet name, None for the default one
+        if not keys:
+            self.description = ""
+        elif len(keys) == 1:
+            self.description = f"(key: {keys})"
+        else:
+            self.description = f"(keys: {keys})"
+        self.id_prefix = name + "#"
+        self.min_interval = min_interval
+        self.rate = rate
+        self.burst = burst
+        self.limited = bool(min_interval or rate)
+
+    def __setattr__(self, attr, value):
+        if hasattr(self, attr):
+            raise AttributeError(f"MarkerDef.{attr} can't be changed")
+        object.__setattr__(self, attr, value)
+
+    def __repr__(self):
+        return f"MarkerDef({self.keys!r}, {self.name!r})"
+
+
+class Keymap:
+    """A compiled keymap."""
+
+    __slots__ = ('path', 'markers', 'combos', 'chords', 'routes', 'outlets', 'limits', 'help',
+                 'trie', 'chord_table', 'defs', 'sequence_timeout', 'ambiguity_window',
+                 'ambiguity_windows')
+
+    def __init__(self, markers, combos, help_lines=None, sequence_timeout=1.0,
+                 ambiguity_window=0.3, ambiguity_windows=None, path=None,
+                 routes=None, outlets=None, limits=None, chords=None):
+        self.path = path
+        self.markers = markers  # key -> [marker]
+        self.combos = combos    # keys -> [marker]
+        self.chords = dict(chords or {})  # "a+s" -> [marker]
+        self.routes = dict(routes or {})  # keys -> outlet name, only if not the default
+        self.outlets = dict(outlets or DEFAULT_OUTLETS)  # outlet name -> stream settings
+        self.limits = dict(limits or {})  # keys -> (min_interval, rate, burst), only if limited
+        self.sequence_timeout = sequence_timeout
+        self.ambiguity_window = ambiguity_window
+        self.ambiguity_windows = dict(ambiguity_windows or {})
+        # keys -> MarkerDef, the trie hands these straight to the engine
+        self.defs = {keys: MarkerDef(keys, marker[0], self.routes.get(keys),
+                                     *self.limits.get(keys, ()))
+                     for table in (markers, combos, self.chords) for keys, marker in table.items()}
+        self.trie = KeyTrie({keys: self.defs[keys] for table in (markers, combos) for keys in table})
+        self.chord_table = ChordTable({keys: self.defs[keys] for keys in self.chords}) if self.chords else None
+        self.help = help_text(markers, combos, help_lines or {}, self.routes, self.outlets, self.chords)
+
+
+def help_text(markers, combos, help_lines, routes=None, outlets=None, chords=None):
+    """The controls menu printed at startup."""
+    routes = routes or {}
+
+    def line(keys, marker):
+        text = f"{keys} - {help_lines.get(keys, marker[0])}"
+        if keys in routes:
+            text += f" [{routes[keys]}]"
+        return text
+
+    lines = ["Single Key Controls:"]
+    lines += [line(keys, marker) for keys, marker in markers.items()]
+    lines += ["", "Key Combinations:"]
+    lines += [line(keys, marker) for keys, marker in combos.items()]
+    if chords:
+        lines += ["", "Chords (hold down together):"]
+        lines += [line(keys, marker) for keys, marker in chords.items()]
+    lines += ["", "Special Commands:", "F1 - show marker history", "F2 - undo a marker by its #number"]
+    if outlets and len(outlets) > 1:
+        lines.append(f"SHIFT+key - send to all outlets ({', '.join(outlets)})")
+    lines.append("ESC - quit")
+    return "\n".join(lines)
+
+
+def _read(path):
+    if path.endswith(".toml"):
+        import tomllib  # Python 3.11+
+        with open(path, "rb") as f:
+            return tomllib.load(f)
+    import json
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _cache_path(path):
+    folder, name = os.path.split(os.path.abspath(path))
+    return os.path.join(folder, "__pycache__", f"{name}.{CACHE_VERSION}.marshal")
+
+
+def _read_cached(path):
+    """(parsed file or None if the cache isn't current, the file's stamp)."""
+    st = os.stat(path)
+    stamp = (st.st_mtime_ns, st.st_size)
+    try:
+        with open(_cache_path(path), "rb") as f:
+            cached_stamp, data = marshal.load(f)
+        if tuple(cached_stamp) == stamp:
+            return data, stamp
+    except (OSError, EOFError, ValueError, TypeError):
+        pass  # no cache yet, or from another Python version
+    return None, stamp
+
+
+def _write_cache(path, stamp, data):
+    cache = _cache_path(path)
+    tmp = f"{cache}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(cache), exist_ok=True)
+        with open(tmp, "wb") as f:
+            marshal.dump((stamp, data), f)
+        os.replace(tmp, cache)
+    except (OSError, ValueError):
+        # read-only folder, or TOML dates marshal can't store: just no cache
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+
+
+def _entries(section, table, help_lines, routes, outlets, limits, default_limits):
+    compiled = {}
+    for keys, entry in (table or {}).items():
+        if section == "chords":
+            try:
+                chord_mask(keys)
+            except ValueError as e:
+                raise ValueError(f"chords: {e}") from e
+        elif not keys or not keys.isalpha() or keys != keys.lower():
+            raise ValueError(f"{section}: '{keys}' must be lowercase letters")
+        if isinstance(entry, str):
+            entry = {"marker": entry}
+        marker = entry.get("marker")
+        if not isinstance(marker, str) or not marker:
+            raise ValueError(f"{section}: '{keys}' needs a marker name")
+        compiled[keys] = [marker]
+        outlet = entry.get("outlet")
+        if outlet:
+            if outlet != ALL and outlet not in outlets:
+                raise ValueError(f"{section}: '{keys}' goes to unknown outlet '{outlet}'")
+            routes[keys] = outlet
+        if entry.get("help"):
+            help_lines[keys] = entry["help"]
+        limit = parse_limits(entry, f"{section}: '{keys}'", default_limits)
+        if limit[0] or limit[1]:
+            limits[keys] = limit
+    return compiled
+
+
+def load_keymap(path, cache=True):
+    """Read and compile a keymap file. Raises ValueError if it isn't valid."""
+    data = stamp = None
+    try:
+        if cache:
+            data, stamp = _read_cached(path)
+        cached = data is not None
+        if not cached:
+            data = _read(path)
+    except (OSError, ValueError) as e:
+        raise ValueError(f"can't read keymap {path}: {e}") from e
+
+    outlets = _outlets(data.get("outlets"))
+    help_lines = {}
+    routes = {}
+    limits = {}
+    default_limits = parse_limits(data, "keymap")
+    markers = _entries("markers", data.get("markers"), help_lines, routes, outlets,
+                       limits, default_limits)
+    combos = _entries("combos", data.get("combos"), help_lines, routes, outlets,
+                      limits, default_limits)
+    chords = _entries("chords", data.get("chords"), help_lines, routes, outlets,
+                      limits, default_limits)
+    both = set(markers) & set(combos)
+    if both:
+        raise ValueError(f"keys in both markers and combos: {', '.join(sorted(both))}")
+    if not markers and not combos and not chords:
+        raise ValueError(f"keymap {path} has no markers")
+    keymap = Keymap(markers, combos, help_lines,
+                    sequence_timeout=float(data.get("sequence_timeout", 1.0)),
+                    ambiguity_window=float(data.get("ambiguity_window", 0.3)),
+                    ambiguity_windows={k: float(v) for k, v in
+                                       data.get("ambiguity_windows", {}).items()},
+                    path=path, routes=routes, outlets=outlets, limits=limits, chords=chords)
+    if cache and not cached:
+        _write_cache(path, stamp, data)  # only keymaps that compiled
+    return keymap
+
+
+def _outlets(table):
+    """Check the outlets section, every stream needs its own name and source_id."""
+    if not table:
+        return dict(DEFAULT_OUTLETS)
+    outlets = {}
+    for label, stream in table.items():
+        if label == ALL:
+            raise ValueError(f"outlets: '{ALL}' is reserved for sending to every outlet")
+        if not stream.get("name") or not stream.get("source_id"):
+            raise ValueError(f"outlets: '{label}' needs a name and a source_id")
+        outlets[label] = {"name": stream["name"], "type": stream.get("type", "Tags"),
+                          "source_id": str(stream["source_id"])}
+    for field in ("name", "source_id"):
+        values = [stream[field] for stream in outlets.values()]
+        if len(set(values)) != len(values):
+            raise ValueError(f"outlets: every outlet needs a different {field}")
+    return outlets
+
+
+class KeymapWatcher:
+    """Notices when the keymap file changes. Call changed() now and then."""
+
+    def __init__(self, path):
+        self.path = path
+        self._stamp = self._stat()
+
+    def _stat(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def changed(self):
+        """True once for every change to the file since the last call."""
+        stamp = self._stat()
+        if stamp is None or stamp == self._stamp:
+            return False
+        self._stamp = stamp
+        return True
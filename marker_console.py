@@ -0,0 +1,186 @@
+"""Console and log output from a background thread.
+
+Key handling never prints: it hands lines to a ConsoleWriter, which keeps
+them in a bounded ring and writes whatever has piled up in one go, at most
+every `interval` seconds. A burst of markers is one terminal write, a slow
+terminal, SSH session or pipe only ever slows this thread, and if output
+can't keep up the oldest lines are dropped (and counted) instead of
+anything waiting.
+
+On a terminal the bottom line is a live status line (last marker, undo
+depth, queue depth, ...) redrawn in place. Every line also goes to a
+rotating log file, stamped with when it was written by the caller.
+"""
+
+import collections
+import logging
+import logging.handlers
+import shutil
+import sys
+import threading
+import time
+
+INFO = logging.INFO
+WARNING = logging.WARNING
+
+_CLEAR_LINE = "\r\x1b[K"
+
+
+class ConsoleWriter:
+    """Bounded, coalescing console output with an optional status line.
+
+    write() is print()-like and safe to call from any thread.
+    status is a callable returning the status line text; it is called from
+    the writer thread, so it should only read simple values.
+    pause() holds console output (e.g. while input() is waiting for an
+    answer) and resume() lets it out again; the log file is still written.
+    """
+
+    def __init__(self, stream=None, capacity=512, interval=0.05, status=None,
+                 status_interval=0.5, log_path=None, log_bytes=1_000_000, log_backups=5):
+        self.stream = stream or sys.stdout
+        self.interval = interval  # how long a burst gets to collect
+        self.status = status
+        self.status_interval = status_interval  # status refresh when nothing is written
+        try:
+            self.tty = self.stream.isatty()
+        except (AttributeError, ValueError):
+            self.tty = False
+        self.log = None
+        if log_path:
+            self.log = logging.handlers.RotatingFileHandler(
+                log_path, maxBytes=log_bytes, backupCount=log_backups, encoding="utf-8")
+            self.log.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s"))
+
+        self.written = 0   # lines written to the console
+        self.dropped = 0   # lines lost because the ring was full
+
+        self._lines = collections.deque()
+        self._capacity = capacity
+        self._held = collections.deque(maxlen=capacity)  # console lines held while paused
+        self._lock = threading.Lock()      # guards _lines and dropped
+        self._out_lock = threading.Lock()  # one writer to the stream at a time
+        self._wake = threading.Event()
+        self._paused = False
+        self._closing = False
+        self._shown = ""  # status line currently on screen
+        self._reported = 0  # dropped lines already counted in _skipped
+        self._skipped = 0   # lines lost since the console last said so
+        self._thread = threading.Thread(target=self._run, name="marker-console", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def write(self, *parts, level=INFO):
+        """Queue one line (parts joined with spaces, like print). Never blocks on output."""
+        text = " ".join(map(str, parts)) if len(parts) != 1 else str(parts[0])
+        with self._lock:
+            if len(self._lines) >= self._capacity:
+                self._lines.popleft()
+                self.dropped += 1
+            self._lines.append((time.time(), level, text))
+        self._wake.set()
+
+    __call__ = write
+
+    def warn(self, *parts):
+        self.write(*parts, level=WARNING)
+
+    def pause(self):
+        """Write out what is queued, take the status line down and hold output."""
+        self._drain()
+        with self._out_lock:
+            self._paused = True
+            if self._shown:
+                self._emit(_CLEAR_LINE)
+                self._shown = ""
+
+    def resume(self):
+        self._paused = False
+        self._wake.set()
+
+    def close(self):
+        """Write everything still queued, clear the status line and stop."""
+        self._paused = False
+        self._closing = True
+        self._wake.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        else:
+            self._drain()
+        with self._out_lock:
+            if self._shown:
+                self._emit(_CLEAR_LINE)
+                self._shown = ""
+        if self.log:
+            self.log.close()
+
+    def _run(self):
+        while not self._closing:
+            self._wake.wait(self.status_interval if self.status else None)
+            if not self._closing:
+                time.sleep(self.interval)  # let a burst collect
+            self._wake.clear()
+            self._drain()
+        self._drain()
+
+    def _drain(self):
+        # the writer thread, and pause() from the prompt thread. write() only
+        # ever takes _lock, so callers never wait for the console or the disk
+        with self._out_lock:
+            with self._lock:
+                lines, self._lines = self._lines, collections.deque()
+                self._skipped += self.dropped - self._reported
+                self._reported = self.dropped
+            if self.log:
+                for t, level, text in lines:
+                    self._log_line(t, level, text)
+            for _, _, text in lines:
+                if len(self._held) == self._held.maxlen:
+                    self._skipped += 1  # paused too long, the oldest held line goes
+                self._held.append(text)
+            if self._paused:
+                return
+            out = []
+            if self._held or self._skipped:
+                if self._shown:
+                    out.append(_CLEAR_LINE)
+                    self._shown = ""
+                if self._skipped:
+                    out.append(f"... {self._skipped} messages skipped\n")
+                    self._skipped = 0
+                out.extend(text + "\n" for text in self._held)
+                self.written += len(self._held)
+                self._held.clear()
+            status = self._status_line()
+            if status != self._shown:
+                if self._shown and not out:
+                    out.append(_CLEAR_LINE)
+                out.append(status)
+                self._shown = status
+            if out:
+                self._emit("".join(out))
+
+    def _status_line(self):
+        if not (self.status and self.tty) or self._closing:
+            return ""
+        try:
+            text = self.status()
+        except Exception as e:
+            text = f"status unavailable: {e}"
+        width = shutil.get_terminal_size().columns - 1
+        return text[:width]
+
+    def _log_line(self, t, level, text):
+        record = logging.makeLogRecord({"msg": text.strip("\n"), "levelno": level,
+                                        "levelname": logging.getLevelName(level),
+                                        "created": t, "msecs": (t % 1) * 1000})
+        self.log.handle(record)
+
+    def _emit(self, text):
+        try:
+            self.stream.write(text)
+            self.stream.flush()
+        except (OSError, ValueError):
+            pass  # console gone (closed pipe, ...), keep going without it
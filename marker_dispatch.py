@@ -0,0 +1,198 @@
+"""Pushes markers to the LSL outlets from their own thread.
+
+Markers arrive already timestamped through a bounded queue, so a slow
+outlet never holds up key handling. Markers that are due together go out
+in one push_chunk call per outlet.
+
+Samples are queued as plain strings (the stream has one channel), the
+lists pylsl wants are only built here on the outlet thread.
+
+One dispatcher can serve several outlets. Each marker goes to one of them
+by name, to the first (default) one, or to all of them with ALL.
+
+LSL only delivers samples to recorders that are already connected, so with
+hold=True markers for an outlet nobody records yet (have_consumers() is
+False) are kept, up to max_held per outlet, and pushed in one chunk with
+their original timestamps as soon as a recorder connects.
+"""
+
+import queue
+import threading
+from collections import deque
+from time import monotonic
+
+_STOP = object()
+
+ALL = "all"  # target that sends a marker to every outlet
+
+
+class OutletDispatcher:
+    """Owns the outlets and drains a bounded queue of (sample, timestamp, target).
+
+    outlets is one outlet, or a dict of name -> outlet where the first one
+    is the default.
+    """
+
+    def __init__(self, outlets, maxsize=1024, max_chunk=256, name="marker-dispatch", log=print,
+                 clock=None, latency=None, hold=False, max_held=1024, poll_interval=0.2):
+        if not isinstance(outlets, dict):
+            outlets = {"main": outlets}
+        self.outlets = outlets
+        self.default = next(iter(outlets))
+        self.max_chunk = max_chunk
+        self.log = log  # where push errors are reported
+        # optional Histogram of push time minus sample timestamp, needs the LSL clock
+        self.clock = clock
+        self.latency = latency if clock else None
+        self.hold = hold  # keep markers until someone records the outlet
+        self.max_held = max_held
+        self.poll_interval = poll_interval  # how often to look for a recorder while holding
+        self._held = {}  # outlet name -> deque of (sample, timestamp)
+        self._queue = queue.Queue(maxsize)
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+
+        self.pushed = 0     # samples pushed, counted once per outlet
+        self.chunks = 0     # push calls made
+        self.dropped = 0    # samples lost because the queue was full
+        self.max_depth = 0  # deepest the queue has been
+        self.held_dropped = 0  # oldest held samples given up on because max_held was reached
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        """Push whatever is still queued, then stop the thread."""
+        self._queue.put(_STOP)
+        self._thread.join()
+
+    def send(self, sample, timestamp, block=False, target=None):
+        """Queue one sample (a string) for the target outlet (default one if None, ALL for every one).
+        Returns False if it was dropped.
+        Never blocks unless block is True, then it waits for queue space."""
+        try:
+            self._queue.put((sample, timestamp, target or self.default), block)
+        except queue.Full:
+            self.dropped += 1
+            return False
+        depth = self._queue.qsize()
+        if depth > self.max_depth:
+            self.max_depth = depth
+        return True
+
+    def depth(self):
+        """Markers waiting to be pushed right now."""
+        return self._queue.qsize()
+
+    def held(self):
+        """{outlet name: markers held} for outlets nobody is recording yet."""
+        return {name: len(items) for name, items in list(self._held.items())}
+
+    def _run(self):
+        next_poll = 0.0
+        while True:
+            timeout = None
+            if self._held:
+                # while markers are held, look for a recorder now and then,
+                # also when markers for other outlets keep the queue busy
+                now = monotonic()
+                if now >= next_poll:
+                    self._release_held()
+                    next_poll = now + self.poll_interval
+                timeout = next_poll - now
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                continue
+            if item is _STOP:
+                self._release_held(force=True)
+                return
+            batch = [item]
+            stopping = False
+            # grab everything else that is already waiting
+            while len(batch) < self.max_chunk:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._push(batch)
+            if stopping:
+                self._release_held(force=True)
+                return
+
+    def _push(self, batch):
+        # split the batch per outlet, keeping the order
+        per_outlet = {}
+        for sample, timestamp, target in batch:
+            if target == ALL:
+                for name in self.outlets:
+                    per_outlet.setdefault(name, []).append((sample, timestamp))
+            elif target in self.outlets:
+                per_outlet.setdefault(target, []).append((sample, timestamp))
+            else:
+                self.log(f"No outlet called {target}, marker not sent: {sample}")
+
+        for name, items in per_outlet.items():
+            outlet = self.outlets[name]
+            if self.hold and not _has_consumers(outlet):
+                self._hold(name, items)
+                continue
+            held = self._held.pop(name, None)
+            if held:
+                self.log(f"Recorder connected to {name}, sending {len(held)} held markers")
+                items = list(held) + items
+            self._push_items(name, outlet, items, len(held) if held else 0)
+
+    def _push_items(self, name, outlet, items, held=0):
+        """Push items to one outlet. The first `held` of them were held back,
+        their wait for a recorder isn't push latency so it isn't recorded."""
+        try:
+            if len(items) == 1:
+                sample, timestamp = items[0]
+                outlet.push_sample([sample], timestamp)
+            else:
+                # one channel, so a flat list of strings is a chunk
+                outlet.push_chunk([sample for sample, _ in items],
+                                  [timestamp for _, timestamp in items])
+        except Exception as e:
+            self.log(f"Error pushing markers to {name}: {e}")
+            return
+        self.pushed += len(items)
+        self.chunks += 1
+        if self.latency is not None:
+            now = self.clock()
+            for _, timestamp in items[held:]:
+                self.latency.record(now - timestamp)
+
+    def _hold(self, name, items):
+        held = self._held.get(name)
+        if held is None:
+            held = self._held[name] = deque()
+            self.log(f"WARNING: nobody is recording {name}, holding markers until a recorder connects")
+        for item in items:
+            if len(held) >= self.max_held:
+                held.popleft()
+                self.held_dropped += 1
+            held.append(item)
+
+    def _release_held(self, force=False):
+        """Push held markers for outlets that have a recorder now (or all of them if force)."""
+        for name in list(self._held):
+            outlet = self.outlets[name]
+            if force or _has_consumers(outlet):
+                held = self._held.pop(name)
+                if force:
+                    self.log(f"Still nobody recording {name}, pushing {len(held)} held markers anyway")
+                else:
+                    self.log(f"Recorder connected to {name}, sending {len(held)} held markers")
+                self._push_items(name, outlet, list(held), len(held))
+
+
+def _has_consumers(outlet):
+    try:
+        return outlet.have_consumers()
+    except AttributeError:
+        return True  # not an LSL outlet, nothing to wait for
@@ -0,0 +1,368 @@
+"""Marker decoding, history, undo and sending, without any keyboard or display.
+
+new_marker_file.py drives a MarkerEngine from pynput. Experiment scripts can
+drive the same engine straight from code, through the same code path:
+
+    engine = MarkerEngine(outlet, markers, two_key_markers, log=None)
+    engine.start()
+    engine.feed('x')                       # one key, stamped now
+    engine.feed_many([('c', t0), ('c', t0 + 0.1)])
+    engine.stop()
+
+Pass keymap=load_keymap('keymap.json') instead of the dicts to use a keymap
+file, and use_keymap() to switch keymaps while it runs.
+
+The engine isn't thread safe. Call it from one thread only (the keyboard
+script uses its scheduler thread for this).
+"""
+
+import marker_journal
+from key_decoder import ChordDecoder, KeyDecoder
+from keymap import PROMPT, REDO, UNDO, Keymap, MarkerDef
+from marker_dispatch import OutletDispatcher
+from marker_history import MarkerHistory
+from marker_limits import MarkerLimiter
+
+
+def _quiet(*args, **kwargs):
+    pass
+
+
+class MarkerEngine:
+    """Turns key presses into markers on an outlet, with history and undo.
+
+    outlet is anything with push_sample() and push_chunk() like a pylsl
+    StreamOutlet. clock returns the current LSL time and defaults to
+    pylsl.local_clock. journal is an opened MarkerJournal or None.
+    telemetry is a marker_telemetry.Telemetry to record latencies into, or None.
+    on_prompt(kind, marker_id) is called after sending a marker that wants a
+    typed note ("NewActivity", "InterestingMoment"). The note is sent later
+    with annotate(marker_id, note), linked to the marker by its ID.
+
+    Every marker gets an ID that counts up for the whole session and is sent
+    as "Clapping#17". Undo and redo send "UNDO_Clapping#17" / "REDO_Clapping#17",
+    i.e. the prefix plus the exact sample they refer to. marker_ids=False
+    sends plain names (undo/redo still work, but can't be told apart in
+    the recording when the same marker was sent twice).
+
+    outlet can also be a dict of name -> outlet. Markers go to the outlet
+    the keymap names for their keys, or to the route given to feed(), e.g.
+    ALL to send to every outlet.
+
+    hold=True keeps markers for an outlet nobody records yet and pushes
+    them (up to max_held, with their own timestamps) once a recorder connects.
+
+    Keymap entries with a min_interval or rate_limit are checked by limiter
+    when typed; markers sent with send() from code aren't limited.
+
+    A keymap with chords needs key releases too: call release(key, t) for
+    every letter let go, and pass shift=True to feed() for SHIFT+letter.
+    Keys that will never be let go (typed into a terminal, sent by another
+    program) are fed with releases=False and skip chord decoding.
+    """
+
+    __slots__ = ('clock', 'keymap', 'decoder', 'chords', 'dispatcher', 'journal', 'history',
+                 'marker_ids', 'block', 'log', 'on_prompt', 'last_sample', 'telemetry',
+                 'limiter', '_adhoc')
+
+    def __init__(self, outlet, markers=None, combos=None, clock=None, journal=None,
+                 history_size=1024, ambiguity_window=0.3, sequence_timeout=1.0,
+                 ambiguity_windows=None, queue_size=1024, block=False,
+                 log=print, on_prompt=None, keymap=None, marker_ids=True, telemetry=None,
+                 hold=False, max_held=1024):
+        if clock is None:
+            from pylsl import local_clock as clock
+        self.clock = clock
+        if keymap is None:
+            keymap = Keymap(markers or {}, combos or {},
+                            sequence_timeout=sequence_timeout,
+                            ambiguity_window=ambiguity_window,
+                            ambiguity_windows=ambiguity_windows)
+        self.keymap = None
+        self.decoder = None
+        self.chords = None
+        self.use_keymap(keymap)
+        self.log = log or _quiet
+        self.telemetry = telemetry
+        self.dispatcher = OutletDispatcher(outlet, maxsize=queue_size, log=self.log, clock=clock,
+                                           latency=telemetry.key_to_push if telemetry else None,
+                                           hold=hold, max_held=max_held)
+        self.journal = journal
+        # every marker of the session, the newest history_size kept in memory
+        self.history = MarkerHistory(capacity=history_size)
+        self.marker_ids = marker_ids
+        self.block = block   # wait for queue space instead of dropping (scripts)
+        self.on_prompt = on_prompt
+        self.last_sample = None  # the last string queued for an outlet
+        self.limiter = MarkerLimiter()
+        self._adhoc = {}  # name -> MarkerDef for markers sent with send()
+
+    def start(self):
+        self.dispatcher.start()
+
+    def stop(self):
+        """Push everything still queued and stop the outlet thread."""
+        self.dispatcher.stop()
+        self.history.close()
+
+    def use_keymap(self, keymap):
+        """Switch to a compiled Keymap. A marker waiting for a possible combo is sent first."""
+        if self.decoder is not None:
+            self.flush()
+        self.decoder = KeyDecoder(keymap.trie,
+                                  ambiguity_window=keymap.ambiguity_window,
+                                  sequence_timeout=keymap.sequence_timeout,
+                                  ambiguity_windows=keymap.ambiguity_windows)
+        # chord mode only for keymaps that have chords
+        self.chords = (ChordDecoder(keymap.chord_table, hold_timeout=keymap.sequence_timeout)
+                       if keymap.chord_table else None)
+        self.keymap = keymap
+
+    @property
+    def deadline(self):
+        """Clock time the sequence being typed times out, or None."""
+        deadline = self.decoder.deadline
+        if self.chords is not None and self.chords.keys:
+            held = self.chords.deadline
+            return held if deadline is None else min(deadline, held)
+        return deadline
+
+    def feed(self, key, t=None, route=None, shift=False, releases=True):
+        """Feed one key press. t is its LSL press time, defaults to now.
+        route picks the outlet for the marker this key is part of.
+        shift says SHIFT was held, for chords like shift+c.
+        releases=False says no release() will follow, so the key goes
+        straight to the trie instead of waiting to see if it's a chord."""
+        if t is None:
+            t = self.clock()
+        if self.chords is not None and releases:
+            self._decode(self.chords.press(key, t, route, shift))
+            return
+        for keys, marker, press_time, key_route in self.decoder.feed(key, t, route):
+            self.handle_marker(keys, marker, press_time, key_route)
+
+    def release(self, key, t=None):
+        """A key was let go. Only matters for chords."""
+        if self.chords is not None:
+            self._decode(self.chords.release(key, self.clock() if t is None else t))
+
+    def _decode(self, decided):
+        # chords go straight out, keys that weren't part of one are typed into the trie
+        for keys, marker, press_time, route in decided:
+            if marker is None:
+                for found in self.decoder.feed(keys, press_time, route):
+                    self.handle_marker(*found)
+            else:
+                self.handle_marker(keys, marker, press_time, route)
+
+    def feed_many(self, presses):
+        """Feed many key presses in order, each either a key or a (key, t[, route]) tuple."""
+        for press in presses:
+            if isinstance(press, str):
+                self.feed(press)
+            else:
+                self.feed(*press)
+
+    def expire(self, now=None):
+        """Send a waiting single key or forget a stale prefix once its deadline passed."""
+        if now is None:
+            now = self.clock()
+        if self.chords is not None:
+            self._decode(self.chords.expire(now))
+        for keys, marker, press_time, route in self.decoder.expire(now):
+            self.handle_marker(keys, marker, press_time, route)
+
+    def flush(self):
+        """Send whatever is waiting for a possible combo right now."""
+        if self.chords is not None:
+            self._decode(self.chords.flush())
+        for keys, marker, press_time, route in self.decoder.flush():
+            self.handle_marker(keys, marker, press_time, route)
+
+    def reset(self):
+        """Forget any keys typed so far."""
+        self.decoder.reset()
+        if self.chords is not None:
+            self.chords.reset()
+
+    def handle_marker(self, keys, marker, press_time, route=None):
+        """Act on a finished marker (a MarkerDef), stamped with when its key was pressed."""
+        if self.telemetry is not None:
+            self.telemetry.decode_wait.record(self.clock() - press_time)
+        if marker.limited and not self.limiter.allow(marker, press_time):
+            if self.log is not _quiet:
+                self.log(f"Too fast, not sent: {marker.name} {marker.description}")
+            return
+        action = marker.action
+        if action == UNDO:
+            self.undo(press_time, keys)
+        elif action == REDO:
+            self.redo(press_time, keys)
+        else:
+            marker_id = self.send_def(marker, press_time, route or marker.target)
+            if action == PROMPT and marker_id >= 0 and self.on_prompt:
+                # sent now with its press time, the note follows when it's typed
+                self.on_prompt(marker.name, marker_id)
+
+    def sample(self, marker, marker_id):
+        """The string pushed for a marker, with its ID if marker_ids is on."""
+        if self.marker_ids and marker_id >= 0:
+            return f"{marker}#{marker_id}"
+        return marker
+
+    def send(self, marker_data, description="", timestamp=None, keys="", target=None):
+        """Send marker and add to history for undo functionality.
+        timestamp is the LSL time of the key press, defaults to now.
+        target is the outlet name (or ALL), defaults to the first outlet.
+        Returns the marker ID, or -1 if it wasn't an undoable marker or was dropped"""
+        if timestamp is None:
+            timestamp = self.clock()
+        return self.send_def(self._marker_def(marker_data[0], keys), timestamp,
+                             target, description)
+
+    def send_def(self, marker, timestamp, target=None, description=None):
+        """Send a compiled MarkerDef. Same as send() but with nothing left to work out.
+        The only new objects are the "Name#id" string and the queue/journal entries."""
+        name = marker.name
+        verbose = self.log is not _quiet
+
+        # undo-style markers aren't kept in history and get no ID
+        if not marker.recordable:
+            if not self.dispatcher.send(name, timestamp, self.block, target):
+                if verbose:
+                    self.log(f"Marker queue full, DROPPED: {name}")
+                return -1
+            self.last_sample = name
+            if self.journal is not None:
+                self.journal.append(marker_journal.OTHER, timestamp, name, marker.keys, target=target)
+            if verbose:
+                self.log(f"Sent marker: {name} {description or marker.description}")
+            return -1
+
+        marker_id = self.history.next_id
+        sample = marker.id_prefix + str(marker_id) if self.marker_ids else name
+        if not self.dispatcher.send(sample, timestamp, self.block, target):
+            if verbose:
+                self.log(f"Marker queue full, DROPPED: {sample}")
+            return -1
+        self.last_sample = sample
+        self.history.append(name, timestamp, description or marker.description, target)
+        if self.journal is not None:
+            self.journal.append(marker_journal.MARKER, timestamp, name, marker.keys, marker_id, target)
+
+        if verbose:
+            self.log(f"Sent marker: {sample} {description or marker.description}")
+        return marker_id
+
+    def _marker_def(self, name, keys):
+        # markers sent from code get compiled once too and reused
+        marker = self._adhoc.get(name)
+        if marker is None or marker.keys != keys:
+            marker = MarkerDef(keys, name)
+            if len(self._adhoc) < 4096:
+                self._adhoc[name] = marker
+        return marker
+
+    def annotate(self, marker_id, note, timestamp=None, keys=""):
+        """Send a note for an earlier marker as "<marker>_<note>#<id>", to the same outlet(s)."""
+        entry = self.history.get(marker_id)
+        if entry is None:
+            self.log(f"No marker #{marker_id} to add a note to")
+            return
+        text = f"{entry.marker}_{note}"
+        sample = self.sample(text, marker_id)
+        if timestamp is None:
+            timestamp = self.clock()
+        if not self.dispatcher.send(sample, timestamp, self.block, entry.target):
+            self.log(f"Marker queue full, DROPPED: {sample}")
+            return
+        self.last_sample = sample
+        self._journal(marker_journal.NOTE, timestamp, text, keys, marker_id, entry.target)
+        self.log(f"Sent note: {sample}")
+
+    def undo(self, timestamp=None, keys="", marker_id=None):
+        """Send UNDO_<marker>#<id> for the newest marker not undone yet, or for marker_id."""
+        if len(self.history) == 0:
+            self.log("No markers to undo!")
+            return
+
+        entry = self.history.undo(marker_id)
+        if entry is None:
+            if marker_id is None:
+                self.log("Already undone all markers!")
+            else:
+                self.log(f"No marker #{marker_id} to undo (or it's already undone)")
+            return
+        self._send_correction("UNDO", marker_journal.UNDO, entry, timestamp, keys)
+
+    def redo(self, timestamp=None, keys=""):
+        """Send REDO_<marker>#<id> for the most recently undone marker."""
+        entry = self.history.redo()
+        if entry is None:
+            self.log("Nothing to redo!")
+            return
+        self._send_correction("REDO", marker_journal.REDO, entry, timestamp, keys)
+
+    def _send_correction(self, prefix, kind, entry, timestamp, keys):
+        # goes to the same outlet(s) as the marker it refers to
+        correction = f"{prefix}_{self.sample(entry.marker, entry.id)}"
+        if timestamp is None:
+            timestamp = self.clock()
+        if not self.dispatcher.send(correction, timestamp, self.block, entry.target):
+            self.log(f"Marker queue full, DROPPED: {correction}")
+            # put the history back the way it was
+            if kind == marker_journal.UNDO:
+                self.history.redo()
+            else:
+                self.history.undo(entry.id)
+            return
+        self.last_sample = correction
+        if self.telemetry is not None:
+            if kind == marker_journal.UNDO:
+                self.telemetry.undos += 1
+            else:
+                self.telemetry.redos += 1
+        self._journal(kind, timestamp, f"{prefix}_{entry.marker}", keys, entry.id, entry.target)
+        self.log(f"{prefix}: #{entry.id} {entry.marker} (sent {correction})")
+
+    def show_history(self, count=10):
+        """Show recent marker history"""
+        if len(self.history) == 0:
+            self.log("No marker history available")
+            return
+
+        self.log("\n--- Recent Marker History ---")
+        for entry in self.history.recent(count):
+            status = " (UNDONE)" if entry.undone else ""
+            self.log(f"#{entry.id}: {entry.marker}{status}")
+        self.log(f"{len(self.history)} markers this session, {self.history.undone_count()} undone")
+        self.log(f"Queue: {self.dispatcher.depth()} waiting, {self.dispatcher.dropped} dropped")
+        self.log("-----------------------------\n")
+
+    def restore(self, records):
+        """Rebuild history, marker IDs, outlets and undo/redo state from journal records.
+        Markers keep the ID they were journaled with, even if records before them were lost."""
+        for record in records:
+            if record.kind == marker_journal.MARKER:
+                if record.ref < self.history.next_id:
+                    continue  # that ID is already taken, not a marker we can put back
+                self.history.skip(record.ref)
+                self.history.append(record.marker, record.timestamp, "(recovered)", record.target or None)
+            elif record.kind == marker_journal.UNDO:
+                self.history.undo(record.ref)
+            elif record.kind == marker_journal.REDO:
+                self.history.redo()
+
+    def reannounce(self, records):
+        """Push journal records again with their original timestamps, to the outlets they went to."""
+        for record in records:
+            if record.kind == marker_journal.OTHER:
+                sample = record.marker
+            else:
+                sample = self.sample(record.marker, record.ref)
+            self.dispatcher.send(sample, record.timestamp, self.block, record.target or None)
+
+    def _journal(self, kind, timestamp, marker, keys, ref=-1, target=None):
+        if self.journal is None:
+            return -1
+        return self.journal.append(kind, timestamp, marker, keys, ref, target)
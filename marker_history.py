@@ -0,0 +1,138 @@
+"""Every marker of the session, indexed by its marker ID, with undo and redo.
+
+IDs count up from 0 and never repeat. The newest `capacity` markers are kept
+in fixed-size arrays used as a ring; older ones are written to a spill file
+and an offset table finds them again. Looking a marker up, undoing the
+newest one and undoing one by ID are O(1) (undo of the newest skips over
+markers already undone by ID). A redone marker goes back in its place by
+ID, so undo always takes the newest marker that isn't undone.
+"""
+
+import json
+import tempfile
+from array import array
+from bisect import bisect_left
+from collections import namedtuple
+
+HistoryEntry = namedtuple("HistoryEntry", "id marker timestamp description target undone")
+
+
+class MarkerHistory:
+    """Unbounded marker history, newest markers in memory, the rest on disk."""
+
+    def __init__(self, capacity=1024, spill_path=None, first_id=0):
+        self.capacity = capacity
+        self.first_id = first_id
+        self.next_id = first_id
+        # ring of the newest markers, slot = id % capacity
+        self._marker = [None] * capacity
+        self._timestamp = array("d", bytes(8 * capacity))
+        self._description = [None] * capacity
+        self._target = [None] * capacity
+        # one byte per marker ever sent, 1 if undone
+        self._undone = bytearray()
+        self._undone_total = 0
+        # markers that fell out of the ring
+        self._spill_path = spill_path
+        self._spill = None
+        self._offsets = array("q")  # spill file offset for id - first_id
+        # ids to try for undo (sorted, newest last) and ids to try for redo
+        self._live = []
+        self._redo = []
+
+    def __len__(self):
+        return self.next_id - self.first_id
+
+    def append(self, marker, timestamp, description="", target=None):
+        """Add a marker and return its ID."""
+        marker_id = self.next_id
+        slot = marker_id % self.capacity
+        if marker_id - self.first_id >= self.capacity:
+            self._spill_slot(slot)
+        self._marker[slot] = marker
+        self._timestamp[slot] = timestamp
+        self._description[slot] = description
+        self._target[slot] = target
+        self._undone.append(0)
+        self._live.append(marker_id)
+        self.next_id += 1
+        return marker_id
+
+    def skip(self, marker_id):
+        """Leave the IDs up to marker_id empty, for markers a damaged journal lost.
+        They show as "(lost)" and can't be undone or redone."""
+        while self.next_id < marker_id:
+            self.append("(lost)", 0.0, "(lost from the journal)")
+            self._live.pop()
+            self._undone[-1] = 1
+
+    def get(self, marker_id):
+        """The entry for an ID, or None if there is no such marker."""
+        if not self.first_id <= marker_id < self.next_id:
+            return None
+        undone = bool(self._undone[marker_id - self.first_id])
+        if marker_id >= self.next_id - self.capacity:
+            slot = marker_id % self.capacity
+            return HistoryEntry(marker_id, self._marker[slot], self._timestamp[slot],
+                                self._description[slot], self._target[slot], undone)
+        # fell out of the ring, read it back from the spill file
+        self._spill.flush()
+        self._spill.seek(self._offsets[marker_id - self.first_id])
+        marker, timestamp, description, target = json.loads(self._spill.readline())
+        return HistoryEntry(marker_id, marker, timestamp, description, target, undone)
+
+    def undo(self, marker_id=None):
+        """Mark the newest live marker (or the given ID) undone. Returns its entry or None."""
+        if marker_id is None:
+            while self._live:
+                candidate = self._live.pop()
+                if not self._undone[candidate - self.first_id]:
+                    marker_id = candidate
+                    break
+            else:
+                return None
+        elif self.get(marker_id) is None or self._undone[marker_id - self.first_id]:
+            return None
+        self._undone[marker_id - self.first_id] = 1
+        self._undone_total += 1
+        self._redo.append(marker_id)
+        return self.get(marker_id)
+
+    def redo(self):
+        """Bring back the most recently undone marker. Returns its entry or None."""
+        while self._redo:
+            marker_id = self._redo.pop()
+            if self._undone[marker_id - self.first_id]:
+                self._undone[marker_id - self.first_id] = 0
+                self._undone_total -= 1
+                # back in ID order, it may be older than markers sent since
+                i = bisect_left(self._live, marker_id)
+                if i == len(self._live) or self._live[i] != marker_id:
+                    self._live.insert(i, marker_id)
+                return self.get(marker_id)
+        return None
+
+    def recent(self, count):
+        """The newest `count` entries, newest first."""
+        stop = max(self.first_id, self.next_id - count) - 1
+        return [self.get(marker_id) for marker_id in range(self.next_id - 1, stop, -1)]
+
+    def undone_count(self):
+        """Markers undone right now (cheap enough for a status line)."""
+        return self._undone_total
+
+    def close(self):
+        if self._spill:
+            self._spill.close()
+            self._spill = None
+
+    def _spill_slot(self, slot):
+        if self._spill is None:
+            if self._spill_path:
+                self._spill = open(self._spill_path, "w+b")
+            else:
+                self._spill = tempfile.TemporaryFile()
+        self._spill.seek(0, 2)
+        self._offsets.append(self._spill.tell())
+        self._spill.write(json.dumps([self._marker[slot], self._timestamp[slot],
+                                      self._description[slot], self._target[slot]]).encode() + b"\n")
@@ -0,0 +1,435 @@
+"""Where key presses and marker commands come from.
+
+Every input backend turns its own events into calls on an InputSink, which
+the script points at the one decoder and outlet, so markers behave the same
+whichever way they came in. Backends stamp events with the LSL clock as
+close to the real press as they can:
+
+    pynput  - global keyboard hook (needs a display session), the default
+    evdev   - Linux /dev/input, uses the kernel's timestamp of the key press
+    stdin   - the terminal the script runs in, one key at a time
+    socket  - marker commands from other programs on this computer, over a
+              Unix or UDP datagram socket (see SocketInput)
+
+Pick them with MARKER_INPUT, e.g. MARKER_INPUT=evdev,socket.
+
+Holding a key down makes the OS repeat it. pynput and evdev see the key's
+release, so the repeats are dropped (and counted in keys.repeats). A
+terminal doesn't say when a key is let go, so with stdin only the keymap's
+min_interval / rate_limit stop a held key.
+
+shift means the SHIFT key itself is held, not that the letter came out as
+a capital (Caps Lock). pynput and evdev watch the SHIFT keys; a terminal
+can't tell the two apart, so stdin keys never have shift.
+"""
+
+import math
+import os
+import select
+import socket
+import sys
+import threading
+import time
+
+
+class InputSink:
+    """What a backend calls. All of them can be called from any thread.
+
+    key(key, t, shift=False, alt=False, releases=True)
+                                          a letter key pressed at LSL time t, shift if SHIFT is held,
+                                          releases=False if release() won't be called for it
+    release(key, t)                       that letter let go (pynput and evdev only)
+    command(name, t=None, alt=False)      'history', 'undo_id', 'undo', 'redo' or 'quit'
+    marker(name, t=None, target=None)     send a named marker straight to an outlet
+    prompting()                           True while a console prompt is reading text
+
+    alt says the key was typed with ALT held (or didn't come from the keyboard
+    at all), which lets it through while a prompt is open.
+    """
+
+    def __init__(self, key, command, marker, prompting, release=None):
+        self.key = key
+        self.command = command
+        self.marker = marker
+        self.prompting = prompting
+        self.release = release or _ignore
+
+
+def _ignore(*args):
+    pass
+
+
+class HeldKeys:
+    """Which keys are down, from press and release events.
+
+    press() is True for a real press and False for an auto-repeat of a key
+    that is still down. If a release got lost, a key that hasn't repeated
+    for `stale` seconds counts as pressed again, so it can never get stuck.
+    """
+
+    __slots__ = ('down', 'repeats', 'stale')
+
+    def __init__(self, stale=1.0):
+        self.down = {}  # key -> time of its last press or repeat
+        self.repeats = 0
+        self.stale = stale
+
+    def press(self, key, t):
+        last = self.down.get(key)
+        self.down[key] = t
+        if last is not None and t - last < self.stale:
+            self.repeats += 1
+            return False
+        return True
+
+    def release(self, key):
+        self.down.pop(key, None)
+
+
+class PynputInput:
+    """Keys from pynput's global keyboard hook."""
+
+    def __init__(self, clock, latency_offset=0.0):
+        self.clock = clock
+        # how far the hook lags behind the real key press (MARKER_INPUT_LATENCY)
+        self.latency_offset = latency_offset
+        self.listener = None
+        self.keys = HeldKeys()
+
+    def start(self, sink):
+        from pynput import keyboard
+
+        alt_keys = {getattr(keyboard.Key, name, None) for name in ('alt', 'alt_l', 'alt_r', 'alt_gr')}
+        shift_keys = {getattr(keyboard.Key, name, None) for name in ('shift', 'shift_l', 'shift_r')}
+        specials = {keyboard.Key.f1: "history", keyboard.Key.f2: "undo_id"}
+        alt_held = shift_held = False
+        held = self.keys
+
+        def on_press(key):
+            nonlocal alt_held, shift_held
+            # stamp the press right away, before any waiting for combos
+            t = self.clock() - self.latency_offset
+            if key in alt_keys:
+                alt_held = True
+                return
+            if key in shift_keys:
+                # the key, not a capital letter, Caps Lock gives those too
+                shift_held = True
+                return
+            if not held.press(_key_id(key), t):
+                return  # auto-repeat of a key held down
+            if key in specials:
+                sink.command(specials[key], t, alt_held)
+                return
+            # ignore numbers, symbols, etc
+            char = getattr(key, 'char', None)
+            if char and char.isalpha():
+                sink.key(char.lower(), t, shift_held, alt_held)
+
+        def on_release(key):
+            nonlocal alt_held, shift_held
+            key_id = _key_id(key)
+            if key_id in held.down and isinstance(key_id, str) and key_id.isalpha():
+                sink.release(key_id, self.clock() - self.latency_offset)
+            held.release(key_id)
+            if key in alt_keys:
+                alt_held = False
+            elif key in shift_keys:
+                shift_held = False
+            elif key == keyboard.Key.esc and (alt_held or not sink.prompting()):
+                # quit on ESC release, an ESC typed into a prompt is just text
+                sink.command("quit", self.clock(), True)
+                return False
+
+        self.listener = keyboard.Listener(on_press=on_press, on_release=on_release)
+        self.listener.start()
+
+    def stop(self):
+        if self.listener:
+            self.listener.stop()
+
+
+def _key_id(key):
+    # a letter can come back as the other case on release (SHIFT let go in
+    # between), and on X11 the vk code changes with it too
+    char = getattr(key, 'char', None)
+    if char:
+        return char.lower()
+    vk = getattr(key, 'vk', None)
+    return key if vk is None else vk
+
+
+class EvdevInput:
+    """Keys straight from a Linux input device, stamped with the kernel's event time.
+
+    device is a /dev/input/event* path, or None for the first keyboard found.
+    grab=True keeps the keys from reaching other programs (the terminal, ...).
+    The user needs read access to the device (usually the 'input' group).
+    """
+
+    def __init__(self, clock, device=None, grab=False):
+        self.clock = clock
+        self.device_path = device
+        self.grab = grab
+        self.device = None
+        self._thread = None
+        self.keys = HeldKeys()
+
+    def start(self, sink):
+        import evdev  # pip install evdev (Linux only)
+
+        self._evdev = evdev
+        if self.device_path:
+            self.device = evdev.InputDevice(self.device_path)
+        else:
+            self.device = _find_keyboard(evdev)
+            if self.device is None:
+                raise RuntimeError("no keyboard found in /dev/input (is the user in the 'input' group?)")
+        if self.grab:
+            self.device.grab()
+        self._thread = threading.Thread(target=self._run, args=(sink,), name="marker-evdev", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        device, self.device = self.device, None
+        if device:
+            device.close()  # wakes read_loop with an error
+        if self._thread:
+            self._thread.join(1.0)
+
+    def _run(self, sink):
+        ecodes = self._evdev.ecodes
+        shift_keys = {ecodes.KEY_LEFTSHIFT, ecodes.KEY_RIGHTSHIFT}
+        alt_keys = {ecodes.KEY_LEFTALT, ecodes.KEY_RIGHTALT}
+        specials = {ecodes.KEY_F1: "history", ecodes.KEY_F2: "undo_id", ecodes.KEY_ESC: "quit"}
+        letters = {getattr(ecodes, f"KEY_{c.upper()}"): c for c in "abcdefghijklmnopqrstuvwxyz"}
+        shift = alt = False
+        try:
+            for event in self.device.read_loop():
+                if event.type != ecodes.EV_KEY:
+                    continue
+                code = event.code
+                if code in shift_keys:
+                    shift = event.value != 0
+                elif code in alt_keys:
+                    alt = event.value != 0
+                elif event.value == 2:  # auto-repeat, the kernel tells us
+                    self.keys.repeats += 1
+                elif event.value == 0:
+                    if code in letters and code in self.keys.down:
+                        sink.release(letters[code], event.timestamp() + (self.clock() - time.time()))
+                    self.keys.release(code)
+                elif event.value == 1:
+                    # kernel time is wall clock, move it onto the LSL clock
+                    t = event.timestamp() + (self.clock() - time.time())
+                    self.keys.press(code, t)
+                    if code in letters:
+                        sink.key(letters[code], t, shift, alt)
+                    elif code in specials:
+                        sink.command(specials[code], t, alt)
+        except OSError:
+            pass  # device closed by stop() or unplugged
+
+
+def _find_keyboard(evdev):
+    for path in evdev.list_devices():
+        device = evdev.InputDevice(path)
+        keys = device.capabilities().get(evdev.ecodes.EV_KEY, [])
+        if evdev.ecodes.KEY_A in keys and evdev.ecodes.KEY_Z in keys:
+            return device
+        device.close()
+    return None
+
+
+class StdinInput:
+    """Keys typed into the script's own terminal, read one at a time.
+
+    The terminal goes back to normal line input while a prompt is open.
+    F1/F2 and ALT+key come in as escape sequences, a lone ESC quits.
+    A capital letter may just be Caps Lock, so keys from here never count
+    as SHIFT held (no sending to every outlet, no shift+ chords).
+    """
+
+    def __init__(self, clock, latency_offset=0.0):
+        self.clock = clock
+        self.latency_offset = latency_offset
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self, sink):
+        import termios  # Unix terminals only
+        import tty
+
+        self._termios = termios
+        self._tty = tty
+        self._fd = sys.stdin.fileno()
+        self._saved = termios.tcgetattr(self._fd)
+        self._thread = threading.Thread(target=self._run, args=(sink,), name="marker-stdin", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(1.0)
+
+    def _run(self, sink):
+        fd = self._fd
+        raw = False
+        try:
+            while not self._stop.is_set():
+                if sink.prompting():
+                    # let input() have the terminal back
+                    if raw:
+                        self._termios.tcsetattr(fd, self._termios.TCSADRAIN, self._saved)
+                        raw = False
+                    time.sleep(0.05)
+                    continue
+                if not raw:
+                    self._tty.setcbreak(fd)
+                    raw = True
+                if not select.select([fd], [], [], 0.05)[0]:
+                    continue
+                t = self.clock() - self.latency_offset
+                ch = os.read(fd, 1)
+                if not ch:
+                    sink.command("quit", t)  # stdin closed
+                    return
+                if ch == b"\x1b":
+                    self._escape(sink, t)
+                    continue
+                char = ch.decode("latin-1")
+                if char.isalpha():
+                    sink.key(char.lower(), t, releases=False)
+        finally:
+            if raw:
+                self._termios.tcsetattr(fd, self._termios.TCSADRAIN, self._saved)
+
+    def _escape(self, sink, t):
+        # whatever follows ESC right away is part of the same key
+        seq = b""
+        while len(seq) < 8 and select.select([self._fd], [], [], 0.01)[0]:
+            seq += os.read(self._fd, 1)
+        if not seq:
+            sink.command("quit", t)
+        elif seq in (b"OP", b"[11~"):
+            sink.command("history", t)
+        elif seq in (b"OQ", b"[12~"):
+            sink.command("undo_id", t)
+        elif len(seq) == 1 and seq.isalpha():
+            char = seq.decode()
+            sink.key(char.lower(), t, False, True, False)  # ALT+key
+
+
+class SocketInput:
+    """Marker commands from other programs, as datagrams on a Unix or UDP socket.
+
+    Each datagram is a batch of commands, one per line:
+
+        key si                   keys, decoded like typed ones (capital = all outlets), never chords
+        marker StimOnset         a marker sent straight to the first outlet
+        marker StimOnset groupB  ... or to the named outlet (or 'all')
+        undo / redo
+
+    A line can end with @<time>, the sender's pylsl.local_clock() when the
+    event happened, which is then the marker's timestamp (a finite number,
+    nan and inf are rejected). Without it the command is stamped when it arrives.
+
+    address is 'udp:host:port', 'unix:/path/to.sock' or just a path.
+    """
+
+    def __init__(self, address, clock, log=print):
+        self.address = address
+        self.clock = clock
+        self.log = log
+        self.sock = None
+        self._path = None
+        self._thread = None
+
+    def start(self, sink):
+        if self.address.startswith("udp:"):
+            host, port = self.address[4:].rsplit(":", 1)
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.sock.bind((host, int(port)))
+        else:
+            path = self.address[5:] if self.address.startswith("unix:") else self.address
+            if os.path.exists(path):
+                os.unlink(path)  # left over from a run that crashed
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            self.sock.bind(path)
+            self._path = path
+        self.sock.settimeout(0.5)  # so stop() is noticed
+        self._thread = threading.Thread(target=self._run, args=(self.sock, sink),
+                                        name="marker-socket", daemon=True)
+        self._thread.start()
+        self.log(f"Listening for marker commands on {self.address}")
+
+    def stop(self):
+        sock, self.sock = self.sock, None
+        if sock:
+            sock.close()
+        if self._thread:
+            self._thread.join(1.0)
+        if self._path:
+            try:
+                os.unlink(self._path)
+            except OSError:
+                pass
+
+    def _run(self, sock, sink):
+        while self.sock is not None:
+            try:
+                data = sock.recv(65536)
+            except socket.timeout:
+                continue
+            except OSError:
+                return  # closed
+            now = self.clock()
+            for line in data.decode("utf-8", "replace").splitlines():
+                try:
+                    self.handle(line, now, sink)
+                except ValueError as e:
+                    self.log(f"Bad marker command {line!r}: {e}")
+
+    def handle(self, line, now, sink):
+        """Run one command line. Raises ValueError if it doesn't make sense."""
+        words = line.split()
+        if not words:
+            return
+        t = now
+        if words[-1].startswith("@"):
+            t = float(words.pop()[1:])
+            if not math.isfinite(t):
+                # nan/inf would end up as the sample's timestamp in the recording
+                raise ValueError(f"@ time must be a number of seconds, not {t}")
+        command, args = words[0].lower(), words[1:]
+        if command == "key" and len(args) == 1 and args[0].isalpha():
+            for char in args[0]:
+                # never let go, so not part of a chord (and no waiting to see if it is one)
+                sink.key(char.lower(), t, char.isupper(), True, False)
+        elif command == "marker" and 1 <= len(args) <= 2:
+            sink.marker(args[0], t, args[1] if len(args) == 2 else None)
+        elif command in ("undo", "redo") and not args:
+            sink.command(command, t, True)
+        else:
+            raise ValueError("expected 'key <letters>', 'marker <name> [outlet]', 'undo' or 'redo'")
+
+
+def create_inputs(names, clock, latency_offset=0.0, socket_address=None, evdev_device=None,
+                  evdev_grab=False, log=print):
+    """Backends for a comma separated list of names like 'pynput,socket'."""
+    backends = []
+    for name in names.split(","):
+        name = name.strip().lower()
+        if name == "pynput":
+            backends.append(PynputInput(clock, latency_offset))
+        elif name == "evdev":
+            backends.append(EvdevInput(clock, evdev_device, evdev_grab))
+        elif name == "stdin":
+            backends.append(StdinInput(clock, latency_offset))
+        elif name == "socket":
+            backends.append(SocketInput(socket_address, clock, log))
+        elif name:
+            raise ValueError(f"unknown input '{name}', use pynput, evdev, stdin or socket")
+    if not backends:
+        raise ValueError("no input backends given")
+    return backends
@@ -0,0 +1,192 @@
+"""Append-only journal of every marker pushed to the outlet.
+
+Each record holds the sequence number, LSL timestamp, marker name, the
+key(s) that sent it, the outlet it went to and a marker ID: the marker's
+own ID for markers, and the ID of the marker they refer to for undos,
+redos and notes.
+Records are written and fsynced in groups by a background thread, so
+sending a marker never waits on the disk. After a crash the whole file is
+read back in one go to rebuild history and undo state.
+
+File layout: an 8 byte magic header, then records of
+    length (uint32) | crc32 of payload (uint32) | payload
+where the payload is
+    seq (uint64) | timestamp (double) | kind (uint8) | ref (int64)
+    | marker length (uint16) | key length (uint8) | target length (uint8)
+    | marker | key | target
+target is the outlet name ("all" for every outlet, empty for the default one).
+A torn record at the end (power cut mid-write) fails its crc and is cut off.
+Journals from before target was recorded (LSLMJ001) are still read, with an
+empty target, and are rewritten in the new layout when opened for writing.
+"""
+
+import os
+import struct
+import threading
+import time
+import zlib
+from collections import namedtuple
+
+MAGIC = b"LSLMJ002"
+MAGIC_V1 = b"LSLMJ001"  # no target
+
+# record kinds
+MARKER = 0  # a marker that goes into history and can be undone, ref is its marker ID
+UNDO = 1    # an undo, ref is the ID of the marker it undid
+OTHER = 2   # sent but not undoable (CANCEL..., re-announced markers, ...)
+REDO = 3    # a redo, ref is the ID of the marker it brought back
+NOTE = 4    # a typed note for a marker, ref is that marker's ID
+
+_HEADER = struct.Struct("<II")
+_FIXED = struct.Struct("<QdBqHBB")
+_FIXED_V1 = struct.Struct("<QdBqHB")
+
+JournalRecord = namedtuple("JournalRecord", "seq timestamp kind ref marker key target")
+
+
+def _encode(record):
+    marker = record.marker.encode("utf-8")
+    key = record.key.encode("utf-8")
+    target = record.target.encode("utf-8")
+    if len(marker) > 0xFFFF or len(key) > 0xFF or len(target) > 0xFF:
+        raise ValueError(f"marker ({len(marker)} bytes), key ({len(key)} bytes) "
+                         f"or target ({len(target)} bytes) too long to journal")
+    payload = _FIXED.pack(record.seq, record.timestamp, record.kind, record.ref,
+                          len(marker), len(key), len(target)) + marker + key + target
+    return _HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def read_journal(path):
+    """Read every intact record. Returns (records, length of the good part of the file)."""
+    with open(path, "rb") as f:
+        data = f.read()
+    if data.startswith(MAGIC):
+        fixed = _FIXED
+    elif data.startswith(MAGIC_V1):
+        fixed = _FIXED_V1
+    else:
+        raise ValueError(f"{path} is not a marker journal")
+
+    records = []
+    pos = good = len(MAGIC)
+    while pos + _HEADER.size <= len(data):
+        length, crc = _HEADER.unpack_from(data, pos)
+        start = pos + _HEADER.size
+        payload = data[start:start + length]
+        if len(payload) < length or zlib.crc32(payload) != crc or length < fixed.size:
+            break  # torn or corrupt tail, everything after it is lost
+        seq, timestamp, kind, ref, marker_len, key_len, *target_len = fixed.unpack_from(payload)
+        text = payload[fixed.size:]
+        end = marker_len + key_len
+        records.append(JournalRecord(seq, timestamp, kind, ref,
+                                     text[:marker_len].decode("utf-8"),
+                                     text[marker_len:end].decode("utf-8"),
+                                     text[end:end + target_len[0]].decode("utf-8") if target_len else ""))
+        pos = good = start + length
+    return records, good
+
+
+class MarkerJournal:
+    """Durable append-only marker log with group commit."""
+
+    def __init__(self, path, commit_interval=0.2, log=print):
+        self.path = path
+        self.commit_interval = commit_interval  # max time a record waits for fsync
+        self.log = log  # where write errors are reported (from the journal thread)
+        self.next_seq = 0
+        self.written = 0
+        self._pending = []
+        self._cond = threading.Condition()
+        self._closing = False
+        self._file = None
+        self._thread = threading.Thread(target=self._run, name="marker-journal", daemon=True)
+
+    def open(self):
+        """Open the journal, recovering old records. Returns the recovered records."""
+        records = []
+        if os.path.exists(self.path) and os.path.getsize(self.path) > 0:
+            records, good = read_journal(self.path)
+            with open(self.path, "rb") as f:
+                old_layout = f.read(len(MAGIC)) == MAGIC_V1
+            if old_layout:
+                self._rewrite(records)
+            elif good < os.path.getsize(self.path):
+                # cut off a half-written record so new ones follow good data
+                with open(self.path, "r+b") as f:
+                    f.truncate(good)
+            self._file = open(self.path, "ab")
+        else:
+            self._file = open(self.path, "wb")
+            self._file.write(MAGIC)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        if records:
+            self.next_seq = records[-1].seq + 1
+        self._thread.start()
+        return records
+
+    def append(self, kind, timestamp, marker, key="", ref=-1, target=None):
+        """Queue a record for writing and return its sequence number. Never touches the disk.
+        target is the outlet the marker went to, None for the default one."""
+        with self._cond:
+            seq = self.next_seq
+            self.next_seq += 1
+            self._pending.append(JournalRecord(seq, timestamp, kind, ref, marker, key, target or ""))
+            if len(self._pending) == 1:
+                self._cond.notify()  # only the first record of a group wakes the thread
+        return seq
+
+    def _rewrite(self, records):
+        # an old journal gets the current layout, written whole and renamed over it
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(MAGIC + b"".join(_encode(record) for record in records))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+    def close(self):
+        """Write and fsync anything still queued, then close the file."""
+        with self._cond:
+            self._closing = True
+            self._cond.notify()
+        if self._thread.is_alive():
+            self._thread.join()
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closing:
+                    self._cond.wait()
+                # let a burst of markers collect so they share one fsync
+                deadline = time.monotonic() + self.commit_interval
+                while not self._closing:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch, self._pending = self._pending, []
+                closing = self._closing
+            if batch:
+                self._commit(batch)
+            if closing:
+                return
+
+    def _commit(self, batch):
+        data = []
+        for record in batch:
+            try:
+                data.append(_encode(record))
+            except ValueError as e:
+                # skip it, one bad record mustn't stop the journal
+                self.log(f"Marker journal: record {record.seq} ({record.marker[:40]!r}) not saved: {e}")
+        try:
+            self._file.write(b"".join(data))
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self.written += len(data)
+        except OSError as e:
+            self.log(f"Error writing marker journal: {e}")
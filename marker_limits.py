@@ -0,0 +1,62 @@
+"""Limits on how often a marker can be sent from the keyboard.
+
+A keymap entry (or the whole keymap) can say
+
+    "min_interval": 0.5                          at least 0.5 s between two of this marker
+    "rate_limit": {"rate": 2, "burst": 5}        on average 2 a second, 5 in a quick burst
+
+The rate limit is a token bucket: it holds up to `burst` tokens, refills at
+`rate` a second, and every marker sent takes one. Markers that break a
+limit are not sent and are counted per marker name. Both limits work on
+key press times, so they don't depend on how late the engine got to a key.
+"""
+
+
+class MarkerLimiter:
+    """Decides whether a decoded marker may go out. Used from the engine's thread only."""
+
+    __slots__ = ('suppressed', 'total', '_state')
+
+    def __init__(self):
+        self.suppressed = {}  # marker name -> markers not sent
+        self.total = 0
+        self._state = {}      # keys -> [last sent, tokens, tokens counted up to]
+
+    def allow(self, marker, t):
+        """True if the MarkerDef pressed at t may be sent (and counts it as sent)."""
+        state = self._state.get(marker.keys)
+        if state is None:
+            state = self._state[marker.keys] = [float("-inf"), float(marker.burst), t]
+        if marker.min_interval and t - state[0] < marker.min_interval:
+            return self._suppress(marker)
+        if marker.rate:
+            if t > state[2]:
+                state[1] = min(marker.burst, state[1] + (t - state[2]) * marker.rate)
+                state[2] = t
+            if state[1] < 1.0:
+                return self._suppress(marker)
+            state[1] -= 1.0
+        state[0] = t
+        return True
+
+    def _suppress(self, marker):
+        self.suppressed[marker.name] = self.suppressed.get(marker.name, 0) + 1
+        self.total += 1
+        return False
+
+
+def parse_limits(entry, where, defaults=(0.0, 0.0, 1.0)):
+    """(min_interval, rate, burst) from a keymap entry or the top level, over defaults."""
+    min_interval, rate, burst = defaults
+    try:
+        if "min_interval" in entry:
+            min_interval = float(entry["min_interval"])
+        limit = entry.get("rate_limit")
+        if limit:
+            rate = float(limit["rate"])
+            burst = float(limit.get("burst", 1))
+    except (KeyError, TypeError, ValueError) as e:
+        raise ValueError(f"{where}: bad min_interval or rate_limit ({e})") from e
+    if min_interval < 0 or rate < 0 or burst < 1:
+        raise ValueError(f"{where}: min_interval and rate can't be negative, burst must be at least 1")
+    return min_interval, rate, burst
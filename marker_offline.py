@@ -0,0 +1,371 @@
+"""Clean up recorded markers and line them up with EmotiBit data, after the session.
+
+    python marker_offline.py markers_2026-10-*.journal --out events.csv
+    python marker_offline.py day1.xdf day2.xdf --data day1_EA.csv day2_EA.csv --window -2 5
+    pip install numpy   (and pyxdf for .xdf files)
+
+For every session (a .journal, an .xdf from LabRecorder, a CSV from
+verify_markers.py or any "timestamp,marker" CSV) it
+
+- applies every UNDO_/REDO_ so only markers that stood at the end are kept
+  (--keep-undone keeps the others with undone=1),
+- attaches notes ("NewActivity_Reading#4", "InterestingMoment_...") to the
+  marker they belong to,
+- with --data, finds the nearest data sample to every marker and the rows
+  of the window around it (--window, seconds before/after).
+
+Markers with "#id" numbers are resolved with whole-array operations. Older
+recordings without IDs (plain "UNDO_Clapping") are resolved in one pass the
+way the old script undid markers: the newest marker still standing.
+
+Data CSVs can be many GB: only the time column is read, in chunks, into a
+"<file>.<column>.times.npy" cache next to it, which later runs memory-map instead of
+reading the CSV again. Marker times are LSL times, so if the data column is
+on another clock give --clock-offset (seconds added to marker times).
+"""
+
+import argparse
+import csv
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+import numpy as np
+
+import marker_journal
+from keymap import PROMPT_MARKERS
+from marker_journal import MARKER, NOTE, OTHER, REDO, UNDO
+
+_SAMPLE = re.compile(r"^(UNDO_|REDO_)?(.*?)(?:#(\d+))?$", re.S)
+
+
+class MarkerTable:
+    """One session's markers in arrays, in the order they were sent.
+
+    kind is a marker_journal kind (MARKER, UNDO, REDO, NOTE, OTHER), ref the
+    marker ID (the ID referred to for UNDO/REDO/NOTE, -1 if there is none),
+    name the marker name (what was undone for UNDO/REDO) and note the typed
+    text for NOTE rows.
+    """
+
+    def __init__(self, session, times, kinds, refs, names, notes):
+        self.session = session
+        self.time = np.asarray(times, dtype=np.float64)
+        self.kind = np.asarray(kinds, dtype=np.int8)
+        self.ref = np.asarray(refs, dtype=np.int64)
+        self.name = np.asarray(names, dtype=object)
+        self.note = np.asarray(notes, dtype=object)
+
+    def __len__(self):
+        return len(self.time)
+
+
+def parse_samples(session, times, samples):
+    """Build a MarkerTable from pushed strings like "Clapping#3" or "UNDO_Clapping#3"."""
+    kinds, refs, names, notes = [], [], [], []
+    seen = {}  # id -> marker name
+    for sample in samples:
+        prefix, text, marker_id = _SAMPLE.match(sample).groups()
+        ref = int(marker_id) if marker_id is not None else -1
+        note = ""
+        if prefix:
+            kind = UNDO if prefix == "UNDO_" else REDO
+        elif text.startswith(("UNDO", "CANCEL", "REDO")):
+            kind = OTHER
+        elif ref >= 0 and ref in seen and text.startswith(seen[ref] + "_"):
+            kind = NOTE
+            note = text[len(seen[ref]) + 1:]
+            text = seen[ref]
+        elif ref < 0 and text.startswith(tuple(p + "_" for p in PROMPT_MARKERS)):
+            kind = NOTE  # old recordings: NewActivity_<name>, parent found later
+            text, note = text.split("_", 1)
+        else:
+            kind = MARKER
+            if ref >= 0:
+                seen[ref] = text
+        kinds.append(kind)
+        refs.append(ref)
+        names.append(text)
+        notes.append(note)
+    return MarkerTable(session, times, kinds, refs, names, notes)
+
+
+def load_markers(path):
+    """Every marker stream in a file, as a list of MarkerTables."""
+    if path.endswith(".journal"):
+        records, _ = marker_journal.read_journal(path)
+        kinds = [r.kind for r in records]
+        names, notes = [], []
+        seen = {r.ref: r.marker for r in records if r.kind == MARKER}
+        for r in records:
+            name, note = r.marker, ""
+            if r.kind in (UNDO, REDO):
+                name = name.split("_", 1)[1]  # "UNDO_<marker>"
+            elif r.kind == NOTE:
+                # "<marker>_<note>", marker names can have underscores themselves
+                name = seen.get(r.ref) or name.partition("_")[0]
+                note = r.marker[len(name) + 1:]
+            names.append(name)
+            notes.append(note)
+        return [MarkerTable(path, [r.timestamp for r in records], kinds,
+                            [r.ref for r in records], names, notes)]
+    if path.endswith(".xdf"):
+        import pyxdf  # pip install pyxdf
+
+        streams, _ = pyxdf.load_xdf(path)
+        tables = []
+        for stream in streams:
+            info = stream["info"]
+            # marker streams only: the <name>_Telemetry stream is JSON strings too
+            if info["channel_format"][0] != "string" or info["type"][0] == "Telemetry":
+                continue
+            samples = [row[0] for row in stream["time_series"]]
+            tables.append(parse_samples(f"{path}:{info['name'][0]}", stream["time_stamps"], samples))
+        return tables
+    # CSV: verify_markers.py output (on the receiver's clock) or plain timestamp,marker
+    with open(path, newline="", encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+    time_column = "corrected" if rows and "corrected" in rows[0] else "timestamp"
+    return [parse_samples(path, [float(r[time_column]) for r in rows], [r["marker"] for r in rows])]
+
+
+def resolve(table):
+    """Which markers stand at the end, and the notes that belong to them.
+
+    Returns a dict of arrays, one entry per marker (MARKER rows and notes
+    that have no marker to belong to): index (row in the table), id, time,
+    name, note and undone.
+    """
+    if len(table) and (table.ref[table.kind == MARKER] >= 0).all():
+        return _resolve_ids(table)
+    return _resolve_in_order(table)
+
+
+def _resolve_ids(table):
+    kind, ref = table.kind, table.ref
+    markers = np.flatnonzero(kind == MARKER)
+    # markers re-announced after a restart come round again with the same ID
+    _, first = np.unique(ref[markers], return_index=True)
+    markers = markers[np.sort(first)]
+    marker_ids = ref[markers]
+
+    # the last UNDO/REDO of an ID decides whether it is undone
+    corrections = np.flatnonzero((kind == UNDO) | (kind == REDO))
+    undone = np.zeros(len(markers), dtype=bool)
+    if len(corrections):
+        newest_first = corrections[::-1]
+        ids, first = np.unique(ref[newest_first], return_index=True)
+        undone_ids = ids[kind[newest_first[first]] == UNDO]
+        undone = np.isin(marker_ids, undone_ids)
+
+    # notes go to the marker with their ID
+    notes = [""] * len(markers)
+    note_rows = np.flatnonzero(kind == NOTE)
+    if len(note_rows):
+        order = np.argsort(marker_ids, kind="stable")
+        pos = np.searchsorted(marker_ids, ref[note_rows], sorter=order)
+        pos = np.clip(pos, 0, max(len(markers) - 1, 0))
+        for row, p in zip(note_rows, pos):
+            if len(markers) and marker_ids[order[p]] == ref[row]:
+                target = order[p]
+                notes[target] = f"{notes[target]}; {table.note[row]}" if notes[target] else table.note[row]
+
+    return {"index": markers, "id": marker_ids, "time": table.time[markers],
+            "name": table.name[markers], "note": np.asarray(notes, dtype=object), "undone": undone}
+
+
+def _resolve_in_order(table):
+    # recordings without IDs: UNDO_X undoes the newest marker still standing,
+    # and NewActivity_<name> etc. belong to the newest such marker without a note
+    rows, notes, undone = [], [], []
+    live, redo = [], []  # positions in rows, newest last
+    note_of = {}  # position of a note row -> position of its parent
+    for i in range(len(table)):
+        kind, name = table.kind[i], table.name[i]
+        if kind in (UNDO, REDO):
+            stack, target_undone = (live, True) if kind == UNDO else (redo, False)
+            for j in range(len(stack) - 1, -1, -1):
+                if table.name[rows[stack[j]]] == name or kind == UNDO:
+                    pos = stack.pop(j)
+                    undone[pos] = target_undone
+                    (redo if kind == UNDO else live).append(pos)
+                    parent = note_of.get(pos)
+                    if parent is not None:  # undoing a note takes it off its marker
+                        notes[parent] = "" if target_undone else table.note[rows[pos]]
+                    break
+        elif kind == NOTE:
+            parent = next((p for p in reversed(live) if table.name[rows[p]] == name
+                           and p not in note_of and not notes[p]), None)
+            rows.append(i)
+            undone.append(parent is not None)  # attached notes aren't events of their own
+            notes.append("" if parent is not None else table.note[i])
+            if parent is not None:
+                notes[parent] = table.note[i]
+                note_of[len(rows) - 1] = parent
+            live.append(len(rows) - 1)
+        elif kind == MARKER:
+            rows.append(i)
+            notes.append("")
+            undone.append(False)
+            live.append(len(rows) - 1)
+    index = np.asarray(rows, dtype=np.int64)
+    keep = np.ones(len(rows), dtype=bool)
+    for pos in note_of:
+        keep[pos] = False  # merged into their parent
+    return {"index": index[keep], "id": table.ref[index][keep], "time": table.time[index][keep],
+            "name": table.name[index][keep], "note": np.asarray(notes, dtype=object)[keep],
+            "undone": np.asarray(undone, dtype=bool)[keep]}
+
+
+def load_times(path, column="LocalTimestamp", chunk_rows=1_000_000):
+    """The time column of a (big) data CSV as a float64 array, memory-mapped from a cache."""
+    cache = f"{path}.{column}.times.npy"
+    if os.path.exists(cache) and os.path.getmtime(cache) >= os.path.getmtime(path):
+        return np.load(cache, mmap_mode="r")
+
+    with open(path, "rb") as f:
+        header = f.readline().decode("utf-8").strip().split(",")
+        if column not in header:
+            raise ValueError(f"{path} has no column '{column}' (columns: {', '.join(header)})")
+        col = header.index(column)
+        # count rows without parsing them
+        rows = 0
+        last = b"\n"
+        for block in iter(lambda: f.read(1 << 24), b""):
+            rows += block.count(b"\n")
+            last = block[-1:]
+        rows += last != b"\n"
+
+    tmp = f"{cache}.{os.getpid()}.tmp"  # sessions sharing a data file may build it at once
+    times = np.lib.format.open_memmap(tmp, mode="w+", dtype=np.float64, shape=(rows,))
+    filled = 0
+    with open(path, encoding="utf-8") as f:
+        f.readline()
+        while True:
+            lines = list(islice(f, chunk_rows))
+            if not lines:
+                break
+            chunk = np.atleast_1d(np.loadtxt(lines, delimiter=",", usecols=col, dtype=np.float64))
+            times[filled:filled + len(chunk)] = chunk
+            filled += len(chunk)
+    times.flush()
+    del times
+    if filled < rows:  # blank lines at the end
+        part = np.array(np.load(tmp, mmap_mode="r")[:filled])
+        with open(tmp, "wb") as f:
+            np.save(f, part)
+    os.replace(tmp, cache)
+    return np.load(cache, mmap_mode="r")
+
+
+def align(event_times, data_times, window=(0.0, 0.0)):
+    """Nearest data row for every event and the rows of [t + window[0], t + window[1]].
+
+    Returns a dict of arrays: nearest_row, nearest_time, gap (seconds from the
+    event to that sample), window_start, window_end (row range, end exclusive)
+    and window_samples. If the data isn't quite in time order the row range is
+    the smallest one holding every sample of the window, plus any stragglers
+    in between.
+    """
+    events = np.asarray(event_times, dtype=np.float64)
+    n = len(data_times)
+    if n == 0:
+        empty = np.full(len(events), -1, dtype=np.int64)
+        return {"nearest_row": empty, "nearest_time": np.full(len(events), np.nan),
+                "gap": np.full(len(events), np.nan), "window_start": empty,
+                "window_end": empty, "window_samples": np.zeros(len(events), dtype=np.int64)}
+
+    # EmotiBit packets can arrive slightly out of order, search through a sort then
+    in_order = bool(np.all(data_times[1:] >= data_times[:-1]))
+    sorter = None if in_order else np.argsort(data_times, kind="stable")
+    ordered = data_times if in_order else data_times[sorter]
+
+    pos = np.searchsorted(ordered, events)
+    before = np.clip(pos - 1, 0, n - 1)
+    after = np.clip(pos, 0, n - 1)
+    use_after = np.abs(ordered[after] - events) < np.abs(events - ordered[before])
+    nearest = np.where(use_after, after, before)
+    nearest_time = ordered[nearest]
+
+    low, high = events + window[0], events + window[1]
+    start = np.searchsorted(ordered, low, side="left")
+    end = np.searchsorted(ordered, high, side="right")
+    samples = end - start
+    if sorter is not None:
+        nearest = sorter[nearest]
+        # rows before the running max reaches low are all earlier than the
+        # window, rows from where the minimum of what's left passes high later
+        start = np.searchsorted(np.maximum.accumulate(data_times), low, side="left")
+        end = np.searchsorted(np.minimum.accumulate(data_times[::-1])[::-1], high, side="right")
+    return {"nearest_row": nearest, "nearest_time": nearest_time, "gap": nearest_time - events,
+            "window_start": start, "window_end": end, "window_samples": samples}
+
+
+def process(marker_path, data_path=None, column="LocalTimestamp", window=(0.0, 0.0),
+            clock_offset=0.0, keep_undone=False):
+    """Resolve (and align) one marker file. Returns a list of row dicts."""
+    out = []
+    data_times = load_times(data_path, column) if data_path else None
+    for table in load_markers(marker_path):
+        events = resolve(table)
+        keep = np.ones(len(events["time"]), dtype=bool) if keep_undone else ~events["undone"]
+        events = {key: values[keep] for key, values in events.items()}
+        times = events["time"] + clock_offset
+        aligned = align(times, data_times, window) if data_times is not None else None
+        for i in range(len(times)):
+            row = {"session": table.session, "id": int(events["id"][i]), "time": f"{times[i]:.6f}",
+                   "name": events["name"][i], "note": events["note"][i],
+                   "undone": int(events["undone"][i])}
+            if aligned is not None:
+                row.update({"nearest_row": int(aligned["nearest_row"][i]),
+                            "nearest_time": f"{aligned['nearest_time'][i]:.6f}",
+                            "gap_ms": f"{aligned['gap'][i] * 1000:.3f}",
+                            "window_start": int(aligned["window_start"][i]),
+                            "window_end": int(aligned["window_end"][i]),
+                            "window_samples": int(aligned["window_samples"][i])})
+            out.append(row)
+    return out
+
+
+def _process(args):
+    return process(*args)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("markers", nargs="+", help=".journal, .xdf or .csv marker files, one per session")
+    parser.add_argument("--data", nargs="+", help="data CSV for each marker file, in the same order")
+    parser.add_argument("--column", default="LocalTimestamp", help="time column of the data CSVs")
+    parser.add_argument("--window", nargs=2, type=float, default=(0.0, 0.0), metavar=("BEFORE", "AFTER"),
+                        help="seconds around each marker to find the data rows of, e.g. -2 5")
+    parser.add_argument("--clock-offset", type=float, default=0.0,
+                        help="seconds to add to marker times to get the data column's clock")
+    parser.add_argument("--keep-undone", action="store_true", help="keep undone markers (undone=1)")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count(), help="sessions processed at once")
+    parser.add_argument("--out", default="events.csv", help="CSV with one row per marker")
+    args = parser.parse_args()
+    if args.data and len(args.data) != len(args.markers):
+        parser.error("give one --data file per marker file")
+
+    work = [(path, args.data[i] if args.data else None, args.column, tuple(args.window),
+             args.clock_offset, args.keep_undone) for i, path in enumerate(args.markers)]
+    if args.jobs > 1 and len(work) > 1:
+        with ProcessPoolExecutor(min(args.jobs, len(work))) as pool:
+            results = list(pool.map(_process, work))
+    else:
+        results = [_process(w) for w in work]
+
+    rows = [row for result in results for row in result]
+    fields = ["session", "id", "time", "name", "note", "undone"]
+    if args.data:
+        fields += ["nearest_row", "nearest_time", "gap_ms", "window_start", "window_end", "window_samples"]
+    with open(args.out, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=fields)
+        writer.writeheader()
+        writer.writerows(rows)
+    print(f"{len(rows)} markers from {len(args.markers)} sessions written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""One long-lived thread that runs all the key decoding and timeouts.
+
+Key presses are handed over from the keyboard hook and every deadline sits
+in a heap, so no Timer thread is made per key and the decoder state is only
+ever touched from this one thread.
+"""
+
+import heapq
+import itertools
+import threading
+from collections import deque
+from time import monotonic
+
+
+class Scheduler:
+    """Runs queued calls and timers in order on a single thread."""
+
+    def __init__(self, clock=monotonic, name="marker-scheduler", log=print):
+        self.clock = clock
+        self.log = log  # where errors in calls are reported
+        self._cond = threading.Condition()
+        self._calls = deque()        # (fn, args) to run as soon as possible
+        self._timers = []            # heap of [when, seq, fn, args]
+        self._seq = itertools.count()
+        self._running = False
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+
+        # how late timers fire compared to when they were due
+        self.timers_fired = 0
+        self.lateness_total = 0.0
+        self.lateness_max = 0.0
+        self.late = None  # optional Histogram that also gets every lateness
+
+    def start(self):
+        self._running = True
+        self._thread.start()
+
+    def stop(self):
+        """Stop the thread once it has run the calls already queued.
+        Timers that aren't due yet are dropped."""
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        if self._thread.is_alive() and self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def call_soon(self, fn, *args):
+        """Run fn(*args) on the scheduler thread, in the order calls arrive."""
+        with self._cond:
+            self._calls.append((fn, args))
+            self._cond.notify()
+
+    def call_at(self, when, fn, *args):
+        """Run fn(*args) once the clock reaches `when`. Returns a timer for cancel()."""
+        timer = [when, next(self._seq), fn, args]
+        with self._cond:
+            heapq.heappush(self._timers, timer)
+            self._cond.notify()
+        return timer
+
+    def cancel(self, timer):
+        """Cancel a timer from call_at(). It's dropped when it reaches the top of the heap."""
+        timer[2] = None
+
+    def lateness(self):
+        """Return (timers fired, mean lateness, max lateness) in seconds."""
+        if not self.timers_fired:
+            return 0, 0.0, 0.0
+        return self.timers_fired, self.lateness_total / self.timers_fired, self.lateness_max
+
+    def _next_work(self):
+        """Block until there are calls or due timers. Returns None when stopped
+        and every queued call has run."""
+        with self._cond:
+            while self._running:
+                while self._timers and self._timers[0][2] is None:
+                    heapq.heappop(self._timers)
+                if self._calls:
+                    break
+                if self._timers:
+                    wait = self._timers[0][0] - self.clock()
+                    if wait <= 0:
+                        break
+                    self._cond.wait(wait)
+                else:
+                    self._cond.wait()
+            else:
+                # stopping: finish the calls handed over before stop(), no more timers
+                if not self._calls:
+                    return None
+
+            calls = list(self._calls)
+            self._calls.clear()
+            now = self.clock()
+            due = []
+            while self._running and self._timers and self._timers[0][0] <= now:
+                timer = heapq.heappop(self._timers)
+                if timer[2] is not None:
+                    due.append(timer)
+            return calls, due
+
+    def _run(self):
+        while True:
+            work = self._next_work()
+            if work is None:
+                return
+            calls, due = work
+            # key presses first, they carry their own press time and may
+            # push back a deadline that is about to fire
+            for fn, args in calls:
+                self._call(fn, args)
+            for timer in due:
+                if timer[2] is None:
+                    continue  # cancelled by one of the calls above
+                late = self.clock() - timer[0]
+                self.timers_fired += 1
+                self.lateness_total += late
+                self.lateness_max = max(self.lateness_max, late)
+                if self.late is not None:
+                    self.late.record(late)
+                self._call(timer[2], timer[3])
+
+    def _call(self, fn, args):
+        try:
+            fn(*args)
+        except Exception as e:
+            self.log(f"Error in scheduler: {e}")
@@ -0,0 +1,192 @@
+"""Health numbers for a running marker station.
+
+Telemetry collects latency histograms (key press to outlet push, how long
+markers waited for a possible combo, how late the scheduler's timers ran),
+undo/redo counts and whether each outlet has anyone recording it.
+snapshot() turns it into a dict that the script publishes every few seconds
+as JSON, on a low-rate LSL stream next to the marker stream and on a local
+Unix socket, so a dashboard can spot a stalled or disconnected station while
+the recording is still going:
+
+    nc -U /tmp/DataSyncMarker.telemetry.sock
+"""
+
+import json
+import os
+import socket
+import threading
+from array import array
+from bisect import bisect_left
+
+# bucket upper edges in milliseconds, the last bucket is everything above
+BOUNDS_MS = (0.1, 0.2, 0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+
+class Histogram:
+    """Counts of durations in fixed buckets. Recording is a bisect and three adds.
+    Each histogram should only be recorded into from one thread."""
+
+    __slots__ = ('bounds', 'counts', 'count', 'total', 'max')
+
+    def __init__(self, bounds=BOUNDS_MS):
+        self.bounds = bounds
+        self.counts = array("q", bytes(8 * (len(bounds) + 1)))
+        self.count = 0
+        self.total = 0.0  # ms
+        self.max = 0.0    # ms
+
+    def record(self, seconds):
+        ms = seconds * 1000.0
+        self.counts[bisect_left(self.bounds, ms)] += 1
+        self.count += 1
+        self.total += ms
+        if ms > self.max:
+            self.max = ms
+
+    def percentile(self, p):
+        """Upper edge of the bucket holding the p-th percentile (ms), or the max past the last edge."""
+        if not self.count:
+            return 0.0
+        rank = p / 100.0 * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank and n:
+                return round(min(self.bounds[i], self.max) if i < len(self.bounds) else self.max, 3)
+        return round(self.max, 3)
+
+    def snapshot(self):
+        return {"count": self.count,
+                "mean": round(self.total / self.count, 3) if self.count else 0.0,
+                "p50": self.percentile(50), "p90": self.percentile(90),
+                "p99": self.percentile(99), "max": round(self.max, 3),
+                # [upper edge ms or null for the overflow bucket, count], empty buckets left out
+                "buckets": [[self.bounds[i] if i < len(self.bounds) else None, n]
+                            for i, n in enumerate(self.counts) if n]}
+
+
+class Telemetry:
+    """Everything published about a running station."""
+
+    def __init__(self):
+        self.key_to_push = Histogram()  # key press to outlet push (dispatcher thread)
+        self.decode_wait = Histogram()  # key press to marker decided, mostly combo waits
+        self.timer_late = Histogram()   # scheduler timers firing after their deadline
+        self.undos = 0
+        self.redos = 0
+        self.started = None
+        # outlet name -> [has consumers, LSL time that last changed]
+        self.consumers = {}
+
+    def check_consumers(self, outlets, now):
+        """Look at have_consumers() on every outlet. Returns the names whose state changed."""
+        changed = []
+        for name, outlet in outlets.items():
+            try:
+                has = bool(outlet.have_consumers())
+            except Exception:
+                has = None  # outlet can't tell
+            state = self.consumers.get(name)
+            if state is None or state[0] != has:
+                self.consumers[name] = [has, now]
+                changed.append(name)
+        return changed
+
+    def snapshot(self, engine, scheduler=None, now=0.0, inputs=()):
+        """A JSON-ready dict of the current numbers. inputs are the running input backends.
+        Only reads counters, so it can run on its own thread next to the engine's."""
+        if self.started is None:
+            self.started = now
+        dispatcher = engine.dispatcher
+        snap = {
+            "time": now,
+            "uptime_s": round(now - self.started, 3),
+            "last_marker": engine.last_sample,
+            "markers": len(engine.history),
+            "undone": engine.history.undone_count(),
+            "undos": self.undos,
+            "redos": self.redos,
+            "queue_depth": dispatcher.depth(),
+            "max_queue_depth": dispatcher.max_depth,
+            "pushed": dispatcher.pushed,
+            "dropped": dispatcher.dropped,
+            "held": dispatcher.held(),  # outlet -> markers waiting for a recorder
+            "held_dropped": dispatcher.held_dropped,
+            # held keys the OS repeated, and markers typed faster than their limits
+            "key_repeats": sum(backend.keys.repeats for backend in inputs if hasattr(backend, "keys")),
+            "suppressed": dict(engine.limiter.suppressed),
+            "consumers": {name: {"present": has, "since_s": round(now - since, 3)}
+                          for name, (has, since) in self.consumers.items()},
+            "key_to_push_ms": self.key_to_push.snapshot(),
+            "decode_wait_ms": self.decode_wait.snapshot(),
+            "timer_late_ms": self.timer_late.snapshot(),
+        }
+        if scheduler is not None:
+            snap["timers_fired"] = scheduler.timers_fired
+        return snap
+
+
+class TelemetrySocket:
+    """Unix socket that hands every client the latest snapshot and closes.
+    Only on systems with Unix sockets; start() returns None elsewhere."""
+
+    def __init__(self, path, log=print):
+        self.path = path
+        self.log = log
+        self._latest = b"{}\n"
+        self._sock = None
+        self._thread = threading.Thread(target=self._run, name="marker-telemetry", daemon=True)
+
+    def start(self):
+        if not hasattr(socket, "AF_UNIX"):
+            self.log("Telemetry socket not available on this system")
+            return None
+        try:
+            if os.path.exists(self.path):
+                os.unlink(self.path)  # left over from a run that crashed
+            self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self._sock.bind(self.path)
+            self._sock.listen(4)
+            self._sock.settimeout(0.5)  # so close() is noticed
+        except OSError as e:
+            self.log(f"Telemetry socket {self.path} not started: {e}")
+            self._sock = None
+            return None
+        self._thread.start()
+        return self
+
+    def publish(self, text):
+        self._latest = text.encode("utf-8") + b"\n"
+
+    def close(self):
+        if self._sock is None:
+            return
+        sock, self._sock = self._sock, None
+        sock.close()
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+    def _run(self):
+        while True:
+            sock = self._sock
+            if sock is None:
+                return
+            try:
+                conn, _ = sock.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                return  # closed
+            with conn:
+                conn.settimeout(1.0)
+                try:
+                    conn.sendall(self._latest)
+                except OSError:
+                    pass
+
+
+def encode(snapshot):
+    """One line of compact JSON."""
+    return json.dumps(snapshot, separators=(",", ":"))
@@ -2,312 +2,453 @@
 It uses the pynput library to listen for keyboard events and the pylsl library to send markers.
 INSTALL THESE LIBRARIES:   
 pip install pynput pylsl
+Keys can also come from /dev/input (pip install evdev), the terminal, or other
+programs over a socket - see MARKER_INPUT in marker_inputs.py.
+
+A session launcher can wait for the marker stream to be live before it starts
+recording: --ready-fd N writes "READY" to file descriptor N and closes it,
+--pidfile PATH writes the process id to PATH, both the moment the outlets exist.
+The pidfile is removed when the script exits, also on SIGTERM (which quits
+like ESC does).
 """
 
-from pylsl import StreamInfo, StreamOutlet
-from time import sleep, time
-from pynput import keyboard
-import threading
-from collections import deque
+import time
+STARTED = time.perf_counter()  # time-to-ready is counted from here
+
+import os
+import sys
+from pylsl import StreamInfo, StreamOutlet, local_clock
+from keymap import KeymapWatcher, load_keymap
+# NOTHING ELSE UP HERE - the rest is imported once the outlets are live, so a
+# station is visible to recorders as soon as possible after a reboot
+
+def clean_note(text):
+    """Drop what ALT+key leaves in typed text (escape sequences, control characters)"""
+    import re
+    text = re.sub(r'\x1b.?', '', text)
+    text = ''.join(ch for ch in text if ch.isprintable())
+    return ' '.join(text.split())
+
+def signal_ready(ready_fd=None, pidfile=None):
+    """Tell a launcher the marker stream is live. Returns an error message or None.
+    The pidfile and the ready fd don't depend on each other, the fd is always closed"""
+    errors = []
+    if pidfile:
+        # written whole and renamed, so the launcher never reads half a file
+        tmp = pidfile + ".tmp"
+        try:
+            with open(tmp, "w") as f:
+                f.write(f"{os.getpid()}\n")
+            os.replace(tmp, pidfile)
+        except OSError as e:
+            errors.append(f"pidfile: {e}")
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+    if ready_fd is not None:
+        try:
+            os.write(ready_fd, b"READY\n")
+        except OSError as e:
+            errors.append(f"ready fd: {e}")
+        finally:
+            # closing is what a launcher waiting for EOF sees
+            try:
+                os.close(ready_fd)
+            except OSError:
+                pass
+    if errors:
+        return "Couldn't signal ready: " + "; ".join(errors)
+    return None
+
+def remove_pidfile(pidfile):
+    """Remove the pidfile if it's still ours (safe to call more than once)"""
+    if pidfile:
+        try:
+            with open(pidfile) as f:
+                if f.read().strip() == str(os.getpid()):
+                    os.unlink(pidfile)
+        except OSError:
+            pass
+
+def parse_args(argv):
+    """(ready_fd, pidfile) from the command line. Without flags argparse isn't even imported"""
+    if not argv:
+        return None, None
+    import argparse
+    parser = argparse.ArgumentParser(description="Send LSL markers from the keyboard.")
+    parser.add_argument("--ready-fd", type=int, help="write READY to this file descriptor once the stream is live")
+    parser.add_argument("--pidfile", help="write the process id to this file once the stream is live")
+    args = parser.parse_args(list(argv))
+    return args.ready_fd, args.pidfile
 
-def main():
+def main(argv=()):
     """Send event markers based on keyboard input."""
-    # set up LSL stream that will broadcast my markers
-    info = StreamInfo(name='DataSyncMarker', type='Tags', channel_count=1,
-                      channel_format='string', source_id='12345')
-    outlet = StreamOutlet(info)  # start broadcast!
+    # flags first: --help or a typo must not put marker streams on the network
+    ready_fd, pidfile = parse_args(argv)
+
+    # markers, combos and their timing come from the keymap file - edit it while the
+    # script runs and the new keys are picked up without restarting the outlet
+    keymap_path = os.environ.get("MARKER_KEYMAP",
+                                 os.path.join(os.path.dirname(os.path.abspath(__file__)), "keymap.json"))
+    keymap_poll_interval = 1.0  # seconds between checks for keymap changes
+    try:
+        keymap = load_keymap(keymap_path)
+    except ValueError as e:
+        print(f"Error loading keymap: {e}")
+        return
+    keymap_watcher = KeymapWatcher(keymap_path)
+
+    # set up the LSL streams that will broadcast my markers, one per recording group
+    # (the keymap's "outlets", or just DataSyncMarker) - they all share this keyboard.
+    # Markers sent before LabRecorder / the EmotiBit Oscilloscope has picked the stream
+    # are held and sent (with their real times) once it connects: MARKER_HOLD=0 turns
+    # that off, MARKER_MAX_HELD caps it. MARKER_MAX_BUFFERED is LSL's own outlet buffer
+    # (in hundreds of markers for a marker stream) for recorders that fall behind
+    hold_markers = os.environ.get("MARKER_HOLD", "1") != "0"
+    max_held = int(os.environ.get("MARKER_MAX_HELD", "1024"))
+    max_buffered = int(os.environ.get("MARKER_MAX_BUFFERED", "360"))
+    outlets = {}
+    for label, stream in keymap.outlets.items():
+        info = StreamInfo(name=stream['name'], type=stream['type'], channel_count=1,
+                          channel_format='string', source_id=stream['source_id'])
+        # marker IDs count up across all outlets, verify_markers.py needs to know
+        info.desc().append_child_value("outlets", str(len(keymap.outlets)))
+        outlets[label] = StreamOutlet(info, max_buffered=max_buffered)  # start broadcast!
+    main_stream = next(iter(keymap.outlets.values()))  # side streams and sockets are named after it
+    outlets_ms = (time.perf_counter() - STARTED) * 1000
+
+    ready_error = signal_ready(ready_fd, pidfile)
+    if pidfile:
+        # whatever way the script ends from here (a failed journal, an exception...)
+        import atexit
+        atexit.register(remove_pidfile, pidfile)
+
+    import gc
+    import queue
+    import tempfile
+    import threading
+    from datetime import date
+    from marker_console import ConsoleWriter
+    from marker_dispatch import ALL
+    from marker_engine import MarkerEngine
+    from marker_inputs import InputSink, create_inputs
+    from marker_journal import MarkerJournal
+    from marker_scheduler import Scheduler
+
+    # a launcher stops the script with SIGTERM: quit the same way as ESC,
+    # so the journal is closed and the pidfile removed
+    quit_requested = threading.Event()
+    if threading.current_thread() is threading.main_thread():
+        import signal
+        signal.signal(signal.SIGTERM, lambda signum, frame: quit_requested.set())
+
+    # all output goes through ONE background writer, so a slow terminal or ssh
+    # session never holds up a key press. Everything is also logged to a
+    # rotating file (MARKER_LOG, empty to turn it off)
+    log_path = os.environ.get("MARKER_LOG", f"markers_{date.today().isoformat()}.log")
+    console = ConsoleWriter(log_path=log_path or None).start()
+    if ready_error:
+        console.warn(ready_error)
+
+    # health numbers (latencies, undos, is anyone recording) for the lab dashboard,
+    # sent every MARKER_TELEMETRY_INTERVAL seconds (0 = off) as JSON on a low-rate
+    # <name>_Telemetry stream and on a local socket (MARKER_TELEMETRY_SOCKET, empty = off)
+    telemetry_interval = float(os.environ.get("MARKER_TELEMETRY_INTERVAL", "5"))
+    telemetry = telemetry_outlet = telemetry_socket = None
+    if telemetry_interval > 0:
+        from marker_telemetry import Telemetry, TelemetrySocket, encode
+        telemetry = Telemetry()
+        info = StreamInfo(name=f"{main_stream['name']}_Telemetry", type='Telemetry', channel_count=1,
+                          channel_format='string', source_id=f"{main_stream['source_id']}_telemetry")
+        telemetry_outlet = StreamOutlet(info)
+        socket_path = os.environ.get("MARKER_TELEMETRY_SOCKET", os.path.join(
+            tempfile.gettempdir(), f"{main_stream['name']}.telemetry.sock"))
+        if socket_path:
+            telemetry_socket = TelemetrySocket(socket_path, log=console).start()
 
     getting_input = False  # flag to control when to ignore keys
-    
-    # NEW: Keep track of sent markers for undo functionality
-    marker_history = deque(maxlen=10)  # Keep last 10 markers
-    undo_count = 0  # Track how many undos we've done
-
-    # single letter key markers
-    markers = {
-        'x': ["Test"],
-        't': ["ClassStarted"],
-        'a': ["NewActivity"],
-        'b': ["Books"],
-        'c': ["Clapping"],
-        'd': ["Dancing"],
-        'r': ["RepeatAfterMe"],
-        'p': ["GetPrizes"],
-        'e': ["ClassEnded"],
-        'u': ["UNDO"]  # NEW: Undo key
-    }
-
-    # two letter combinations - press keys quickly!!!
-    two_key_markers = {
-        'si': ["Singing"],
-        'gm': ["GeneralMusic"],
-        'ss': ["SimonSays"],
-        'hs': ["HeadShouldersKneesToes"],
-        'br': ["Breathing"],
-        'qt': ["QuietTime"],
-        'cp': ["ChoicePlay"],
-        'ec': ["EarnCoins"],
-        'cc': ["ClosingCircle"],
-        'im': ["InterestingMoment"],
-        'un': ["UNDO"]  # NEW: Two-key undo combo
-    }
-
-    # to keep track of what keys im typing for the two letter combos
-    key_sequence = ""
-    last_key_time = 0
-    sequence_timeout = 1.0 # if you wait longer than X seconds, it forgets the first key
-    pending_single_key = None  # track pending single key
-    single_key_timer = None    # timer for single key delay
-
-    def send_marker_with_history(marker_data, description=""):
-        """Send marker and add to history for undo functionality"""
-        nonlocal undo_count
-        timestamp = time()
-        outlet.push_sample(marker_data, timestamp)
-        
-        # Add to history (but not if it's an undo marker)
-        if not marker_data[0].startswith("UNDO") and not marker_data[0].startswith("CANCEL"):
-            marker_history.append({
-                'marker': marker_data[0],
-                'timestamp': timestamp,
-                'description': description
-            })
-            undo_count = 0  # Reset undo count when new marker is sent
-        
-        print(f"Sent marker: {marker_data[0]} {description}")
-
-    def handle_undo():
-        """Handle undo functionality"""
-        nonlocal undo_count
-        
-        if len(marker_history) == 0:
-            print("No markers to undo!")
-            return
-            
-        if undo_count >= len(marker_history):
-            print("Already undone all available markers!")
-            return
-            
-        # Get the marker to undo (going backwards from most recent)
-        marker_to_undo = list(marker_history)[-1 - undo_count]
-        undo_count += 1
-        
-        # Send an undo marker that references the original
-        undo_marker = [f"UNDO_{marker_to_undo['marker']}"]
-        timestamp = time()
-        outlet.push_sample(undo_marker, timestamp)
-        
-        print(f"UNDOING: {marker_to_undo['marker']} (sent {undo_marker[0]})")
-        print(f"Undo count: {undo_count}/{len(marker_history)}")
-
-    def show_marker_history():
-        """Show recent marker history"""
-        if not marker_history:
-            print("No marker history available")
-            return
-            
-        print("\n--- Recent Marker History ---")
-        for i, entry in enumerate(reversed(list(marker_history))):
-            status = " (UNDONE)" if i < undo_count else ""
-            print(f"{len(marker_history)-i}: {entry['marker']}{status}")
-        print("-----------------------------\n")
-
-    print("Set up is complete!")
-    print("\nPress keys to send markers (ESC to quit).")
-
-    # keyboard controls
-    print("\nSingle Key Controls:")
-    print("x - test marker")
-    print("t - class started")
-    print("a - new activity")
-    print("b - books")
-    print("c - clapping")
-    print("d - dancing")
-    print("r - repeat after me")
-    print("p - get prizes")
-    print("e - class ended")
-    print("u - UNDO last marker")  # NEW
-    print("\nTwo-Key Combinations:")
-    print("si - singing")
-    print("gm - general music")
-    print("ss - simon says")
-    print("hs - head shoulders knees toes")
-    print("br - breathing")
-    print("qt - quiet time")
-    print("cp - choice play")
-    print("ec - earn coins")
-    print("cc - closing circle")
-    print("im - interesting moment")
-    print("un - UNDO last marker")  # NEW
-    print("\nSpecial Commands:")
-    print("ESC - quit")
+
+    # how far the keyboard hook lags behind the real key press on this machine (seconds),
+    # measure it once per station and set MARKER_INPUT_LATENCY
+    input_latency_offset = float(os.environ.get("MARKER_INPUT_LATENCY", "0"))
+
+    # where keys come from: pynput (default), evdev, stdin and/or socket, e.g. "evdev,socket"
+    try:
+        inputs = create_inputs(
+            os.environ.get("MARKER_INPUT", "pynput"), local_clock, input_latency_offset,
+            socket_address=os.environ.get("MARKER_SOCKET", os.path.join(
+                tempfile.gettempdir(), f"{main_stream['name']}.input.sock")),
+            evdev_device=os.environ.get("MARKER_EVDEV_DEVICE") or None,
+            evdev_grab=os.environ.get("MARKER_EVDEV_GRAB", "0") == "1", log=console)
+    except ValueError as e:
+        console.warn(f"Error with MARKER_INPUT: {e}")
+        console.close()
+        remove_pidfile(pidfile)
+        return
+    if keymap.chord_table and not any(hasattr(backend, "keys") for backend in inputs):
+        # stdin and socket can't tell when a key is let go
+        console.warn("The keymap has chords, but only pynput and evdev input can play them")
+
+    # every pushed marker also goes to a journal on disk, so a crash or restart
+    # during the day picks up the same history and undo state
+    journal_path = os.environ.get("MARKER_JOURNAL", f"markers_{date.today().isoformat()}.journal")
+    reannounce_last = int(os.environ.get("MARKER_REANNOUNCE", "0"))  # re-push last N markers on restart
+    journal = MarkerJournal(journal_path, log=console.warn)  # disk errors show up as warnings
+    recovered = journal.open()
+
+    # decoding, history, undo and sending all live in the engine,
+    # the outlet gets its own thread so a slow push never holds up the keys
+    engine = MarkerEngine(outlets, keymap=keymap, clock=local_clock, journal=journal,
+                          history_size=1024, log=console, telemetry=telemetry,
+                          hold=hold_markers, max_held=max_held)  # markers kept in memory, older ones go to disk
+
+    if recovered:
+        engine.restore(recovered)
+        console(f"Recovered {len(recovered)} markers from {journal_path}")
+        if reannounce_last > 0:
+            engine.reannounce(recovered[-reannounce_last:])
+            console(f"Re-announced the last {min(reannounce_last, len(recovered))} markers")
+
+    # ONE thread owns the engine - everything else hands work to it
+    # all times are on the LSL clock so recorders can line them up with the EmotiBit
+    scheduler = Scheduler(clock=local_clock, log=console)
+    if telemetry:
+        scheduler.late = telemetry.timer_late
+    decoder_timer = None  # deadline for the sequence being typed
+
+    def status_line():
+        # the live line at the bottom of the terminal (console thread, reads only)
+        text = (f"last: {engine.last_sample or '-'} | markers: {len(engine.history)} | "
+                f"undone: {engine.history.undone_count()} | queue: {engine.dispatcher.depth()}")
+        held = engine.dispatcher.held()
+        if held:
+            # markers are going out but nobody is recording them yet
+            text += " | NOT RECORDED: " + ", ".join(f"{name} ({n} held)" for name, n in held.items())
+        return text
+
+    console.status = status_line
 
     def reset_sequence():
-        nonlocal key_sequence, pending_single_key, single_key_timer
-        key_sequence = ""
-        pending_single_key = None
-        if single_key_timer:
-            single_key_timer.cancel()
-            single_key_timer = None
-
-    def get_activity_name():
-        # THIS FUNCTION HANDLES INPUT SAFELY
-        nonlocal getting_input
-        getting_input = True  # TURN OFF keyboard listener
-        reset_sequence()  # CLEAR SEQUENCE IMMEDIATELY BEFORE INPUT
-        print(f"Enter activity name: ", end='', flush=True)
-        activity_name = input()
-        if activity_name.strip():
-            # send a new marker with the activity name
-            marker = [f"NewActivity_{activity_name.strip()}"]
-            send_marker_with_history(marker, f"(activity: {activity_name.strip()})")
-        else:
-            print("No activity name entered.")
-        getting_input = False  # TURN ON keyboard listener again
-        reset_sequence()  # clear any stray keys that might have accumulated
+        # runs on the scheduler thread
+        engine.reset()
+        arm_decoder_timer()
+
+    def arm_decoder_timer():
+        """Schedule the decoder's next deadline, replacing the old one"""
+        nonlocal decoder_timer
+        if decoder_timer:
+            scheduler.cancel(decoder_timer)
+            decoder_timer = None
+        if engine.deadline is not None:
+            decoder_timer = scheduler.call_at(engine.deadline, expire_sequence)
 
-    def get_interesting_moment_note():
-        # THIS FUNCTION HANDLES INPUT SAFELY FOR INTERESTING MOMENTS
+    # ONE console prompt at a time, asked in order by a single prompt thread.
+    # Markers are sent the moment their key is pressed and notes are linked to them
+    # afterwards, so nothing waits on the typing. Hold ALT to send markers mid-prompt.
+    prompts = queue.Queue()
+
+    def prompt_worker():
         nonlocal getting_input
-        getting_input = True  # TURN OFF keyboard listener
-        reset_sequence()  # CLEAR SEQUENCE IMMEDIATELY BEFORE INPUT
-        print(f"What was interesting? ", end='', flush=True)
-        note = input()
-        if note.strip():
-            # send a marker with the note
-            marker = [f"InterestingMoment_{note.strip()}"]
-            send_marker_with_history(marker, f"(note: {note.strip()})")
-        else:
-            # send generic interesting moment if no note provided
-            marker = ["InterestingMoment"]
-            send_marker_with_history(marker, "(no note provided)")
-        getting_input = False  # TURN ON keyboard listener again
-        reset_sequence()  # clear any stray keys that might have accumulated
-
-    def send_pending_single_key():
-        """Send the pending single key marker after delay"""
-        nonlocal pending_single_key
-        if pending_single_key and len(key_sequence) <= 1:
-            key_pressed = pending_single_key
-            if key_pressed == 'a':
-                # SEND MARKER IMMEDIATELY, THEN GET ACTIVITY NAME SAFELY
-                marker = markers[key_pressed]
-                send_marker_with_history(marker, f"(key: {key_pressed})")
-                
-                # USE THREADING TO GET INPUT WITHOUT BLOCKING
-                threading.Thread(target=get_activity_name, daemon=True).start()
-            elif key_pressed == 'u':
-                # Handle undo
-                handle_undo()
+        while True:
+            question, on_answer = prompts.get()
+            getting_input = True  # keys are note text now, not markers
+            scheduler.call_soon(reset_sequence)  # CLEAR SEQUENCE IMMEDIATELY BEFORE INPUT
+            console.pause()  # nothing else printed while the question is up
+            print(question, end='', flush=True)
+            try:
+                answer = clean_note(input())
+            except EOFError:
+                answer = ""
+            console.resume()
+            if prompts.empty():
+                getting_input = False  # TURN ON keyboard listener again
+            scheduler.call_soon(reset_sequence)  # clear any stray keys that might have accumulated
+            on_answer(answer)
+
+    def ask_note(question, marker_id, missing):
+        def on_answer(note):
+            if note:
+                scheduler.call_soon(engine.annotate, marker_id, note)
             else:
-                # regular markers for other keys
-                marker = markers[key_pressed]
-                send_marker_with_history(marker, f"(key: {key_pressed})")
-            reset_sequence()
-
-    def on_key_press(key):
-        nonlocal key_sequence, last_key_time, getting_input, pending_single_key, single_key_timer
-        
-        # IGNORE ALL KEYS WHILE TYPING ACTIVITY NAME
-        if getting_input:
-            return
+                console(missing)
+        prompts.put((question, on_answer))
 
-        try:
-            # Handle F1 for history
-            if key == keyboard.Key.f1:
-                show_marker_history()
+    def ask_undo_id():
+        # ASK WHICH MARKER TO UNDO, BY THE #ID SHOWN WHEN IT WAS SENT
+        def on_answer(answer):
+            answer = answer.lstrip('#')
+            if answer.isdigit():
+                scheduler.call_soon(engine.undo, local_clock(), "", int(answer))
+            else:
+                console("No marker number entered.")
+        prompts.put(("Undo marker #: ", on_answer))
+
+    def check_keymap():
+        """Swap in the keymap if its file changed (scheduler thread)"""
+        new_keymap = None
+        if keymap_watcher.changed():
+            try:
+                new_keymap = load_keymap(keymap_path)
+            except ValueError as e:
+                console.warn(f"Keymap NOT reloaded, still using the old one: {e}")
+            else:
+                if new_keymap.outlets != keymap.outlets:
+                    console.warn("Keymap NOT reloaded: outlets changed, restart the script to add or remove streams")
+                    new_keymap = None
+        if new_keymap:
+            engine.use_keymap(new_keymap)
+            arm_decoder_timer()
+            console(f"\nKeymap reloaded from {keymap_path} (streams still live)\n")
+            console(new_keymap.help)
+        scheduler.call_at(scheduler.clock() + keymap_poll_interval, check_keymap)
+
+    telemetry_stop = threading.Event()
+
+    def publish_telemetry():
+        """Send a telemetry snapshot every telemetry_interval. Its own thread, so
+        have_consumers() and the telemetry push never hold up a key press"""
+        while True:
+            now = local_clock()
+            try:
+                telemetry.check_consumers(outlets, now)
+                text = encode(telemetry.snapshot(engine, scheduler, now, inputs))
+                telemetry_outlet.push_sample([text], now)
+                if telemetry_socket:
+                    telemetry_socket.publish(text)
+            except Exception as e:
+                console.warn(f"Error publishing telemetry: {e}")
+            if telemetry_stop.wait(telemetry_interval):
                 return
 
-            current_time = time()
-
-            # ignore numbers, symbols, etc
-            if hasattr(key, 'char') and key.char and key.char.isalpha():
-                key_pressed = key.char.lower()
-
-                # if wait is too long, times out
-                if current_time - last_key_time > sequence_timeout:
-                    reset_sequence()
-
-                # Cancel any pending single key timer
-                if single_key_timer:
-                    single_key_timer.cancel()
-                    single_key_timer = None
-
-                # add key to the sequence
-                key_sequence += key_pressed
-                last_key_time = current_time
-
-                # check two-key combo first
-                if len(key_sequence) >= 2:
-                    # check if the last two characters match any two-key marker
-                    last_two = key_sequence[-2:]
-                    if last_two in two_key_markers:
-                        if last_two == 'un':
-                            # Handle two-key undo
-                            handle_undo()
-                        elif last_two == 'im':
-                            # Handle interesting moment with note input
-                            threading.Thread(target=get_interesting_moment_note, daemon=True).start()
-                        else:
-                            marker = two_key_markers[last_two]
-                            send_marker_with_history(marker, f"(keys: {last_two})")
-                        reset_sequence()
-                        return
-
-                    # if we have more than 2 characters and no match, reset
-                    if len(key_sequence) > 2:
-                        reset_sequence()
-                        key_sequence = key_pressed
-                        last_key_time = current_time
-
-                # For single key that could be part of a two-key combo
-                if len(key_sequence) == 1 and key_pressed in markers:
-                    # Check if this key could be the start of a two-key combination
-                    could_be_two_key = any(combo.startswith(key_pressed) for combo in two_key_markers.keys())
-                    
-                    if could_be_two_key:
-                        # Wait to see if another key comes
-                        pending_single_key = key_pressed
-                        single_key_timer = threading.Timer(0.3, send_pending_single_key)
-                        single_key_timer.start()
-                    else:
-                        # This key can't be part of a two-key combo, send immediately
-                        if key_pressed == 'a':
-                            marker = markers[key_pressed]
-                            send_marker_with_history(marker, f"(key: {key_pressed})")
-                            threading.Thread(target=get_activity_name, daemon=True).start()
-                        elif key_pressed == 'u':
-                            handle_undo()
-                        else:
-                            marker = markers[key_pressed]
-                            send_marker_with_history(marker, f"(key: {key_pressed})")
-                        reset_sequence()
-
-        except AttributeError:
-            # ESC key
-            if key == keyboard.Key.esc:
-                print("\nExiting...")
-                return False
-        except Exception as e:
-            print(f"Error processing key: {e}")
-
-    def on_key_release(key):
-        # IGNORE KEY RELEASES WHILE TYPING
-        if getting_input:
+    def start_prompt(kind, marker_id):
+        """Ask for a note for a marker that was just sent (scheduler thread)"""
+        if kind == "NewActivity":
+            ask_note(f"Enter activity name for #{marker_id}: ", marker_id, "No activity name entered.")
+        else:
+            ask_note(f"What was interesting at #{marker_id}? ", marker_id, "No note entered.")
+
+    engine.on_prompt = start_prompt
+
+    def decode_key(key_pressed, press_time, route, shift=False, releases=True):
+        """One trie step for a key press (scheduler thread)"""
+        engine.feed(key_pressed, press_time, route, shift, releases)
+        # a marker that could still be the start of a combo waits a bit
+        arm_decoder_timer()
+
+    def release_key(key_released, release_time):
+        """A key let go, decides chords (scheduler thread)"""
+        engine.release(key_released, release_time)
+        arm_decoder_timer()
+
+    def expire_sequence():
+        """Send the pending single key marker after delay, or forget a stale prefix"""
+        nonlocal decoder_timer
+        decoder_timer = None
+        engine.expire(scheduler.clock())
+        arm_decoder_timer()
+
+    # every input backend ends up here, on its own thread
+    def on_key(key_pressed, press_time, shift=False, alt=False, releases=True):
+        # KEYS TYPED INTO A PROMPT ARE TEXT - unless ALT is held for an urgent marker
+        if getting_input and not alt:
             return
-            
-        # exit on ESC key release as well
-        if key == keyboard.Key.esc:
-            return False
+        # SHIFT held sends the marker to every outlet
+        route = ALL if shift and len(outlets) > 1 else None
+        # hand the key over, the scheduler thread does the decoding
+        scheduler.call_soon(decode_key, key_pressed, press_time, route, shift, releases)
+
+    def on_release(key_released, release_time):
+        # only chords care when a key goes up, let releases through during a prompt
+        # so a key held down when it opened isn't left waiting
+        if engine.chords is not None:
+            scheduler.call_soon(release_key, key_released, release_time)
 
-    # keyboard listener setup
+    def on_command(name, press_time=None, alt=False):
+        if getting_input and not alt:
+            return
+        if name == "quit":
+            console("\nExiting...")
+            quit_requested.set()
+        elif name == "history":
+            scheduler.call_soon(engine.show_history)
+        elif name == "undo_id":
+            ask_undo_id()
+        elif name == "undo":
+            scheduler.call_soon(engine.undo, press_time)
+        elif name == "redo":
+            scheduler.call_soon(engine.redo, press_time)
+
+    def on_marker(name, press_time=None, target=None):
+        # named markers from other programs skip the decoder, same outlet(s) and history
+        if target and target != ALL and target not in outlets:
+            console.warn(f"No outlet called {target}, marker not sent: {name}")
+            return
+        scheduler.call_soon(engine.send, [name], "(socket)", press_time, "", target)
+
+    sink = InputSink(on_key, on_command, on_marker, lambda: getting_input, on_release)
+
+    # input setup
+    engine.start()
+    scheduler.start()
+    scheduler.call_soon(check_keymap)
+    telemetry_thread = None
+    if telemetry:
+        telemetry_thread = threading.Thread(target=publish_telemetry, name="marker-telemetry-publish",
+                                            daemon=True)
+        telemetry_thread.start()
+    threading.Thread(target=prompt_worker, name="marker-prompt", daemon=True).start()
+    # everything built so far lives for the whole session, keep the garbage
+    # collector from walking it again every time it runs during a key press
+    gc.freeze()
+    started = []
     try:
-        with keyboard.Listener(on_press=on_key_press, on_release=on_key_release) as listener:
-            listener.join()
+        for backend in inputs:
+            backend.start(sink)
+            started.append(backend)
+        keys_ms = (time.perf_counter() - STARTED) * 1000
+        # the banner comes after the keys work, not before
+        console("Set up is complete!")
+        console(f"Streams live after {outlets_ms:.0f} ms, keys after {keys_ms:.0f} ms")
+        console("\nPress keys to send markers (ESC to quit).")
+
+        # keyboard controls, made from the keymap
+        console()
+        console(keymap.help)
+        while not quit_requested.wait(0.5):
+            pass
     except KeyboardInterrupt:
-        print("\nProgram interrupted by user")
+        console("\nProgram interrupted by user")
     except Exception as e:
-        print(f"Error with keyboard listener: {e}")
+        console.warn(f"Error with input: {e}")
+    finally:
+        for backend in started:
+            backend.stop()
+        # a marker still waiting for a possible combo (e then ESC) goes out too:
+        # stop() runs every queued call first, so the flush comes after the last key
+        scheduler.call_soon(engine.flush)
+        scheduler.stop()
+        fired, mean_late, max_late = scheduler.lateness()
+        if fired:
+            console(f"Timer lateness over {fired} timers: "
+                    f"avg {mean_late * 1000:.2f} ms, max {max_late * 1000:.2f} ms")
+        engine.stop()
+        if telemetry_thread:
+            telemetry_stop.set()
+            telemetry_thread.join()
+        if telemetry_socket:
+            telemetry_socket.close()
+        dispatcher = engine.dispatcher
+        console(f"Pushed {dispatcher.pushed} markers in {dispatcher.chunks} pushes, "
+                f"dropped {dispatcher.dropped}, max queue depth {dispatcher.max_depth}")
+        repeats = sum(backend.keys.repeats for backend in inputs if hasattr(backend, "keys"))
+        if repeats or engine.limiter.total:
+            console(f"Ignored {repeats} key repeats, {engine.limiter.total} markers typed too fast"
+                    + "".join(f", {name}: {n}" for name, n in engine.limiter.suppressed.items()))
+        journal.close()
+        console(f"Journal: {journal.written} markers saved to {journal_path}")
+        console.close()
+        remove_pidfile(pidfile)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main(sys.argv[1:])
\ No newline at end of file
@@ -0,0 +1,194 @@
+"""Play a recorded session back on LSL, or generate marker load, with no one at the keyboard.
+
+    python replay_markers.py markers_2026-10-17.journal            # same timing as it was typed
+    python replay_markers.py session.csv --speed 10                # ten times faster
+    python replay_markers.py markers_2026-10-17.log --fast --loops 100
+    python replay_markers.py --rate 2000 --duration 30 --outlets 4 # synthetic load on 4 streams
+
+Sources are a marker journal, a CSV with timestamp and marker columns (from
+verify_markers.py, or any) or the script's log file (markers_*.log, only
+millisecond times of when each marker was sent). Without a source, --rate
+generates "Load#<n>" markers.
+
+Markers go out on StreamOutlets set up like the script's own (type Tags,
+one string channel), named --name, or --name_1 .. --name_N with --outlets N,
+every marker on every outlet. They are stamped with the time they were
+due, so the recording shows the intended timing; how far each push was
+from that time is the scheduling error in the report. Loops get new IDs
+so verify_markers.py doesn't count them as duplicates.
+"""
+
+import argparse
+import csv
+import re
+import sys
+import time
+from datetime import datetime
+
+from marker_telemetry import Histogram
+
+_ID = re.compile(r"#(\d+)$")
+_LOG_LINE = re.compile(r"^(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d),(\d{3}) \w+ "
+                       r"(?:Sent marker: (\S+).*|Sent note: (.+)|(?:UNDO|REDO): #\d+ .* \(sent (\S+)\))$")
+
+
+def load_events(path):
+    """(time, sample) pairs in the order they were sent, times in seconds."""
+    if path.endswith(".journal"):
+        import marker_journal
+
+        records, _ = marker_journal.read_journal(path)
+        return [(r.timestamp, r.marker if r.kind == marker_journal.OTHER or r.ref < 0
+                 else f"{r.marker}#{r.ref}") for r in records]
+    if path.endswith(".csv"):
+        with open(path, newline="", encoding="utf-8") as f:
+            rows = list(csv.DictReader(f))
+        column = "corrected" if rows and "corrected" in rows[0] else "timestamp"
+        return [(float(r[column]), r["marker"]) for r in rows]
+    events = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            match = _LOG_LINE.match(line.rstrip("\n"))
+            if match:
+                stamp, ms, marker, note, correction = match.groups()
+                t = datetime.strptime(stamp, "%Y-%m-%d %H:%M:%S").timestamp() + int(ms) / 1000
+                events.append((t, marker or note or correction))
+    return events
+
+
+def synthetic(rate, duration, name="Load"):
+    """Markers at a steady rate, for load tests."""
+    return [(i / rate, f"{name}#{i}") for i in range(int(rate * duration))]
+
+
+def renumber(events, loop):
+    """The events again with IDs moved past the ones of earlier loops."""
+    if loop == 0:
+        return events
+    ids = [int(m.group(1)) for _, sample in events for m in [_ID.search(sample)] if m]
+    step = (max(ids) + 1 if ids else 0) * loop
+    return [(t, _ID.sub(lambda m: f"#{int(m.group(1)) + step}", sample)) for t, sample in events]
+
+
+class Replayer:
+    """Pushes events to outlets on time. clock is pylsl.local_clock (or any monotonic seconds).
+
+    speed scales the gaps between markers (2 = twice as fast), speed=None is
+    as fast as possible. It sleeps until shortly before each marker is due
+    and spins the last `spin` seconds, which keeps the error well under a
+    millisecond at the cost of some CPU.
+    """
+
+    def __init__(self, outlets, clock, speed=1.0, spin=0.002, chunk=1):
+        self.outlets = outlets
+        self.clock = clock
+        self.speed = speed
+        self.spin = spin
+        self.chunk = chunk  # as fast as possible: markers per push_chunk
+        self.error = Histogram()  # push time minus due time
+        self.pushed = 0
+
+    def run(self, events, loops=1):
+        """Play events `loops` times. Returns (markers pushed, seconds it took)."""
+        if not events:
+            return 0, 0.0
+        first = events[0][0]
+        span = events[-1][0] - first
+        # leave a gap of the average spacing between loops
+        gap = span / max(len(events) - 1, 1)
+        start = self.clock()
+        for loop in range(loops):
+            batch = renumber(events, loop)
+            if self.speed is None:
+                self._fast(batch)
+                continue
+            offset = start + loop * (span + gap) / self.speed
+            for t, sample in batch:
+                due = offset + (t - first) / self.speed
+                self._wait(due)
+                for outlet in self.outlets:
+                    outlet.push_sample([sample], due)
+                self.error.record(max(self.clock() - due, 0.0))
+                self.pushed += len(self.outlets)
+        return self.pushed, self.clock() - start
+
+    def _fast(self, batch):
+        samples = [sample for _, sample in batch]
+        for i in range(0, len(samples), self.chunk):
+            part = samples[i:i + self.chunk]
+            now = self.clock()
+            for outlet in self.outlets:
+                if len(part) == 1:
+                    outlet.push_sample(part, now)
+                else:
+                    outlet.push_chunk(part, [now] * len(part))
+            self.pushed += len(part) * len(self.outlets)
+
+    def _wait(self, due):
+        remaining = due - self.clock()
+        if remaining > self.spin:
+            time.sleep(remaining - self.spin)
+        while self.clock() < due:
+            pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("source", nargs="?", help=".journal, .csv or .log file to replay")
+    parser.add_argument("--speed", type=float, default=1.0, help="2 = twice as fast as recorded")
+    parser.add_argument("--fast", action="store_true", help="as fast as possible, ignore the timing")
+    parser.add_argument("--chunk", type=int, default=1, help="with --fast, markers per push")
+    parser.add_argument("--loops", type=int, default=1, help="play it this many times")
+    parser.add_argument("--rate", type=float, help="no source: synthetic markers per second")
+    parser.add_argument("--duration", type=float, default=10.0, help="no source: seconds of markers")
+    parser.add_argument("--name", default="DataSyncMarker_replay", help="outlet name")
+    parser.add_argument("--source-id", default="lsl-marker-replay", help="outlet source_id")
+    parser.add_argument("--outlets", type=int, default=1, help="number of outlets to push to")
+    parser.add_argument("--wait", type=float, default=0.0,
+                        help="seconds to wait for a recorder on every outlet before starting")
+    args = parser.parse_args()
+    if not args.source and not args.rate:
+        parser.error("give a file to replay or --rate for synthetic markers")
+
+    from pylsl import StreamInfo, StreamOutlet, local_clock
+
+    events = load_events(args.source) if args.source else synthetic(args.rate, args.duration)
+    if not events:
+        print(f"No markers found in {args.source}")
+        sys.exit(1)
+    outlets = []
+    for i in range(args.outlets):
+        suffix = f"_{i + 1}" if args.outlets > 1 else ""
+        info = StreamInfo(name=args.name + suffix, type="Tags", channel_count=1,
+                          channel_format="string", source_id=args.source_id + suffix)
+        outlets.append(StreamOutlet(info))
+    names = ", ".join(args.name + (f"_{i + 1}" if args.outlets > 1 else "") for i in range(args.outlets))
+    print(f"{len(events)} markers x {args.loops} loops on {names}")
+    if args.wait:
+        until = local_clock() + args.wait
+        while local_clock() < until and not all(o.have_consumers() for o in outlets):
+            time.sleep(0.1)
+        if not all(o.have_consumers() for o in outlets):
+            print("Not every outlet has a recorder, starting anyway")
+
+    replayer = Replayer(outlets, local_clock, None if args.fast else args.speed, chunk=max(args.chunk, 1))
+    try:
+        pushed, elapsed = replayer.run(events, args.loops)
+    except KeyboardInterrupt:
+        pushed, elapsed = replayer.pushed, None
+        print("Stopped")
+    if elapsed:
+        print(f"Pushed {pushed} markers in {elapsed:.3f} s: {pushed / elapsed:.0f} markers/s "
+              f"({pushed / elapsed / len(outlets):.0f} per outlet)")
+    else:
+        print(f"Pushed {pushed} markers")
+    if replayer.error.count:
+        e = replayer.error
+        print(f"scheduling error: mean {e.total / e.count:.3f} ms, p50 <= {e.percentile(50)} ms, "
+              f"p99 <= {e.percentile(99)} ms, max {e.max:.3f} ms")
+    # give recorders a moment to pull the last markers before the outlets go away
+    time.sleep(0.5)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+import os
+import sys
+import threading
+
+import pytest
+
+# the modules are scripts at the top of the repo, not a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from keymap import Keymap  # noqa: E402
+from marker_engine import MarkerEngine  # noqa: E402
+
+
+class StubOutlet:
+    """Keeps every push instead of sending it. `gate` (an Event) makes pushes wait."""
+
+    def __init__(self, gate=None, consumers=True):
+        self.pushes = []  # (samples, timestamps) per push call
+        self.gate = gate
+        self.pushing = threading.Event()
+        self.consumers = consumers
+
+    def push_sample(self, sample, timestamp=0.0):
+        self._wait()
+        self.pushes.append(([sample], [timestamp]))
+
+    def push_chunk(self, samples, timestamps):
+        self._wait()
+        self.pushes.append((list(samples), list(timestamps)))
+
+    def have_consumers(self):
+        return self.consumers
+
+    def _wait(self):
+        self.pushing.set()
+        if self.gate is not None:
+            self.gate.wait(5.0)
+
+    @property
+    def samples(self):
+        """(marker, timestamp) for every sample pushed, in order."""
+        return [(sample if isinstance(sample, str) else sample[0], t)
+                for samples, timestamps in self.pushes for sample, t in zip(samples, timestamps)]
+
+    @property
+    def sent(self):
+        return [marker for marker, _ in self.samples]
+
+
+class FakeClock:
+    """LSL clock that only moves when a test moves it."""
+
+    def __init__(self, now=100.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+# a small version of the markers in new_marker_file.py
+MARKERS = {"x": ["Test"], "b": ["Books"], "c": ["Clapping"], "u": ["UNDO"],
+           "a": ["NewActivity"], "k": ["Kicking"]}
+COMBOS = {"cc": ["ClosingCircle"], "ur": ["REDO"], "si": ["Singing"]}
+
+
+def make_keymap(**kwargs):
+    return Keymap(dict(MARKERS), dict(COMBOS), **kwargs)
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def make_engine(clock):
+    """make_engine(**kwargs) -> (engine, StubOutlet), started and stopped for you."""
+    engines = []
+
+    def make(keymap=None, **kwargs):
+        outlet = StubOutlet()
+        engine = MarkerEngine(outlet, keymap=keymap or make_keymap(), clock=clock,
+                              log=None, block=True, **kwargs)
+        engine.start()
+        engines.append(engine)
+        return engine, outlet
+
+    yield make
+    for engine in engines:
+        if engine.dispatcher._thread.is_alive():
+            engine.stop()
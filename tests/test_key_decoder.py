@@ -0,0 +1,126 @@
+import pytest
+
+from key_decoder import ChordDecoder, ChordTable, KeyDecoder, KeyTrie, chord_mask
+
+MARKERS = {"x": ["Test"], "c": ["Clapping"], "u": ["UNDO"]}
+COMBOS = {"cc": ["ClosingCircle"], "si": ["Singing"], "abc": ["ThreeKeys"], "un": ["UNDO"]}
+
+
+def decoder(**kwargs):
+    return KeyDecoder(KeyTrie(MARKERS, COMBOS), **kwargs)
+
+
+def names(sent):
+    return [sent_marker[1][0] for sent_marker in sent]
+
+
+def test_single_key_is_sent_right_away():
+    d = decoder()
+    assert names(d.feed("x", 1.0)) == ["Test"]
+    assert d.deadline is None
+
+
+def test_key_that_starts_a_combo_waits_for_the_ambiguity_window():
+    d = decoder()
+    assert d.feed("c", 1.0) == []
+    assert d.deadline == 1.3
+    assert d.expire(1.29) == []
+    assert names(d.expire(1.3)) == ["Clapping"]
+    assert d.deadline is None
+
+
+def test_markers_keep_the_time_of_their_first_key():
+    d = decoder()
+    d.feed("c", 1.0)
+    assert [sent_marker[2] for sent_marker in d.expire(1.3)] == [1.0]
+    d.feed("a", 2.0)
+    d.feed("b", 2.1)
+    assert [sent_marker[2] for sent_marker in d.feed("c", 2.2)] == [2.0]
+
+
+def test_combo_inside_the_window():
+    d = decoder()
+    d.feed("c", 1.0)
+    assert names(d.feed("c", 1.2)) == ["ClosingCircle"]
+
+
+def test_three_key_combo():
+    d = decoder()
+    assert d.feed("a", 1.0) == []
+    assert d.feed("b", 1.1) == []
+    assert names(d.feed("c", 1.2)) == ["ThreeKeys"]
+
+
+def test_key_that_breaks_a_combo_sends_the_waiting_marker_first():
+    d = decoder()
+    d.feed("c", 1.0)
+    assert names(d.feed("x", 1.1)) == ["Clapping", "Test"]
+
+
+def test_keys_after_the_longest_marker_are_typed_again():
+    d = decoder()
+    d.feed("u", 1.0)
+    # "u" then "c": UNDO, then c starts over (and waits for "cc")
+    assert names(d.feed("c", 1.1)) == ["UNDO"]
+    assert d.deadline == pytest.approx(1.4)
+
+
+def test_unfinished_prefix_is_forgotten_after_sequence_timeout():
+    d = decoder()
+    d.feed("s", 1.0)
+    assert d.deadline == 2.0
+    assert d.expire(2.0) == []
+    assert d.feed("i", 2.1) == []
+
+
+def test_unmapped_keys_are_ignored():
+    d = decoder()
+    assert d.feed("z", 1.0) == []
+    assert d.deadline is None
+
+
+def test_empty_sequence():
+    with pytest.raises(ValueError):
+        KeyTrie({"": ["Nothing"]})
+
+
+def test_per_key_ambiguity_window():
+    d = decoder(ambiguity_windows={"c": 0.1})
+    d.feed("c", 1.0)
+    assert d.deadline == 1.1
+    assert names(d.feed("c", 1.15)) == ["Clapping"]  # too late for "cc"
+    assert names(d.expire(1.25)) == ["Clapping"]
+
+
+def test_route_follows_the_keys_of_the_marker():
+    d = decoder()
+    d.feed("c", 1.0, route="all")
+    assert [sent_marker[3] for sent_marker in d.feed("x", 1.1)] == ["all", None]
+    d.feed("c", 2.0)
+    assert [sent_marker[3] for sent_marker in d.feed("c", 2.1, route="all")] == ["all"]
+
+
+def test_chord_table_precomputes_partial_chords():
+    table = ChordTable({"a+s+d": "Three", "a+s": "Two", "shift+c": "Loud"})
+    assert chord_mask("s+a") == chord_mask("a+s")
+    assert chord_mask("a+s") in table.partial  # a+s+d is still possible
+    assert table.shift
+    with pytest.raises(ValueError):
+        ChordTable({"a+s": "One", "s+a": "Other"})
+
+
+def test_bigger_chord_wins_and_smaller_fires_on_release():
+    d = ChordDecoder(ChordTable({"a+s+d": "Three", "a+s": "Two"}))
+    assert d.press("a", 1.0) == []
+    assert d.press("s", 1.01) == []
+    assert [m for _, m, _, _ in d.press("d", 1.02)] == ["Three"]
+    assert d.release("a", 1.1) == []  # part of the fired chord
+    d.press("a", 2.0)
+    d.press("s", 2.01)
+    assert [(k, m, t) for k, m, t, _ in d.release("s", 2.1)] == [("a+s", "Two", 2.0)]
+
+
+@pytest.mark.parametrize("keys", ["a+a", "a", "a+1", "shift"])
+def test_invalid_chords(keys):
+    with pytest.raises(ValueError):
+        chord_mask(keys)
@@ -0,0 +1,137 @@
+import json
+import os
+
+import pytest
+
+from keymap import PROMPT, REDO, SEND, UNDO, Keymap, KeymapWatcher, load_keymap
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def write_keymap(path, data):
+    path.write_text(json.dumps(data))
+    return str(path)
+
+
+def test_load_and_compile(tmp_path):
+    path = write_keymap(tmp_path / "keymap.json", {
+        "markers": {"x": "Test", "u": {"marker": "UNDO", "help": "undo"}},
+        "combos": {"cc": {"marker": "ClosingCircle", "help": "closing circle"}},
+        "ambiguity_windows": {"c": 0.2}})
+    keymap = load_keymap(path)
+    assert keymap.markers == {"x": ["Test"], "u": ["UNDO"]}
+    assert keymap.combos == {"cc": ["ClosingCircle"]}
+    assert keymap.ambiguity_windows == {"c": 0.2}
+    assert "u - undo" in keymap.help
+    assert "x - Test" in keymap.help
+
+
+def test_shipped_keymap_loads():
+    keymap = load_keymap(os.path.join(REPO, "keymap.json"), cache=False)
+    assert keymap.markers and keymap.combos
+
+
+@pytest.mark.parametrize("data", [
+    {"markers": {"X": "Test"}},
+    {"markers": {"x": "Test"}, "combos": {"x": "Other"}},
+    {"markers": {"x": {"help": "no marker"}}},
+    {"markers": {}},
+    {"chords": {"x+x": "Twice"}},
+])
+def test_invalid_keymaps(tmp_path, data):
+    with pytest.raises(ValueError):
+        load_keymap(write_keymap(tmp_path / "keymap.json", data))
+
+
+def test_unreadable_keymap(tmp_path):
+    (tmp_path / "keymap.json").write_text("{not json")
+    with pytest.raises(ValueError):
+        load_keymap(str(tmp_path / "keymap.json"))
+    with pytest.raises(ValueError):
+        load_keymap(str(tmp_path / "missing.json"))
+
+
+def test_watcher_reports_each_change_once(tmp_path):
+    path = write_keymap(tmp_path / "keymap.json", {"markers": {"x": "Test"}})
+    watcher = KeymapWatcher(path)
+    assert not watcher.changed()
+    write_keymap(tmp_path / "keymap.json", {"markers": {"x": "Changed", "b": "Books"}})
+    os.utime(path, ns=(1, 1))  # a different mtime even on a coarse clock
+    assert watcher.changed()
+    assert not watcher.changed()
+    os.remove(path)
+    assert not watcher.changed()  # mid-save, keep the old keymap
+
+
+def test_switching_keymaps_sends_the_waiting_marker(tmp_path, make_engine):
+    engine, outlet = make_engine()
+    engine.feed("c", 1.0)
+    engine.use_keymap(load_keymap(write_keymap(tmp_path / "keymap.json", {"markers": {"c": "Other"}})))
+    engine.feed("c", 1.1)
+    engine.stop()
+    assert outlet.sent == ["Clapping#0", "Other#1"]
+
+
+def test_outlets_and_routes(tmp_path):
+    path = write_keymap(tmp_path / "keymap.json", {
+        "markers": {"x": "Test", "k": {"marker": "Kicking", "outlet": "groupB"}},
+        "combos": {"cc": {"marker": "ClosingCircle", "outlet": "all"}},
+        "outlets": {"main": {"name": "M", "source_id": "1"}, "groupB": {"name": "B", "source_id": 2}}})
+    keymap = load_keymap(path)
+    assert keymap.routes == {"k": "groupB", "cc": "all"}
+    assert keymap.outlets["groupB"] == {"name": "B", "type": "Tags", "source_id": "2"}
+    assert "SHIFT+key" in keymap.help
+
+
+@pytest.mark.parametrize("data", [
+    {"markers": {"x": {"marker": "Test", "outlet": "nowhere"}}},
+    {"markers": {"x": "Test"}, "outlets": {"all": {"name": "M", "source_id": "1"}}},
+    {"markers": {"x": "Test"}, "outlets": {"main": {"name": "M"}}},
+    {"markers": {"x": "Test"}, "outlets": {"a": {"name": "M", "source_id": "1"},
+                                           "b": {"name": "M", "source_id": "2"}}},
+])
+def test_invalid_outlets(tmp_path, data):
+    with pytest.raises(ValueError):
+        load_keymap(write_keymap(tmp_path / "keymap.json", data))
+
+
+def test_marker_defs_are_worked_out_once():
+    keymap = Keymap({"x": ["Test"], "u": ["UNDO"], "a": ["NewActivity"]},
+                    {"ur": ["REDO"], "cz": ["CANCEL_Test"]})
+    assert [keymap.defs[k].action for k in ("x", "u", "a", "ur", "cz")] == [SEND, UNDO, PROMPT, REDO, SEND]
+    assert not keymap.defs["cz"].recordable
+    assert keymap.defs["x"].id_prefix == "Test#"
+    assert keymap.defs["ur"].description == "(keys: ur)"
+    with pytest.raises(AttributeError):
+        keymap.defs["x"].name = "Other"
+
+
+def test_limits_from_the_keymap(tmp_path):
+    path = write_keymap(tmp_path / "keymap.json", {
+        "min_interval": 0.2,
+        "markers": {"x": "Test", "b": {"marker": "Books", "rate_limit": {"rate": 1, "burst": 2}},
+                    "u": {"marker": "UNDO", "min_interval": 0}}})
+    keymap = load_keymap(path)
+    assert keymap.limits == {"x": (0.2, 0.0, 1.0), "b": (0.2, 1.0, 2.0)}
+    assert keymap.defs["b"].limited and not keymap.defs["u"].limited
+
+
+def test_chords_from_the_keymap(tmp_path):
+    keymap = load_keymap(write_keymap(tmp_path / "keymap.json", {"chords": {"a+s": "Arguing"}}))
+    assert keymap.chord_table is not None
+    assert keymap.defs["a+s"].name == "Arguing"
+    assert "a+s - Arguing" in keymap.help
+
+
+def test_cache_follows_the_file(tmp_path):
+    path = write_keymap(tmp_path / "keymap.json", {"markers": {"x": "Test"}})
+    assert load_keymap(path).defs["x"].name == "Test"
+    assert os.listdir(tmp_path / "__pycache__")
+    write_keymap(tmp_path / "keymap.json", {"markers": {"x": "Changed", "b": "Books"}})
+    os.utime(path, ns=(1, 1))  # a different mtime even on a coarse clock
+    assert load_keymap(path).defs["x"].name == "Changed"
+    write_keymap(tmp_path / "keymap.json", {"markers": {"X": "Broken"}})
+    with pytest.raises(ValueError):
+        load_keymap(path)
+    with pytest.raises(ValueError):
+        load_keymap(path)  # a broken keymap is never cached
@@ -0,0 +1,64 @@
+import io
+
+from marker_console import ConsoleWriter
+
+
+class Console(io.StringIO):
+    def isatty(self):
+        return False
+
+
+def test_lines_are_written_in_order():
+    stream = Console()
+    console = ConsoleWriter(stream, interval=0.0).start()
+    console.write("Sent marker:", "Test#0")
+    console("Sent marker: Books#1")
+    console.close()
+    assert stream.getvalue() == "Sent marker: Test#0\nSent marker: Books#1\n"
+    assert console.written == 2
+
+
+def test_full_ring_drops_the_oldest_and_says_so():
+    stream = Console()
+    console = ConsoleWriter(stream, capacity=3)  # not started, nothing is written yet
+    for i in range(5):
+        console.write(f"line {i}")
+    assert console.dropped == 2
+    console.close()
+    assert stream.getvalue() == "... 2 messages skipped\nline 2\nline 3\nline 4\n"
+
+
+def test_paused_output_is_held_until_resume():
+    stream = Console()
+    console = ConsoleWriter(stream, interval=0.0).start()
+    console.pause()
+    console.write("while typing a note")
+    console._drain()
+    assert stream.getvalue() == ""
+    console.resume()
+    console.close()
+    assert stream.getvalue() == "while typing a note\n"
+
+
+def test_every_line_goes_to_the_log_file(tmp_path):
+    path = tmp_path / "markers.log"
+    console = ConsoleWriter(Console(), capacity=2, log_path=str(path))
+    console.write("first")
+    console.warn("second")
+    console.close()
+    lines = path.read_text().splitlines()
+    assert [line.split(" ", 2)[2] for line in lines] == ["INFO first", "WARNING second"]
+
+
+def test_status_line_only_on_a_terminal():
+    class Terminal(Console):
+        def isatty(self):
+            return True
+
+    stream = Terminal()
+    console = ConsoleWriter(stream, status=lambda: "3 markers")
+    console.write("Sent marker: Test#0")
+    console._drain()
+    assert stream.getvalue() == "Sent marker: Test#0\n3 markers"
+    console.close()
+    assert stream.getvalue().endswith("\r\x1b[K")
@@ -0,0 +1,158 @@
+import threading
+import time
+
+from conftest import StubOutlet
+from marker_dispatch import ALL, OutletDispatcher
+from marker_telemetry import Histogram
+
+
+def test_markers_are_pushed_with_their_timestamps():
+    outlet = StubOutlet()
+    dispatcher = OutletDispatcher(outlet)
+    dispatcher.start()
+    assert dispatcher.send("Test", 1.0)
+    assert dispatcher.send("Books", 2.0)
+    dispatcher.stop()
+    assert outlet.samples == [("Test", 1.0), ("Books", 2.0)]
+    assert dispatcher.pushed == 2
+
+
+def test_markers_waiting_behind_a_slow_push_go_out_in_one_chunk():
+    gate = threading.Event()
+    outlet = StubOutlet(gate)
+    dispatcher = OutletDispatcher(outlet)
+    dispatcher.start()
+    dispatcher.send("First", 1.0)
+    assert outlet.pushing.wait(2.0)  # the outlet thread is stuck in this push
+    for i in range(5):
+        assert dispatcher.send(f"M{i}", 2.0 + i)  # never waits for the outlet
+    gate.set()
+    dispatcher.stop()
+    assert [len(samples) for samples, _ in outlet.pushes] == [1, 5]
+    assert outlet.pushes[1][1] == [2.0, 3.0, 4.0, 5.0, 6.0]
+    assert dispatcher.chunks == 2
+    assert dispatcher.max_depth == 5
+
+
+def test_full_queue_drops_instead_of_blocking():
+    gate = threading.Event()
+    outlet = StubOutlet(gate)
+    dispatcher = OutletDispatcher(outlet, maxsize=2)
+    dispatcher.start()
+    dispatcher.send("First", 1.0)
+    assert outlet.pushing.wait(2.0)
+    results = [dispatcher.send(f"M{i}", 2.0) for i in range(4)]
+    gate.set()
+    dispatcher.stop()
+    assert results == [True, True, False, False]
+    assert dispatcher.dropped == 2
+    assert outlet.sent == ["First", "M0", "M1"]
+
+
+def test_outlet_error_doesnt_stop_the_thread():
+    class Broken(StubOutlet):
+        def push_sample(self, sample, timestamp=0.0):
+            if sample == ["Bad"]:
+                raise RuntimeError("outlet gone")
+            super().push_sample(sample, timestamp)
+
+    outlet = Broken()
+    errors = []
+    dispatcher = OutletDispatcher(outlet, log=errors.append)
+    dispatcher.start()
+    dispatcher.send("Bad", 1.0)
+    time.sleep(0.05)  # pushed on its own
+    dispatcher.send("Good", 2.0)
+    dispatcher.stop()
+    assert outlet.sent == ["Good"]
+    assert errors == ["Error pushing markers to main: outlet gone"]
+
+
+def test_targets_and_all():
+    outlets = {"main": StubOutlet(), "groupB": StubOutlet()}
+    dispatcher = OutletDispatcher(outlets)
+    dispatcher.start()
+    dispatcher.send("Test", 1.0)
+    dispatcher.send("Kicking", 2.0, target="groupB")
+    dispatcher.send("Both", 3.0, target=ALL)
+    dispatcher.send("Lost", 4.0, target="nowhere")
+    dispatcher.stop()
+    assert outlets["main"].sent == ["Test", "Both"]
+    assert outlets["groupB"].sent == ["Kicking", "Both"]
+    assert dispatcher.pushed == 4
+
+
+def wait_until(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.005)
+    return condition()
+
+
+def test_held_markers_go_out_in_one_chunk_once_recorded():
+    outlet = StubOutlet(consumers=False)
+    # a long poll, so the next marker is what finds the recorder
+    dispatcher = OutletDispatcher(outlet, hold=True, poll_interval=60, log=lambda *a: None)
+    dispatcher.start()
+    dispatcher.send("ClassStarted#0", 1.0)
+    dispatcher.send("Test#1", 2.0)
+    assert wait_until(lambda: dispatcher.held() == {"main": 2})
+    assert outlet.pushes == []
+    outlet.consumers = True
+    dispatcher.send("Books#2", 3.0)
+    dispatcher.stop()
+    assert outlet.pushes == [(["ClassStarted#0", "Test#1", "Books#2"], [1.0, 2.0, 3.0])]
+    assert dispatcher.held() == {}
+
+
+def test_held_markers_dont_count_as_push_latency():
+    outlet = StubOutlet(consumers=False)
+    latency = Histogram()
+    dispatcher = OutletDispatcher(outlet, hold=True, poll_interval=60, log=lambda *a: None,
+                                  clock=lambda: 10.0, latency=latency)
+    dispatcher.start()
+    dispatcher.send("ClassStarted#0", 1.0)
+    assert wait_until(lambda: dispatcher.held() == {"main": 1})
+    outlet.consumers = True
+    dispatcher.send("Test#1", 9.5)
+    dispatcher.stop()
+    assert outlet.sent == ["ClassStarted#0", "Test#1"]
+    assert (latency.count, latency.max) == (1, 500.0)
+
+
+def test_held_markers_are_released_without_new_ones():
+    outlet = StubOutlet(consumers=False)
+    dispatcher = OutletDispatcher(outlet, hold=True, poll_interval=0.01, log=lambda *a: None)
+    dispatcher.start()
+    dispatcher.send("ClassStarted#0", 1.0)
+    assert wait_until(lambda: dispatcher.held() == {"main": 1})
+    outlet.consumers = True
+    assert wait_until(lambda: outlet.sent == ["ClassStarted#0"])
+    dispatcher.stop()
+
+
+def test_held_markers_are_released_while_other_outlets_are_busy():
+    outlets = {"main": StubOutlet(consumers=False), "groupB": StubOutlet()}
+    dispatcher = OutletDispatcher(outlets, hold=True, poll_interval=0.02, log=lambda *a: None)
+    dispatcher.start()
+    dispatcher.send("ClassStarted#0", 1.0)
+    assert wait_until(lambda: dispatcher.held() == {"main": 1})
+    outlets["main"].consumers = True
+    # a steady stream for groupB, so the queue never runs dry
+    deadline = time.monotonic() + 2.0
+    while outlets["main"].sent != ["ClassStarted#0"] and time.monotonic() < deadline:
+        dispatcher.send("Kicking", 2.0, target="groupB")
+        time.sleep(0.002)
+    assert outlets["main"].sent == ["ClassStarted#0"]
+    dispatcher.stop()
+
+
+def test_hold_keeps_the_newest_and_pushes_anyway_on_stop():
+    outlet = StubOutlet(consumers=False)
+    dispatcher = OutletDispatcher(outlet, hold=True, max_held=2, log=lambda *a: None)
+    dispatcher.start()
+    for i in range(4):
+        dispatcher.send(f"M{i}", float(i))
+    dispatcher.stop()
+    assert outlet.samples == [("M2", 2.0), ("M3", 3.0)]
+    assert dispatcher.held_dropped == 2
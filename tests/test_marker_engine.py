@@ -0,0 +1,290 @@
+from conftest import COMBOS, MARKERS, StubOutlet, make_keymap
+from keymap import Keymap
+from marker_dispatch import ALL
+from marker_engine import MarkerEngine
+from marker_journal import MarkerJournal
+
+
+def stop(engine, outlet):
+    engine.stop()
+    return outlet.sent
+
+
+def test_single_key_is_sent_right_away(make_engine):
+    engine, outlet = make_engine()
+    engine.feed("x", 1.0)
+    assert engine.deadline is None
+    assert stop(engine, outlet) == ["Test#0"]
+    assert outlet.samples[0][1] == 1.0  # stamped with the press time
+
+
+def test_key_that_starts_a_combo_waits_for_its_ambiguity_window(make_engine):
+    engine, outlet = make_engine()
+    engine.feed("c", 1.0)
+    assert engine.deadline == 1.3
+    engine.expire(1.29)
+    assert engine.history.next_id == 0
+    engine.expire(1.3)
+    assert stop(engine, outlet) == ["Clapping#0"]
+    assert outlet.samples[0][1] == 1.0  # still the press time, not when it was decided
+
+
+def test_combo_inside_the_window(make_engine):
+    engine, outlet = make_engine()
+    engine.feed_many([("c", 1.0), ("c", 1.2)])
+    assert engine.deadline is None
+    assert stop(engine, outlet) == ["ClosingCircle#0"]
+
+
+def test_key_that_breaks_a_combo_sends_the_waiting_marker(make_engine):
+    engine, outlet = make_engine()
+    engine.feed_many([("c", 1.0), ("x", 1.1)])
+    assert stop(engine, outlet) == ["Clapping#0", "Test#1"]
+
+
+def test_unfinished_prefix_is_forgotten_after_sequence_timeout(make_engine):
+    engine, outlet = make_engine()
+    engine.feed("s", 1.0)  # only the start of "si"
+    assert engine.deadline == 2.0
+    engine.expire(2.0)
+    engine.feed("i", 2.1)
+    assert stop(engine, outlet) == []
+
+
+def test_flush_sends_the_waiting_marker(make_engine):
+    engine, outlet = make_engine()
+    engine.feed("c", 1.0)
+    engine.flush()
+    assert engine.deadline is None
+    assert stop(engine, outlet) == ["Clapping#0"]
+
+
+def test_feed_without_time_uses_the_clock(make_engine, clock):
+    engine, outlet = make_engine()
+    engine.feed_many(["x", "b"])
+    engine.stop()
+    assert outlet.samples == [("Test#0", clock.now), ("Books#1", clock.now)]
+
+
+def test_undo_and_redo(make_engine):
+    engine, outlet = make_engine()
+    engine.feed_many([("x", 1.0), ("b", 1.1), ("u", 1.2)])
+    engine.flush()
+    engine.feed_many([("u", 1.5), ("r", 1.6)])
+    assert stop(engine, outlet) == ["Test#0", "Books#1", "UNDO_Books#1", "REDO_Books#1"]
+    assert engine.history.undone_count() == 0
+
+
+def test_undo_by_id(make_engine):
+    engine, outlet = make_engine()
+    engine.feed_many([("x", 1.0), ("b", 1.1), ("x", 1.2)])
+    engine.undo(2.0, marker_id=1)
+    engine.undo(2.1)
+    engine.undo(2.2)
+    assert stop(engine, outlet)[3:] == ["UNDO_Books#1", "UNDO_Test#2", "UNDO_Test#0"]
+
+
+def test_plain_names_without_marker_ids(make_engine):
+    engine, outlet = make_engine(marker_ids=False)
+    engine.feed("x", 1.0)
+    engine.undo(1.1)
+    assert stop(engine, outlet) == ["Test", "UNDO_Test"]
+
+
+def test_undo_with_nothing_to_undo(make_engine):
+    logged = []
+    engine, outlet = make_engine()
+    engine.log = logged.append
+    engine.undo(1.0)
+    engine.redo(1.0)
+    engine.feed("x", 1.1)
+    engine.undo(1.2, marker_id=7)
+    engine.undo(1.2)
+    engine.undo(1.3)
+    assert stop(engine, outlet) == ["Test#0", "UNDO_Test#0"]
+    assert logged[:2] == ["No markers to undo!", "Nothing to redo!"]
+    assert logged[-1] == "Already undone all markers!"
+
+
+def test_prompted_marker_is_sent_at_once_and_note_linked_by_id(make_engine):
+    prompts = []
+    engine, outlet = make_engine(on_prompt=lambda kind, marker_id: prompts.append((kind, marker_id)))
+    engine.feed("x", 1.0)
+    engine.feed("a", 1.1)
+    assert prompts == [("NewActivity", 1)]
+    engine.annotate(1, "Reading", 3.0)
+    engine.annotate(7, "Nothing", 3.1)
+    assert stop(engine, outlet) == ["Test#0", "NewActivity#1", "NewActivity_Reading#1"]
+    assert outlet.samples[1][1] == 1.1  # the press time, not when the note was typed
+
+
+def test_restore_from_journal(tmp_path, make_engine):
+    path = str(tmp_path / "m.journal")
+    journal = MarkerJournal(path, commit_interval=0.01)
+    journal.open()
+    engine, outlet = make_engine(journal=journal)
+    engine.feed_many([("x", 1.0), ("b", 1.1), ("x", 1.2)])
+    engine.undo(1.3, marker_id=1)
+    engine.stop()
+    journal.close()
+
+    # a restart: same IDs and undo state
+    journal = MarkerJournal(path, commit_interval=0.01)
+    records = journal.open()
+    engine, outlet = make_engine(journal=journal)
+    engine.restore(records)
+    assert engine.history.next_id == 3
+    assert engine.history.get(1).undone
+    engine.redo(2.0)
+    engine.reannounce(records[:1])
+    engine.feed("x", 2.1)
+    assert stop(engine, outlet) == ["REDO_Books#1", "Test#0", "Test#3"]
+    assert outlet.samples[1][1] == 1.0  # re-announced with its original time
+    journal.close()
+
+
+def test_restore_keeps_ids_after_a_lost_record(tmp_path, make_engine):
+    path = str(tmp_path / "m.journal")
+    journal = MarkerJournal(path, commit_interval=0.01, log=lambda message: None)
+    journal.open()
+    engine, outlet = make_engine(journal=journal)
+    engine.feed("x", 1.0)
+    engine.send(["N" * 70000], timestamp=1.1)  # too long to journal
+    engine.feed("b", 1.2)
+    engine.stop()
+    journal.close()
+
+    journal = MarkerJournal(path, commit_interval=0.01)
+    records = journal.open()
+    engine, outlet = make_engine(journal=journal)
+    engine.restore(records)
+    assert engine.history.get(2).marker == "Books"
+    assert engine.history.get(1).marker == "(lost)"
+    engine.undo(2.0)
+    engine.undo(2.1)
+    engine.undo(2.2, marker_id=1)
+    assert stop(engine, outlet) == ["UNDO_Books#2", "UNDO_Test#0"]
+    assert engine.history.undone_count() == 2
+    journal.close()
+
+
+def test_routes_and_all(clock):
+    keymap = Keymap(dict(MARKERS), dict(COMBOS), routes={"k": "groupB"},
+                    outlets={"main": {"name": "M", "source_id": "1"},
+                             "groupB": {"name": "B", "source_id": "2"}})
+    outlets = {"main": StubOutlet(), "groupB": StubOutlet()}
+    engine = MarkerEngine(outlets, keymap=keymap, clock=clock, log=None, block=True)
+    engine.start()
+    engine.feed("k", 1.0)               # keymap sends it to groupB
+    engine.feed("x", 1.1, route=ALL)    # SHIFT+x
+    engine.undo(1.2)                    # goes where the undone marker went
+    engine.undo(1.3)
+    engine.stop()
+    assert outlets["main"].sent == ["Test#1", "UNDO_Test#1"]
+    assert outlets["groupB"].sent == ["Kicking#0", "Test#1", "UNDO_Test#1", "UNDO_Kicking#0"]
+
+
+def test_rate_limited_marker(clock):
+    keymap = Keymap(dict(MARKERS), dict(COMBOS), limits={"x": (0.5, 0.0, 1.0)})
+    outlet = StubOutlet()
+    engine = MarkerEngine(outlet, keymap=keymap, clock=clock, log=None, block=True)
+    engine.start()
+    engine.feed_many([("x", 1.0), ("x", 1.2), ("x", 1.6)])
+    assert stop(engine, outlet) == ["Test#0", "Test#1"]
+    assert engine.limiter.suppressed == {"Test": 1}
+
+
+CHORDS = {"x+b": ["Both"], "shift+c": ["LoudClapping"]}
+
+
+def test_chord_fires_when_all_keys_are_down(make_engine):
+    engine, outlet = make_engine(make_keymap(chords=CHORDS))
+    engine.feed("x", 1.0)
+    assert engine.history.next_id == 0  # could still be x+b
+    engine.feed("b", 1.05)
+    engine.release("x", 1.1)
+    engine.release("b", 1.12)
+    assert stop(engine, outlet) == ["Both#0"]
+    assert outlet.samples[0][1] == 1.0
+
+
+def test_chord_key_let_go_alone_is_a_normal_press(make_engine):
+    engine, outlet = make_engine(make_keymap(chords=CHORDS))
+    engine.feed("x", 1.0)
+    engine.release("x", 1.08)
+    assert stop(engine, outlet) == ["Test#0"]
+    assert outlet.samples[0][1] == 1.0
+
+
+def test_fast_typing_is_not_a_chord(make_engine):
+    engine, outlet = make_engine(make_keymap(chords=CHORDS))
+    engine.feed("x", 1.0)
+    engine.feed("k", 1.05)  # x still down, but k isn't in a chord with it
+    engine.release("x", 1.1)
+    assert stop(engine, outlet) == ["Test#0", "Kicking#1"]
+
+
+def test_shift_chord_fires_on_press(make_engine):
+    engine, outlet = make_engine(make_keymap(chords=CHORDS))
+    engine.feed("c", 1.0, route=ALL, shift=True)
+    engine.feed("k", 1.1, route=ALL, shift=True)  # no shift+k chord, so it still goes to all
+    assert stop(engine, outlet) == ["LoudClapping#0", "Kicking#1"]
+    assert engine.history.get(0).target is None
+    assert engine.history.get(1).target == ALL
+
+
+def test_chord_key_never_let_go_times_out(make_engine):
+    engine, outlet = make_engine(make_keymap(chords=CHORDS))
+    engine.feed("b", 1.0)
+    assert engine.deadline == 2.0
+    engine.expire(2.0)
+    assert stop(engine, outlet) == ["Books#0"]
+
+
+def test_keys_without_release_skip_chords(make_engine):
+    engine, outlet = make_engine(make_keymap(chords=CHORDS))
+    engine.feed("x", 1.0)                   # held on the keyboard
+    engine.feed("b", 1.1, releases=False)   # from the socket, sent now
+    assert engine.history.next_id == 1
+    engine.release("x", 1.2)
+    assert stop(engine, outlet) == ["Books#0", "Test#1"]
+
+
+def test_undo_by_id_then_redo_keeps_undo_on_the_newest(make_engine):
+    engine, outlet = make_engine()
+    engine.feed_many([("x", 1.0), ("b", 1.1), ("x", 1.2), ("b", 1.3), ("x", 1.4)])
+    engine.undo(2.0, marker_id=1)
+    engine.redo(2.1)
+    engine.undo(2.2)
+    assert stop(engine, outlet)[5:] == ["UNDO_Books#1", "REDO_Books#1", "UNDO_Test#4"]
+
+
+def test_restart_keeps_the_outlet_of_every_marker(tmp_path, clock):
+    keymap = make_keymap(routes={"k": "groupB"}, outlets={"main": {"name": "M", "source_id": "1"},
+                                                          "groupB": {"name": "B", "source_id": "2"}})
+
+    def run(journal):
+        outlets = {"main": StubOutlet(), "groupB": StubOutlet()}
+        engine = MarkerEngine(outlets, keymap=keymap, clock=clock, journal=journal, log=None, block=True)
+        engine.start()
+        return engine, outlets
+
+    path = str(tmp_path / "m.journal")
+    journal = MarkerJournal(path, commit_interval=0.01)
+    journal.open()
+    engine, outlets = run(journal)
+    engine.feed_many([("x", 1.0), ("k", 1.1)])
+    engine.stop()
+    journal.close()
+
+    journal = MarkerJournal(path, commit_interval=0.01)
+    records = journal.open()
+    engine, outlets = run(journal)
+    engine.restore(records)
+    engine.undo(2.0)
+    engine.reannounce(records[1:2])
+    engine.stop()
+    journal.close()
+    assert outlets["main"].sent == []
+    assert outlets["groupB"].sent == ["UNDO_Kicking#1", "Kicking#1"]
+    assert outlets["groupB"].samples[1][1] == 1.1  # re-announced with its original time
@@ -0,0 +1,54 @@
+from marker_history import MarkerHistory
+
+
+def make_history(count, capacity=1024):
+    history = MarkerHistory(capacity=capacity)
+    for i in range(count):
+        history.append(f"M{i}", float(i))
+    return history
+
+
+def test_undo_takes_newest_first():
+    history = make_history(3)
+    assert [history.undo().id for _ in range(3)] == [2, 1, 0]
+    assert history.undo() is None
+    assert history.undone_count() == 3
+
+
+def test_undo_by_id_is_skipped_by_plain_undo():
+    history = make_history(5)
+    assert history.undo(3).id == 3
+    assert history.undo(3) is None  # already undone
+    assert [history.undo().id for _ in range(4)] == [4, 2, 1, 0]
+
+
+def test_redo_brings_back_most_recent_undo():
+    history = make_history(3)
+    history.undo()
+    history.undo()
+    assert history.redo().id == 1
+    assert history.redo().id == 2
+    assert history.redo() is None
+    assert history.undone_count() == 0
+
+
+def test_undo_after_redo_of_older_marker_takes_newest():
+    history = make_history(10)
+    history.undo(3)
+    assert history.redo().id == 3
+    # the redone marker is older than #9, so #9 is still the one to undo
+    assert history.undo().id == 9
+    assert history.undo().id == 8
+
+
+def test_spilled_markers_read_back(tmp_path):
+    history = MarkerHistory(capacity=4, spill_path=str(tmp_path / "spill"))
+    for i in range(10):
+        history.append(f"M{i}", float(i), f"desc {i}", "groupB" if i % 2 else None)
+    entry = history.get(1)
+    assert (entry.marker, entry.timestamp, entry.description, entry.target) == ("M1", 1.0, "desc 1", "groupB")
+    assert history.get(2).target is None
+    assert history.undo(0).marker == "M0"
+    assert history.get(0).undone
+    assert [e.id for e in history.recent(3)] == [9, 8, 7]
+    history.close()
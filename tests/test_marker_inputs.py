@@ -0,0 +1,105 @@
+import os
+import socket
+import time
+
+import pytest
+
+from marker_inputs import HeldKeys, InputSink, SocketInput, StdinInput, create_inputs
+
+
+class RecordingSink(InputSink):
+    """An InputSink that writes down every call."""
+
+    def __init__(self):
+        self.calls = []
+        super().__init__(key=lambda *a: self.calls.append(("key",) + a),
+                         command=lambda *a: self.calls.append(("command",) + a),
+                         marker=lambda *a: self.calls.append(("marker",) + a),
+                         prompting=lambda: False)
+
+
+def handle(line, now=5.0):
+    sink = RecordingSink()
+    SocketInput("unused", clock=None, log=None).handle(line, now, sink)
+    return sink.calls
+
+
+def test_socket_commands():
+    assert handle("key sI") == [("key", "s", 5.0, False, True, False), ("key", "i", 5.0, True, True, False)]
+    assert handle("marker StimOnset") == [("marker", "StimOnset", 5.0, None)]
+    assert handle("marker StimOnset groupB") == [("marker", "StimOnset", 5.0, "groupB")]
+    assert handle("UNDO") == [("command", "undo", 5.0, True)]
+    assert handle("redo") == [("command", "redo", 5.0, True)]
+    assert handle("   ") == []
+
+
+def test_socket_command_with_sender_time():
+    assert handle("marker StimOnset @1234.5") == [("marker", "StimOnset", 1234.5, None)]
+    assert handle("key x @2.25") == [("key", "x", 2.25, False, True, False)]
+
+
+@pytest.mark.parametrize("line", ["key", "key x1", "marker", "marker a b c", "undo 3",
+                                  "jump", "marker StimOnset @soon", "marker StimOnset @nan",
+                                  "key x @inf", "undo @-inf"])
+def test_bad_socket_commands(line):
+    with pytest.raises(ValueError):
+        handle(line)
+
+
+@pytest.mark.skipif(not hasattr(socket, "AF_UNIX"), reason="needs Unix sockets")
+def test_socket_backend_receives_datagrams(tmp_path):
+    path = str(tmp_path / "m.sock")
+    sink = RecordingSink()
+    backend = SocketInput(path, clock=lambda: 7.0, log=lambda *a: None)
+    backend.start(sink)
+    with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as client:
+        client.sendto(b"marker StimOnset\nnonsense\nundo @6.5", path)
+    deadline = time.monotonic() + 2.0
+    while len(sink.calls) < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    backend.stop()
+    assert sink.calls == [("marker", "StimOnset", 7.0, None), ("command", "undo", 6.5, True)]
+
+
+def test_create_inputs():
+    backends = create_inputs("stdin, socket", clock=None, socket_address="udp:127.0.0.1:0")
+    assert [type(b).__name__ for b in backends] == ["StdinInput", "SocketInput"]
+    with pytest.raises(ValueError):
+        create_inputs("keyboard", clock=None)
+    with pytest.raises(ValueError):
+        create_inputs(" , ", clock=None)
+
+
+def test_auto_repeat_of_a_held_key_is_dropped():
+    keys = HeldKeys(stale=1.0)
+    assert keys.press("x", 1.0)
+    assert not keys.press("x", 1.5)   # OS repeat, never let go
+    assert not keys.press("x", 1.53)
+    keys.release("x")
+    assert keys.press("x", 1.6)
+    assert keys.repeats == 2
+
+
+def test_key_with_a_lost_release_counts_as_pressed_again():
+    keys = HeldKeys(stale=1.0)
+    assert keys.press("x", 1.0)
+    assert keys.press("x", 2.5)
+
+
+@pytest.mark.parametrize("typed, call", [
+    (b"X", ("key", "x", 1.0, False, True, False)),  # ALT+X: a capital could be Caps Lock, not SHIFT
+    (b"OP", ("command", "history", 1.0)),
+    (b"[12~", ("command", "undo_id", 1.0)),
+    (b"", ("command", "quit", 1.0)),  # a lone ESC
+])
+def test_stdin_escape_sequences(typed, call):
+    backend = StdinInput(clock=None)
+    read_end, write_end = os.pipe()
+    if typed:
+        os.write(write_end, typed)
+    backend._fd = read_end
+    sink = RecordingSink()
+    backend._escape(sink, 1.0)
+    os.close(write_end)
+    os.close(read_end)
+    assert sink.calls == [call]
@@ -0,0 +1,120 @@
+import os
+import time
+import zlib
+
+import pytest
+
+import marker_journal
+from marker_journal import MARKER, NOTE, OTHER, UNDO, MarkerJournal, read_journal
+
+
+def write_records(path, records):
+    journal = MarkerJournal(str(path), commit_interval=0.01)
+    recovered = journal.open()
+    for record in records:
+        journal.append(*record)
+    journal.close()
+    return recovered, journal
+
+
+def test_records_round_trip(tmp_path):
+    path = tmp_path / "m.journal"
+    write_records(path, [(MARKER, 1.5, "Test", "x", 0), (MARKER, 2.0, "Kicking", "k", 1, "groupB"),
+                         (UNDO, 2.5, "UNDO_Kicking", "u", 1, "groupB"), (OTHER, 3.0, "CANCEL")])
+    records, good = read_journal(str(path))
+    assert good == os.path.getsize(path)
+    assert [(r.seq, r.kind, r.ref, r.marker, r.key, r.target) for r in records] == [
+        (0, MARKER, 0, "Test", "x", ""), (1, MARKER, 1, "Kicking", "k", "groupB"),
+        (2, UNDO, 1, "UNDO_Kicking", "u", "groupB"), (3, OTHER, -1, "CANCEL", "", "")]
+
+
+def test_torn_tail_is_cut_off_and_appending_continues(tmp_path):
+    path = tmp_path / "m.journal"
+    write_records(path, [(MARKER, 1.0, "Test", "x"), (MARKER, 2.0, "Books", "b")])
+    size = os.path.getsize(path)
+    with open(path, "r+b") as f:
+        f.truncate(size - 3)  # power cut in the middle of the second record
+
+    recovered, journal = write_records(path, [(MARKER, 3.0, "Clapping", "c")])
+    assert [r.marker for r in recovered] == ["Test"]
+    assert journal.next_seq == 2
+    records, good = read_journal(str(path))
+    assert [(r.seq, r.marker) for r in records] == [(0, "Test"), (1, "Clapping")]
+    assert good == os.path.getsize(path)
+
+
+def test_corrupt_record_ends_the_good_part(tmp_path):
+    path = tmp_path / "m.journal"
+    write_records(path, [(MARKER, 1.0, "Test", "x"), (MARKER, 2.0, "Books", "b")])
+    data = bytearray(path.read_bytes())
+    data[-2] ^= 0xFF  # flip a byte of the last marker name
+    path.write_bytes(bytes(data))
+    records, _ = read_journal(str(path))
+    assert [r.marker for r in records] == ["Test"]
+
+
+def test_not_a_journal(tmp_path):
+    path = tmp_path / "m.journal"
+    path.write_bytes(b"hello world")
+    with pytest.raises(ValueError):
+        read_journal(str(path))
+
+
+def test_old_layout_is_read_and_upgraded(tmp_path):
+    path = tmp_path / "m.journal"
+    data = marker_journal.MAGIC_V1
+    for seq, name in enumerate(["Test", "Books"]):
+        payload = marker_journal._FIXED_V1.pack(seq, 1.0 + seq, MARKER, seq, len(name), 1) + name.encode() + b"x"
+        data += marker_journal._HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+    path.write_bytes(data)
+
+    records, _ = read_journal(str(path))
+    assert [(r.marker, r.key, r.target) for r in records] == [("Test", "x", ""), ("Books", "x", "")]
+    recovered, _ = write_records(path, [(UNDO, 3.0, "UNDO_Books", "u", 1)])
+    assert recovered == records
+    assert path.read_bytes().startswith(marker_journal.MAGIC)
+    assert [r.marker for r in read_journal(str(path))[0]] == ["Test", "Books", "UNDO_Books"]
+
+
+def test_write_errors_are_reported(tmp_path, monkeypatch):
+    errors = []
+    journal = MarkerJournal(str(tmp_path / "m.journal"), commit_interval=0.01, log=errors.append)
+    journal.open()
+
+    def broken_fsync(fd):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(marker_journal.os, "fsync", broken_fsync)
+    journal.append(MARKER, 1.0, "Test", "x", 0)
+    journal.close()
+    assert errors == ["Error writing marker journal: disk full"]
+    assert journal.written == 0
+
+
+def test_oversized_record_is_skipped_and_reported(tmp_path):
+    path = tmp_path / "m.journal"
+    errors = []
+    journal = MarkerJournal(str(path), commit_interval=0.01, log=errors.append)
+    journal.open()
+    journal.append(MARKER, 1.0, "Test", "x", 0)
+    journal.append(NOTE, 2.0, "Test_" + "n" * 70000, "", 0)
+    journal.append(MARKER, 3.0, "Books", "b", 1)
+    journal.close()
+    assert len(errors) == 1
+    assert [r.marker for r in read_journal(str(path))[0]] == ["Test", "Books"]
+    assert journal.written == 2
+
+
+def test_burst_shares_one_fsync(tmp_path, monkeypatch):
+    fsyncs = []
+    real_fsync = os.fsync
+    monkeypatch.setattr(marker_journal.os, "fsync", lambda fd: (fsyncs.append(fd), real_fsync(fd)))
+    journal = MarkerJournal(str(tmp_path / "m.journal"), commit_interval=0.2)
+    journal.open()
+    fsyncs.clear()  # the header
+    for i in range(20):
+        journal.append(MARKER, float(i), "Test", "x", i)
+        time.sleep(0.001)
+    journal.close()
+    assert len(fsyncs) == 1
+    assert journal.written == 20
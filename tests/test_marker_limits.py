@@ -0,0 +1,33 @@
+import pytest
+
+from keymap import MarkerDef
+from marker_limits import MarkerLimiter, parse_limits
+
+
+def allowed(marker, times):
+    limiter = MarkerLimiter()
+    return [limiter.allow(marker, t) for t in times], limiter
+
+
+def test_min_interval():
+    result, limiter = allowed(MarkerDef("x", "Test", min_interval=0.5), [1.0, 1.2, 1.5, 1.9, 2.1])
+    assert result == [True, False, True, False, True]
+    assert limiter.suppressed == {"Test": 2}
+
+
+def test_rate_limit_allows_a_burst_then_refills():
+    result, limiter = allowed(MarkerDef("x", "Test", rate=2.0, burst=3.0),
+                              [1.0, 1.0, 1.0, 1.0, 1.5, 1.5])
+    assert result == [True, True, True, False, True, False]
+    assert limiter.total == 2
+
+
+def test_parse_limits():
+    defaults = parse_limits({"min_interval": 0.2}, "keymap")
+    assert defaults == (0.2, 0.0, 1.0)
+    assert parse_limits({"rate_limit": {"rate": 2, "burst": 5}}, "x", defaults) == (0.2, 2.0, 5.0)
+    assert parse_limits({"min_interval": 0}, "x", defaults) == (0.0, 0.0, 1.0)
+    for entry in ({"min_interval": "soon"}, {"rate_limit": {"burst": 2}}, {"min_interval": -1},
+                  {"rate_limit": {"rate": 1, "burst": 0}}):
+        with pytest.raises(ValueError):
+            parse_limits(entry, "x")
@@ -0,0 +1,94 @@
+import sys
+import types
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from marker_journal import MARKER, NOTE, UNDO, MarkerJournal  # noqa: E402
+from marker_offline import align, load_markers, load_times, parse_samples, resolve  # noqa: E402
+
+
+def standing(result):
+    return [(int(i), str(name), str(note)) for i, name, note, undone
+            in zip(result["id"], result["name"], result["note"], result["undone"]) if not undone]
+
+
+def test_ids_undo_redo_and_notes():
+    samples = ["Test#0", "Books#1", "UNDO_Books#1", "NewActivity#2", "Clapping#3",
+               "NewActivity_Reading#2", "UNDO_Clapping#3", "REDO_Clapping#3", "UNDO_Test#0"]
+    table = parse_samples("s", np.arange(len(samples), dtype=float), samples)
+    result = resolve(table)
+    assert standing(result) == [(2, "NewActivity", "Reading"), (3, "Clapping", "")]
+    assert list(result["undone"]) == [True, True, False, False]
+    assert list(result["time"]) == [0.0, 1.0, 3.0, 4.0]
+
+
+def test_reannounced_markers_count_once():
+    samples = ["Test#0", "Books#1", "Test#0", "Books#1", "UNDO_Books#1"]
+    result = resolve(parse_samples("s", [1.0, 2.0, 9.0, 9.1, 9.2], samples))
+    assert list(result["id"]) == [0, 1]
+    assert list(result["time"]) == [1.0, 2.0]  # the original push, not the re-announce
+    assert list(result["undone"]) == [False, True]
+
+
+def test_old_recordings_without_ids_undo_newest_standing():
+    samples = ["Test", "Books", "Clapping", "UNDO_Clapping", "UNDO_Books", "REDO_Books",
+               "NewActivity", "NewActivity_Reading"]
+    result = resolve(parse_samples("s", np.arange(len(samples), dtype=float), samples))
+    assert [(name, note) for _, name, note in standing(result)] == [
+        ("Test", ""), ("Books", ""), ("NewActivity", "Reading")]
+
+
+def test_journal_session(tmp_path):
+    path = str(tmp_path / "m.journal")
+    journal = MarkerJournal(path, commit_interval=0.01)
+    journal.open()
+    for record in [(MARKER, 1.0, "Some_Marker", "x", 0), (MARKER, 2.0, "Books", "b", 1),
+                   (NOTE, 2.5, "Some_Marker_hello", "", 0), (UNDO, 3.0, "UNDO_Books", "u", 1)]:
+        journal.append(*record)
+    journal.close()
+    [table] = load_markers(path)
+    assert standing(resolve(table)) == [(0, "Some_Marker", "hello")]
+
+
+def test_xdf_session_reads_only_marker_streams(monkeypatch):
+    def stream(name, kind, fmt, rows):
+        return {"info": {"name": [name], "type": [kind], "channel_format": [fmt]},
+                "time_series": rows, "time_stamps": np.arange(len(rows), dtype=float)}
+
+    pyxdf = types.ModuleType("pyxdf")
+    pyxdf.load_xdf = lambda path: ([
+        stream("DataSyncMarker", "Tags", "string", [["Test#0"], ["Books#1"]]),
+        stream("DataSyncMarker_Telemetry", "Telemetry", "string", [['{"sent": 2}']]),
+        stream("EEG", "EEG", "float32", [[0.5]]),
+    ], {})
+    monkeypatch.setitem(sys.modules, "pyxdf", pyxdf)
+    [table] = load_markers("session.xdf")
+    assert standing(resolve(table)) == [(0, "Test", ""), (1, "Books", "")]
+
+
+def test_align_nearest_and_window():
+    data = np.array([0.0, 1.0, 2.0, 3.0, 4.0])
+    result = align([1.2, 3.9], data, window=(-1.0, 1.0))
+    assert list(result["nearest_row"]) == [1, 4]
+    assert list(result["window_start"]) == [1, 3]
+    assert list(result["window_end"]) == [3, 5]
+
+
+def test_align_out_of_order_data():
+    data = np.array([0.0, 2.0, 1.0, 3.0])
+    result = align([1.1], data, window=(-0.5, 0.5))
+    assert list(result["nearest_row"]) == [2]
+    assert result["window_start"][0] <= 2 < result["window_end"][0]
+
+
+def test_load_times_cache(tmp_path):
+    path = tmp_path / "data.csv"
+    path.write_text("LocalTimestamp,EA\n" + "".join(f"{i * 0.5},{i}\n" for i in range(7)))
+    times = load_times(str(path), chunk_rows=3)
+    assert list(times) == [i * 0.5 for i in range(7)]
+    assert (tmp_path / "data.csv.LocalTimestamp.times.npy").exists()
+    assert list(load_times(str(path))) == list(times)
+    with pytest.raises(ValueError):
+        load_times(str(path), column="Missing")
@@ -0,0 +1,109 @@
+import threading
+import time
+
+from marker_scheduler import Scheduler
+
+
+def started():
+    scheduler = Scheduler()
+    scheduler.start()
+    return scheduler
+
+
+def run_on(scheduler, fn, *args):
+    """Run fn on the scheduler thread and wait for it."""
+    done = threading.Event()
+    result = []
+    scheduler.call_soon(lambda: (result.append(fn(*args)), done.set()))
+    assert done.wait(2.0)
+    return result[0]
+
+
+def test_calls_run_in_order_on_one_thread():
+    scheduler = started()
+    seen = []
+    for i in range(50):
+        scheduler.call_soon(lambda i=i: seen.append((i, threading.current_thread().name)))
+    run_on(scheduler, lambda: None)
+    scheduler.stop()
+    assert [i for i, _ in seen] == list(range(50))
+    assert {name for _, name in seen} == {"marker-scheduler"}
+
+
+def test_timers_fire_in_deadline_order():
+    scheduler = started()
+    fired = []
+    done = threading.Event()
+    now = scheduler.clock()
+    scheduler.call_at(now + 0.03, lambda: (fired.append("late"), done.set()))
+    scheduler.call_at(now + 0.01, fired.append, "early")
+    assert done.wait(2.0)
+    scheduler.stop()
+    assert fired == ["early", "late"]
+    count, mean, worst = scheduler.lateness()
+    assert count == 2
+    assert 0.0 <= mean <= worst
+
+
+def test_cancelled_timer_never_fires():
+    scheduler = started()
+    fired = []
+    timer = scheduler.call_at(scheduler.clock() + 0.02, fired.append, "cancelled")
+    scheduler.cancel(timer)
+    time.sleep(0.05)
+    run_on(scheduler, lambda: None)
+    scheduler.stop()
+    assert fired == []
+    assert scheduler.lateness() == (0, 0.0, 0.0)
+
+
+def test_call_can_cancel_a_timer_that_is_due():
+    scheduler = Scheduler()
+    fired = []
+    timer = scheduler.call_at(scheduler.clock() - 1.0, fired.append, "due")
+    # queued before the thread starts, so both come out of the same wait
+    scheduler.call_soon(scheduler.cancel, timer)
+    scheduler.start()
+    time.sleep(0.02)
+    scheduler.stop()
+    assert fired == []
+
+
+def test_error_in_a_call_doesnt_stop_the_thread():
+    errors = []
+    scheduler = Scheduler(log=errors.append)
+    scheduler.start()
+    scheduler.call_soon(lambda: 1 / 0)
+    assert run_on(scheduler, lambda: "still running") == "still running"
+    scheduler.stop()
+    assert errors == ["Error in scheduler: division by zero"]
+
+
+def test_stop_ends_the_thread():
+    scheduler = started()
+    scheduler.call_at(scheduler.clock() + 60, lambda: None)
+    scheduler.stop()
+    assert not scheduler._thread.is_alive()
+
+
+def test_stop_runs_the_calls_already_queued():
+    scheduler = started()
+    ran = []
+    scheduler.call_soon(time.sleep, 0.05)  # still busy with this one when stop() comes
+    scheduler.call_soon(ran.append, "key")
+    scheduler.call_soon(ran.append, "flush")
+    scheduler.call_at(scheduler.clock() + 60, ran.append, "timer")
+    scheduler.stop()
+    assert ran == ["key", "flush"]
+    assert not scheduler._thread.is_alive()
+
+
+def test_stop_flushes_a_marker_waiting_for_a_combo(make_engine):
+    # what the script does on ESC: the waiting marker is sent before the engine stops
+    engine, outlet = make_engine()
+    scheduler = started()
+    scheduler.call_soon(engine.feed, "c", 1.0)  # could still become "cc"
+    scheduler.call_soon(engine.flush)
+    scheduler.stop()
+    engine.stop()
+    assert outlet.sent == ["Clapping#0"]
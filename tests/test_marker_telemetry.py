@@ -0,0 +1,60 @@
+import json
+import os
+import socket
+
+import pytest
+
+from conftest import StubOutlet
+from marker_telemetry import Histogram, Telemetry, TelemetrySocket, encode
+
+
+def test_histogram_percentiles_and_buckets():
+    histogram = Histogram()
+    for ms in [0.05] * 90 + [3] * 9 + [7000]:
+        histogram.record(ms / 1000)
+    snap = histogram.snapshot()
+    assert snap["count"] == 100
+    assert (snap["p50"], snap["p90"], snap["p99"], snap["max"]) == (0.1, 0.1, 5, 7000)
+    assert snap["buckets"] == [[0.1, 90], [5, 9], [None, 1]]
+
+
+def test_empty_histogram():
+    assert Histogram().snapshot() == {"count": 0, "mean": 0.0, "p50": 0.0, "p90": 0.0,
+                                      "p99": 0.0, "max": 0.0, "buckets": []}
+
+
+def test_consumer_changes_are_reported_once():
+    telemetry = Telemetry()
+    outlets = {"main": StubOutlet(), "groupB": StubOutlet(consumers=False)}
+    assert telemetry.check_consumers(outlets, 1.0) == ["main", "groupB"]
+    assert telemetry.check_consumers(outlets, 2.0) == []
+    outlets["groupB"].consumers = True
+    assert telemetry.check_consumers(outlets, 3.0) == ["groupB"]
+    assert telemetry.consumers == {"main": [True, 1.0], "groupB": [True, 3.0]}
+
+
+def test_engine_snapshot(make_engine, clock):
+    telemetry = Telemetry()
+    engine, outlet = make_engine(telemetry=telemetry)
+    clock.now = 1.2
+    engine.feed("c", 1.0)
+    engine.expire(1.3)
+    engine.undo(1.3)
+    engine.stop()
+    snap = json.loads(encode(telemetry.snapshot(engine, now=clock.now)))
+    assert snap["last_marker"] == "UNDO_Clapping#0"
+    assert (snap["markers"], snap["undone"], snap["undos"], snap["pushed"]) == (1, 1, 1, 2)
+    assert snap["decode_wait_ms"]["count"] == 1
+    assert snap["key_to_push_ms"]["count"] == 2
+
+
+@pytest.mark.skipif(not hasattr(socket, "AF_UNIX"), reason="needs Unix sockets")
+def test_socket_hands_out_the_latest_snapshot(tmp_path):
+    path = str(tmp_path / "t.sock")
+    server = TelemetrySocket(path, log=None).start()
+    server.publish('{"markers":3}')
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(path)
+        assert client.makefile().readline() == '{"markers":3}\n'
+    server.close()
+    assert not os.path.exists(path)
@@ -0,0 +1,83 @@
+import importlib
+import importlib.util
+import os
+import sys
+import types
+
+import pytest
+
+
+@pytest.fixture
+def script(monkeypatch):
+    """new_marker_file, importable without pylsl: the helpers tested here don't use it."""
+    if importlib.util.find_spec("pylsl") is None:
+        pylsl = types.ModuleType("pylsl")
+        pylsl.StreamInfo = pylsl.StreamOutlet = pylsl.local_clock = None
+        monkeypatch.setitem(sys.modules, "pylsl", pylsl)
+    monkeypatch.delitem(sys.modules, "new_marker_file", raising=False)
+    return importlib.import_module("new_marker_file")
+
+
+def test_signal_ready_writes_pidfile_and_ready_fd(script, tmp_path):
+    pidfile = str(tmp_path / "marker.pid")
+    read_end, write_end = os.pipe()
+    assert script.signal_ready(write_end, pidfile) is None
+    assert os.read(read_end, 100) == b"READY\n"
+    assert os.read(read_end, 100) == b""  # closed
+    os.close(read_end)
+    assert (tmp_path / "marker.pid").read_text() == f"{os.getpid()}\n"
+    assert os.listdir(tmp_path) == ["marker.pid"]
+
+    script.remove_pidfile(pidfile)
+    assert not os.path.exists(pidfile)
+    script.remove_pidfile(pidfile)  # already gone is fine
+    script.remove_pidfile(None)
+
+
+def test_signal_ready_reports_errors(script, tmp_path):
+    error = script.signal_ready(None, str(tmp_path / "missing" / "marker.pid"))
+    assert error.startswith("Couldn't signal ready")
+    assert script.signal_ready() is None
+
+
+def test_ready_fd_is_signalled_even_if_the_pidfile_fails(script, tmp_path):
+    pidfile = tmp_path / "marker.pid"
+    pidfile.mkdir()  # can't be replaced by a file
+    read_end, write_end = os.pipe()
+    error = script.signal_ready(write_end, str(pidfile))
+    assert error.startswith("Couldn't signal ready: pidfile:")
+    assert os.read(read_end, 100) == b"READY\n"
+    assert os.read(read_end, 100) == b""  # closed
+    os.close(read_end)
+    assert os.listdir(tmp_path) == ["marker.pid"]  # no marker.pid.tmp left behind
+
+
+def test_ready_fd_is_closed_if_writing_fails(script):
+    read_end, write_end = os.pipe()
+    os.close(read_end)  # the launcher is gone: EPIPE
+    error = script.signal_ready(write_end)
+    assert error.startswith("Couldn't signal ready: ready fd:")
+    with pytest.raises(OSError):
+        os.fstat(write_end)
+
+
+def test_clean_note(script):
+    assert script.clean_note("Read\x1bxing  a book\x07") == "Reading a book"
+
+
+def test_remove_pidfile_leaves_another_process_alone(script, tmp_path):
+    pidfile = tmp_path / "marker.pid"
+    pidfile.write_text(f"{os.getpid() + 1}\n")  # a newer instance took it over
+    script.remove_pidfile(str(pidfile))
+    assert pidfile.exists()
+
+
+def test_parse_args(script):
+    assert script.parse_args(()) == (None, None)
+    assert script.parse_args(["--ready-fd", "3", "--pidfile", "m.pid"]) == (3, "m.pid")
+
+
+def test_parse_args_rejects_typos(script, capsys):
+    with pytest.raises(SystemExit):
+        script.parse_args(["--ready-fdd", "3"])
+    assert "unrecognized arguments" in capsys.readouterr().err
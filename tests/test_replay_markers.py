@@ -0,0 +1,62 @@
+import time
+
+import pytest
+
+from conftest import StubOutlet
+from marker_journal import MARKER, OTHER, UNDO, MarkerJournal
+from replay_markers import Replayer, load_events, renumber, synthetic
+
+
+def test_load_journal(tmp_path):
+    path = str(tmp_path / "m.journal")
+    journal = MarkerJournal(path, commit_interval=0.01)
+    journal.open()
+    for record in [(MARKER, 1.0, "Test", "x", 0), (UNDO, 2.0, "UNDO_Test", "u", 0), (OTHER, 3.0, "CANCEL")]:
+        journal.append(*record)
+    journal.close()
+    assert load_events(path) == [(1.0, "Test#0"), (2.0, "UNDO_Test#0"), (3.0, "CANCEL")]
+
+
+def test_load_csv_prefers_corrected_times(tmp_path):
+    path = tmp_path / "check.csv"
+    path.write_text("received,timestamp,corrected,marker\n5.1,5.0,5.5,Test#0\n")
+    assert load_events(str(path)) == [(5.5, "Test#0")]
+
+
+def test_load_log(tmp_path):
+    path = tmp_path / "markers.log"
+    path.write_text("2026-10-17 10:00:00,250 INFO Sent marker: Test#0 (key: x)\n"
+                    "2026-10-17 10:00:01,000 INFO Sent note: NewActivity_Reading#1\n"
+                    "2026-10-17 10:00:02,500 INFO UNDO: #0 Test (sent UNDO_Test#0)\n"
+                    "2026-10-17 10:00:03,000 INFO Queue: 0 waiting, 0 dropped\n")
+    events = load_events(str(path))
+    assert [sample for _, sample in events] == ["Test#0", "NewActivity_Reading#1", "UNDO_Test#0"]
+    assert events[1][0] - events[0][0] == pytest.approx(0.75)
+
+
+def test_loops_get_new_ids():
+    events = [(0.0, "Test#0"), (1.0, "UNDO_Test#0"), (2.0, "Books#1"), (3.0, "CANCEL")]
+    assert renumber(events, 0) is events
+    assert [sample for _, sample in renumber(events, 2)] == ["Test#4", "UNDO_Test#4", "Books#5", "CANCEL"]
+    assert synthetic(4, 0.5) == [(0.0, "Load#0"), (0.25, "Load#1")]
+
+
+def test_replay_keeps_the_gaps():
+    outlets = [StubOutlet(), StubOutlet()]
+    replayer = Replayer(outlets, time.monotonic, speed=10.0)
+    pushed, elapsed = replayer.run([(5.0, "Test#0"), (5.1, "Books#1"), (5.3, "Clapping#2")])
+    assert pushed == 6
+    assert elapsed >= 0.03
+    times = [t for _, t in outlets[0].samples]
+    assert [round(t - times[0], 6) for t in times] == [0.0, 0.01, 0.03]
+    assert outlets[1].samples == outlets[0].samples
+    assert replayer.error.count == 3
+
+
+def test_fast_replay_in_chunks():
+    outlet = StubOutlet()
+    replayer = Replayer([outlet], time.monotonic, speed=None, chunk=2)
+    pushed, _ = replayer.run(synthetic(100, 0.05), loops=2)
+    assert pushed == 10
+    assert [len(samples) for samples, _ in outlet.pushes] == [2, 2, 1, 2, 2, 1]
+    assert outlet.sent[5:] == ["Load#5", "Load#6", "Load#7", "Load#8", "Load#9"]
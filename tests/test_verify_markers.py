@@ -0,0 +1,118 @@
+import csv
+import struct
+
+import pytest
+
+from verify_markers import CsvOutput, LatencyStats, SequenceChecker, XdfOutput, shared_outlets
+
+
+def check_all(checker, samples):
+    return [checker.check(sample)[1] for sample in samples]
+
+
+def test_gaps_duplicates_and_late():
+    checker = SequenceChecker()
+    assert check_all(checker, ["Test#0", "Books#2", "Test#0", "Clapping#1", "UNDO_Books#2",
+                               "Books_note#2", "CANCEL"]) == [
+        "ok", "gap", "duplicate", "late", "ref", "ref", "no id"]
+    assert (checker.lost, checker.duplicates, checker.late) == (0, 1, 1)
+
+
+def test_lost_marker():
+    checker = SequenceChecker()
+    check_all(checker, ["Test#0", "Test#3"])
+    assert checker.lost == 2
+    assert checker.missing == {1, 2}
+
+
+def test_stream_with_some_of_the_ids():
+    # one outlet of several only sees the IDs routed to it
+    checker = SequenceChecker(gaps=False)
+    assert check_all(checker, ["Test#0", "Books#4", "Books#4", "Test#9"]) == ["ok", "ok", "duplicate", "ok"]
+    assert (checker.lost, checker.duplicates) == (0, 1)
+
+
+class FakeInfo:
+    """Just enough of a pylsl StreamInfo for shared_outlets()."""
+
+    def __init__(self, outlets):
+        self.outlets = outlets
+
+    def desc(self):
+        return self
+
+    def child_value(self, name):
+        return self.outlets if name == "outlets" else ""
+
+
+@pytest.mark.parametrize("value, outlets", [("3", 3), ("1", 1), ("", 1), ("0", 1), ("many", 1)])
+def test_shared_outlets(value, outlets):
+    assert shared_outlets(FakeInfo(value)) == outlets
+
+
+def test_latency_stats():
+    stats = LatencyStats()
+    for seconds in (0.001, 0.002, 0.003):
+        stats.add(seconds)
+    assert stats.mean == pytest.approx(0.002)
+    assert stats.jitter == pytest.approx(0.001)
+    assert stats.hist.count == 3
+
+
+class Info:
+    def name(self):
+        return "DataSyncMarker"
+
+    def type(self):
+        return "Tags"
+
+    def source_id(self):
+        return "12345"
+
+    def hostname(self):
+        return "station<1>"
+
+    def created_at(self):
+        return 10.0
+
+
+ROWS = [(5.01, 5.0, "Test#0", 0, "ok"), (6.02, 6.0, "UNDO_Test#0", 0, "ref")]
+
+
+def test_csv_output(tmp_path):
+    path = tmp_path / "check.csv"
+    output = CsvOutput(str(path), Info())
+    output.samples(ROWS, 0.005)
+    output.close()
+    rows = list(csv.reader(path.open()))
+    assert rows[0][:2] == ["received", "timestamp"]
+    assert rows[1] == ["5.010000", "5.000000", "5.005000", "5.000", "5.000", "Test#0", "0", "ok"]
+
+
+def read_chunks(data):
+    assert data[:4] == b"XDF:"
+    pos, chunks = 4, []
+    while pos < len(data):
+        width = data[pos]
+        length = int.from_bytes(data[pos + 1:pos + 1 + width], "little")
+        pos += 1 + width
+        tag = struct.unpack_from("<H", data, pos)[0]
+        chunks.append((tag, data[pos + 2:pos + length]))
+        pos += length
+    return chunks
+
+
+def test_xdf_output(tmp_path):
+    path = tmp_path / "check.xdf"
+    output = XdfOutput(str(path), Info())
+    output.clock_offset(4.0, 0.005)
+    output.samples(ROWS, 0.005)
+    output.close()
+    chunks = read_chunks(path.read_bytes())
+    assert [tag for tag, _ in chunks] == [1, 2, 4, 3, 6]
+    assert b"<hostname>station&lt;1&gt;</hostname>" in chunks[1][1]
+    assert struct.unpack("<Idd", chunks[2][1]) == (1, 3.995, 0.005)
+    samples = chunks[3][1]
+    assert samples[4:6] == b"\x01\x02"  # two samples
+    assert b"UNDO_Test#0" in samples
+    assert b"<sample_count>2</sample_count>" in chunks[4][1]
@@ -0,0 +1,313 @@
+"""Check what actually arrives downstream of the marker stream.
+
+Run it next to new_marker_file.py (same computer or same network) before a
+session and press a few keys:
+
+    python verify_markers.py                          # DataSyncMarker, report only
+    python verify_markers.py --out check.csv          # every marker as a CSV row
+    python verify_markers.py --out check.xdf          # XDF file that pyxdf can load
+    python verify_markers.py --name DataSyncMarker_B --duration 60
+    python verify_markers.py --no-gaps                # IDs not expected to be consecutive
+
+For every marker it works out the clock offset to the sender (LSL
+time_correction()), the latency from the marker's timestamp to its arrival,
+and checks the "#id" numbers: a missing ID is a lost marker, one that shows
+up twice is a duplicate. Undo/redo/note markers refer back to an earlier ID
+and aren't counted as new ones.
+
+Marker IDs count up across all the outlets of a station, so a stream that
+is one of several only sees some of them. The script says how many outlets
+there are in the stream's description; with more than one, skipped IDs
+aren't counted as lost (duplicates still are). --no-gaps does the same for
+streams that don't say.
+
+The marker timestamp is when the key was pressed, so latency includes any
+wait for a possible combo (up to the keymap's ambiguity window), not just the
+network. The exit code is 1 if anything was lost or duplicated, 2 if the
+stream wasn't found.
+"""
+
+import argparse
+import csv
+import math
+import re
+import struct
+import sys
+
+from marker_telemetry import Histogram
+
+_ID = re.compile(r"#(\d+)$")
+CORRECTIONS = ("UNDO_", "REDO_")
+
+
+class SequenceChecker:
+    """Follows marker IDs and flags lost, duplicate and out of order markers.
+    gaps=False for a stream that only gets some of the IDs: skipped ones aren't lost."""
+
+    def __init__(self, gaps=True):
+        self.gaps = gaps
+        self.names = {}      # id -> marker name, for every marker seen
+        self.expected = None  # next new ID
+        self.missing = set()  # IDs skipped over that haven't shown up (yet)
+        self.lost = 0        # IDs that were skipped over
+        self.duplicates = 0
+        self.late = 0        # skipped IDs that turned up later
+
+    def check(self, sample):
+        """Returns (marker ID or None, 'ok' / 'gap' / 'duplicate' / 'late' / 'ref' / 'no id')."""
+        match = _ID.search(sample)
+        if not match:
+            return None, "no id"  # CANCEL..., or marker_ids switched off
+        marker_id = int(match.group(1))
+        text = sample[:match.start()]
+
+        if text.startswith(CORRECTIONS):
+            return marker_id, "ref"
+        name = self.names.get(marker_id)
+        if name is not None:
+            if text == name:
+                self.duplicates += 1
+                return marker_id, "duplicate"
+            if text.startswith(name + "_"):
+                return marker_id, "ref"  # a note for that marker
+            self.duplicates += 1  # two different markers with one ID
+            return marker_id, "duplicate"
+        if self.expected is not None and marker_id < self.expected and marker_id not in self.missing:
+            # an ID from before we started listening, e.g. a note for an old marker
+            return marker_id, "ref"
+
+        self.names[marker_id] = text
+        status = "ok"
+        if self.gaps and self.expected is not None:
+            if marker_id > self.expected:
+                self.missing.update(range(self.expected, marker_id))
+                self.lost += marker_id - self.expected
+                status = "gap"
+            elif marker_id in self.missing:
+                self.missing.discard(marker_id)
+                self.lost -= 1
+                self.late += 1
+                return marker_id, "late"
+        self.expected = max(self.expected or 0, marker_id + 1)
+        return marker_id, status
+
+
+class LatencyStats:
+    """Running mean / standard deviation (jitter) plus a histogram for percentiles."""
+
+    def __init__(self):
+        self.hist = Histogram()
+        self.n = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+
+    def add(self, seconds):
+        self.hist.record(seconds)
+        self.n += 1
+        delta = seconds - self.mean
+        self.mean += delta / self.n
+        self._m2 += delta * (seconds - self.mean)
+
+    @property
+    def jitter(self):
+        return math.sqrt(self._m2 / (self.n - 1)) if self.n > 1 else 0.0
+
+
+class CsvOutput:
+    """One row per marker, flushed every chunk."""
+
+    def __init__(self, path, info):
+        self._file = open(path, "w", newline="", encoding="utf-8")
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(["received", "timestamp", "corrected", "latency_ms",
+                               "offset_ms", "marker", "id", "check"])
+
+    def samples(self, rows, offset):
+        for received, timestamp, sample, marker_id, status in rows:
+            self._writer.writerow([f"{received:.6f}", f"{timestamp:.6f}", f"{timestamp + offset:.6f}",
+                                   f"{(received - timestamp - offset) * 1000:.3f}",
+                                   f"{offset * 1000:.3f}", sample,
+                                   "" if marker_id is None else marker_id, status])
+        self._file.flush()
+
+    def clock_offset(self, collected, offset):
+        pass  # every row already has its offset
+
+    def close(self):
+        self._file.close()
+
+
+class XdfOutput:
+    """Just enough of the XDF format (https://github.com/sccn/xdf/wiki/Specifications)
+    for one string stream with its clock offsets, the way LabRecorder writes them.
+    Timestamps stay on the sender's clock, pyxdf applies the offsets when loading."""
+
+    FILE_HEADER, STREAM_HEADER, SAMPLES, CLOCK_OFFSET, STREAM_FOOTER = 1, 2, 3, 4, 6
+    STREAM_ID = 1
+
+    def __init__(self, path, info):
+        self._file = open(path, "wb")
+        self._file.write(b"XDF:")
+        self._chunk(self.FILE_HEADER, b'<?xml version="1.0"?><info><version>1.0</version></info>')
+        xml = ("<?xml version=\"1.0\"?><info>"
+               f"<name>{_xml(info.name())}</name><type>{_xml(info.type())}</type>"
+               f"<channel_count>1</channel_count><nominal_srate>0</nominal_srate>"
+               f"<channel_format>string</channel_format>"
+               f"<source_id>{_xml(info.source_id())}</source_id>"
+               f"<hostname>{_xml(info.hostname())}</hostname>"
+               f"<created_at>{info.created_at()}</created_at></info>")
+        self._chunk(self.STREAM_HEADER, struct.pack("<I", self.STREAM_ID) + xml.encode("utf-8"))
+        self.first = self.last = None
+        self.count = 0
+
+    def samples(self, rows, offset):
+        body = [struct.pack("<I", self.STREAM_ID), _varlen(len(rows))]
+        for _, timestamp, sample, _, _ in rows:
+            value = sample.encode("utf-8")
+            body += [b"\x08", struct.pack("<d", timestamp), _varlen(len(value)), value]
+            if self.first is None:
+                self.first = timestamp
+            self.last = timestamp
+        self.count += len(rows)
+        self._chunk(self.SAMPLES, b"".join(body))
+        self._file.flush()
+
+    def clock_offset(self, collected, offset):
+        # collection time on the sender's clock, like LabRecorder
+        self._chunk(self.CLOCK_OFFSET, struct.pack("<Idd", self.STREAM_ID, collected - offset, offset))
+
+    def close(self):
+        xml = ("<?xml version=\"1.0\"?><info>"
+               f"<first_timestamp>{self.first or 0}</first_timestamp>"
+               f"<last_timestamp>{self.last or 0}</last_timestamp>"
+               f"<sample_count>{self.count}</sample_count></info>")
+        self._chunk(self.STREAM_FOOTER, struct.pack("<I", self.STREAM_ID) + xml.encode("utf-8"))
+        self._file.close()
+
+    def _chunk(self, tag, content):
+        self._file.write(_varlen(len(content) + 2) + struct.pack("<H", tag) + content)
+
+
+def _varlen(n):
+    if n < 256:
+        return struct.pack("<BB", 1, n)
+    if n < 2 ** 32:
+        return struct.pack("<BI", 4, n)
+    return struct.pack("<BQ", 8, n)
+
+
+def _xml(text):
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+
+def shared_outlets(info):
+    """How many outlets the station sends its marker IDs over, from the stream description (1 if it doesn't say)."""
+    try:
+        return max(int(info.desc().child_value("outlets") or 1), 1)
+    except ValueError:
+        return 1
+
+
+def verify(name, out=None, duration=None, resolve_timeout=10.0, offset_interval=5.0,
+           source_id=None, gaps=True, log=print):
+    """Listen to the stream and check every marker. Returns the exit code."""
+    from pylsl import StreamInlet, local_clock, resolve_byprop
+
+    prop, value = ("source_id", source_id) if source_id else ("name", name)
+    log(f"Looking for a stream with {prop} {value} ...")
+    streams = resolve_byprop(prop, value, timeout=resolve_timeout)
+    if not streams:
+        log(f"No stream with {prop} {value} found")
+        return 2
+    info = streams[0]
+    # small buffer: if we fall behind we want to know, not keep minutes of markers
+    inlet = StreamInlet(info, max_buflen=30)
+    log(f"Connected to {info.name()} ({info.source_id()}) on {info.hostname()}")
+    # the resolved info has no description, the inlet's full one does
+    outlets = shared_outlets(inlet.info(timeout=5.0))
+    if outlets > 1:
+        log(f"Marker IDs are shared by {outlets} outlets, not counting skipped IDs as lost")
+        gaps = False
+    elif not gaps:
+        log("Not counting skipped IDs as lost")
+
+    output = None
+    if out:
+        output = XdfOutput(out, info) if out.endswith(".xdf") else CsvOutput(out, info)
+    checker = SequenceChecker(gaps)
+    latency = LatencyStats()
+    offsets = []  # (collected, offset) for the summary
+    offset = inlet.time_correction(timeout=5.0)
+    offsets.append((local_clock(), offset))
+    if output:
+        output.clock_offset(*offsets[-1])
+    next_offset = local_clock() + offset_interval
+    stop_at = local_clock() + duration if duration else None
+
+    try:
+        while stop_at is None or local_clock() < stop_at:
+            samples, timestamps = inlet.pull_chunk(timeout=0.2, max_samples=256)
+            now = local_clock()
+            if now >= next_offset:
+                offset = inlet.time_correction(timeout=1.0)
+                offsets.append((now, offset))
+                if output:
+                    output.clock_offset(now, offset)
+                next_offset = now + offset_interval
+            if not samples:
+                continue
+            rows = []
+            for sample, timestamp in zip(samples, timestamps):
+                marker = sample[0]
+                marker_id, status = checker.check(marker)
+                delay = now - (timestamp + offset)
+                latency.add(delay)
+                rows.append((now, timestamp, marker, marker_id, status))
+                note = "" if status in ("ok", "ref", "no id") else f"  <-- {status.upper()}"
+                log(f"{marker:<40} latency {delay * 1000:8.2f} ms{note}")
+            if output:
+                output.samples(rows, offset)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if output:
+            output.close()
+
+    log("")
+    log(f"{latency.n} markers received")
+    if latency.n:
+        h = latency.hist
+        log(f"latency: mean {latency.mean * 1000:.2f} ms, p50 <= {h.percentile(50)} ms, "
+            f"p99 <= {h.percentile(99)} ms, max {h.max:.2f} ms, jitter (sd) {latency.jitter * 1000:.2f} ms")
+    values = [o for _, o in offsets]
+    log(f"clock offset: {values[-1] * 1000:.3f} ms (range {min(values) * 1000:.3f} .. "
+        f"{max(values) * 1000:.3f} ms over {len(values)} measurements)")
+    if gaps:
+        log(f"lost: {checker.lost}, duplicates: {checker.duplicates}, arrived late: {checker.late}")
+    else:
+        log(f"lost: not checked, duplicates: {checker.duplicates}")
+    if checker.missing:
+        log(f"missing IDs: {', '.join(map(str, sorted(checker.missing)[:50]))}")
+    if out:
+        log(f"Saved to {out}")
+    return 1 if checker.lost or checker.duplicates else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--name", default="DataSyncMarker", help="stream name to listen to")
+    parser.add_argument("--source-id", help="pick the stream by source_id instead of name")
+    parser.add_argument("--out", help="write every marker to this .csv or .xdf file")
+    parser.add_argument("--duration", type=float, help="stop after this many seconds (default: Ctrl+C)")
+    parser.add_argument("--timeout", type=float, default=10.0, help="seconds to look for the stream")
+    parser.add_argument("--offset-interval", type=float, default=5.0,
+                        help="seconds between clock offset measurements")
+    parser.add_argument("--no-gaps", action="store_true",
+                        help="don't count skipped IDs as lost (stream gets only some of the markers)")
+    args = parser.parse_args()
+    sys.exit(verify(args.name, args.out, args.duration, args.timeout, args.offset_interval,
+                    args.source_id, not args.no_gaps))
+
+
+if __name__ == "__main__":
+    main()